@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 # Standard python modules
-import time
 import logging
 
 # Custom modules for the drones
@@ -52,27 +51,26 @@ def mission_01():
     my_robomaster = Tello()
     drone = HeadsUpTello(my_robomaster, logging.WARNING)
 
-    # Turn the top LED bright green and show our logo on the matrix display
-    drone.matrix_pattern(huf_logo2, 'b')
+    # Turn the top LED bright green and show our logo on the matrix display,
+    # then slowly dim the top LED without changing the LED matrix. The frames
+    # play in the background, so the mission could keep flying meanwhile.
+    # These colors don't exactly match up to true RGB colors
     r = 0
     g = 200
     b = 50
-    drone.top_led_color(r, g, b)
-
-    # Slowly dim the top LED without changing the LED matrix
-    # The loop runs 100 times with a 0.05 second delay => 5 seconds
-    # These colors don't exactly match up to true RGB colors
-    for i in range(10): 
+    frames = [{'pattern': huf_logo2, 'color': 'b', 'led': (r, g, b), 'duration': 0}]
+    for i in range(10):
         g -= 20
         b -= 5
-        drone.top_led_color(r, g, b)
-        time.sleep(1)
-
-    # Turn off the LED matrix and make the top LED red for two seconds  
-    drone.top_led_color(200, 10, 10)
-    time.sleep(2)
-    drone.matrix_off()
-    drone.top_led_off()
+        frames.append({'led': (r, g, b), 'duration': 1})
+
+    # Turn off the LED matrix and make the top LED red for two seconds
+    frames.append({'led': (200, 10, 10), 'duration': 2})
+    frames.append({'pattern': "0" * 64, 'led': (0, 0, 0)})
+    animation = drone.play_animation(frames)
+
+    # Nothing else to do in this mission, so wait for the display to finish
+    animation.wait()
 
     # Finish the mission
     print(f"Battery: {drone.get_battery()}%")
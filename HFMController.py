@@ -3,14 +3,28 @@
 #High Flyers Drone Controller
 #UPDATED 2/19/2023
 
+import dji_matrix as djim
+from altitude_filter import AltitudeFilter
 import logging
 from djitellopy import Tello
 import time
 import math
+import os
 import logging, logging.config
 from datetime import datetime
-import cv2
-import yolo
+from geofence import Geofence
+import flight_log
+import mission_plan
+import peephole
+from threading import Lock
+from matrix_animation import MatrixAnimation
+from maneuver_queue import ManeuverQueue, body_to_world, home_maneuvers, path_maneuvers, pose_after
+from mission_profiler import MissionProfiler
+from pad_localiser import PadMap, go_mid_arguments, wait_for_fresh_state
+from reserve_monitor import ReserveMonitor, ReturnedHome
+from startup import StartupError, StartupSequence
+from telemetry_index import TelemetryIndex
+from video_settings import VideoSettings
 
 #------------------------- BEGIN HighFlyers CLASS ----------------------------
 now = datetime.now().strftime("%Y%m%d.%H")
@@ -52,6 +66,32 @@ log_settings = {
     },
 }
 
+# cv2 and yolo take seconds to import and most missions never use video, so
+# they are imported in record_video(), the first place that needs them.
+# Logging is configured once per process, not once per HighFlyers object.
+configured_log_mode = None
+
+def configure_logging(log_mode='text'):
+    """
+    Set up the mission logger the first time it is called for a log mode,
+    later calls return immediately.
+    Arguments
+        log_mode: 'text'  synchronous text file + console, see log_settings
+                  'queue' the same text file, written by a background thread
+                  'jsonl' one JSON object per line with numeric fields
+    """
+    global configured_log_mode
+    if configured_log_mode == log_mode:
+        return
+    if log_mode == 'text':
+        flight_log.stop_queue_logging(logname)
+        logging.config.dictConfig(log_settings)
+    else:
+        filename = logfile.replace('.log', '.jsonl') if log_mode == 'jsonl' else logfile
+        flight_log.start_queue_logging(logname, filename, structured=(log_mode == 'jsonl'))
+    configured_log_mode = log_mode
+    return
+
 class HighFlyers():
     """
     An interface from Team "Heads-Up Flight" to control a DJI Tello RoboMaster
@@ -76,30 +116,142 @@ class HighFlyers():
         # to choose one or the other.
         self.drone = drone_baseobject
         self.drone.LOGGER.setLevel(debug_level)
+
+        # Tracks what the LED matrix and top LED show so unchanged frames are
+        # not sent again, see dji_matrix.DisplayState
+        self.display = djim.DisplayState()
         self.params = mission_params
         self.x_distance = 0
         self.y_distance = 0
         self.curr_degrees = 0
-
-        #logging object
-        logging.config.dictConfig(log_settings)
+        self.maneuver_queue = None
+        self.reserve_monitor = None
+        self.returning_home = False
+        self.returned_home = False
+
+        # Fused altitude from every state packet, used by go_to_floor and
+        # go_to_ceiling, see altitude_filter.AltitudeFilter
+        self.altitude_filter = AltitudeFilter()
+        self.drone.add_state_listener(self.altitude_filter.update)
+        # Downward camera pose correction, see start_visual_odometry()
+        self.visual_odometry = None
+        # Known mission pads, see start_pad_localisation()
+        self.pad_map = None
+        # mission_params['geofence'] or ['tether'], checked before every move
+        self.geofence = Geofence.from_params(self.params)
+        # ToF obstacle map, see start_mapping()
+        self.occupancy_grid = None
+        self.map_recorder = None
+        self.map_file = None
+        # Frame and state times of the last recording, see record_video()
+        self.telemetry_index = None
+        # Stream settings of the running recording, see record_video()
+        self.video_settings = None
+
+        #logging object. mission_params['log_mode'] picks how it is written,
+        #see configure_logging(); 'text' is the default
+        configure_logging(self.params.get('log_mode', 'text'))
         self.log = logging.getLogger(logname)
 
+        # mission_params['profile'] = True times every maneuver and SDK call,
+        # see stop_profiling(). Without it nothing is wrapped.
+        self.profiler = None
+        if self.params.get('profile'):
+            self.enable_profiling()
+
+        # mission_params['auto_connect'] = False leaves connecting to
+        # fast_start(), which also warms up video and takes off
+        self.connected = False
+        self.startup = None
+        self.dnn_model = None
+        self.dnn_lock = Lock()
+        if not self.params.get('auto_connect', True):
+            return
+
         try:
             self.drone.connect()
             self.connected = True
         except Exception as excp:
-            print(f"ERROR: could not connect to Trello Drone: {excp}")
-            print(f" => Did you pass in a valid drone base object?")
-            print(f" => Verify that your firewall allows UDP ports 8889 and 8890")
-            print(f"    The Chromebook's firewall reverts to default settings every")
-            print(f"    time that you restart the virtual Linux environment.")
-            print(f" => You may need to connect to the drone with the Trello App.")
+            self.connection_help(excp)
             self.disconnect()
             raise
         return
 
 
+    def connection_help(self, excp):
+        print(f"ERROR: could not connect to Trello Drone: {excp}")
+        print(f" => Did you pass in a valid drone base object?")
+        print(f" => Verify that your firewall allows UDP ports 8889 and 8890")
+        print(f"    The Chromebook's firewall reverts to default settings every")
+        print(f"    time that you restart the virtual Linux environment.")
+        print(f" => You may need to connect to the drone with the Trello App.")
+
+
+    def fast_start(self, takeoff=True, video=False, model=False, timeout=15):
+        """
+        Connect, check the battery and take off while the video stream and
+        the YOLO model warm up on other threads. Takeoff only waits for the
+        handshake, the first state packet and the battery check; video and
+        model are ready later or are picked up by record_video().
+        Use with mission_params['auto_connect'] = False.
+        Arguments
+            takeoff: take off as soon as the drone is ready
+            video:   start the stream and wait for a first frame
+            model:   load the YOLO network
+            timeout: seconds the required stages may take
+        Returns
+            The StartupSequence; its report() shows time-to-airborne by stage
+        """
+        channel = self.drone.get_own_udp_object()
+
+        def wait_for_state():
+            if not channel.wait_for_state(timeout):
+                raise StartupError('Did not receive a state packet from the Tello')
+
+        def check_takeoff_power():
+            battery = self.drone.get_battery()
+            if battery <= self.params['min_takeoff_power']:
+                raise StartupError(f"Battery at {battery}%, takeoff needs more than "
+                                   f"{self.params['min_takeoff_power']}%")
+            return battery
+
+        def start_video():
+            self.drone.streamon()
+            return self.drone.get_frame_read()
+
+        sequence = StartupSequence()
+        sequence.add_stage('handshake', self.drone.connect, wait_for_state=False)
+        sequence.add_stage('state', wait_for_state)
+        sequence.add_stage('battery', check_takeoff_power, after=['state'])
+        if video:
+            sequence.add_stage('video', start_video, after=['handshake'], required=False)
+        if model:
+            sequence.add_stage('model', self.load_dnn_model, required=False)
+        if takeoff:
+            sequence.add_stage('takeoff', self.drone.takeoff, after=['handshake', 'battery'])
+        self.startup = sequence
+
+        try:
+            sequence.run(timeout)
+        except StartupError as excp:
+            if sequence.stages['handshake'].error is not None or not sequence.wait_for('state', 0):
+                self.connection_help(excp)
+            self.log.error("Startup failed:\n%s", sequence.report())
+            raise
+        self.connected = True
+        self.log.info("Startup finished:\n%s", sequence.report())
+        return sequence
+
+
+    def load_dnn_model(self):
+        """ Load the YOLO network once; returns (classifier, layers, labels). """
+        with self.dnn_lock:
+            if self.dnn_model is None:
+                import yolo
+                self.dnn_model = yolo.load_yolo_deep_neural_network()
+        return self.dnn_model
+
+
     def takeoff(self):
         if self.drone.get_battery() <= self.params['min_takeoff_power']:
             print("Error Low Battery")
@@ -113,11 +265,39 @@ class HighFlyers():
 
     def pre_flight_check(self):
         """checks to see if drone is above min operating power, if not, logs error and lands"""
+        if self.should_return_home():
+            self.return_home()
+        if self.returned_home:
+            raise ReturnedHome("Returned home to land with the battery reserve")
         print(f"Current Battery Level: {self.get_battery()}")
         if self.drone.get_battery() <= self.params['min_operating_power']:
             self.log.warning("Battery is below Min Operating Power. Drone will now Land.")
             self.drone.land()
 
+    def start_reserve_monitor(self, battery_model=None, interval=0.5):
+        """
+        Watch the battery against the cost of flying home from the current
+        pose and come home early enough to land with the reserve, see
+        reserve_monitor.ReserveMonitor. Only reads cached telemetry.
+        """
+        if self.reserve_monitor is None:
+            self.reserve_monitor = ReserveMonitor(self, battery_model, interval=interval).start()
+        return self.reserve_monitor
+
+    def should_return_home(self):
+        """ True once the reserve monitor asks for a return and it has not
+        started yet. """
+        return (self.reserve_monitor is not None and not self.returning_home
+                and self.reserve_monitor.return_home.is_set())
+
+    def return_home(self):
+        """ Fly straight home and land, see maneuver_queue.home_maneuvers """
+        self.returning_home = True
+        self.log_event("Returning home to keep the battery reserve", maneuver='return_home')
+        self.fly_sequence(home_maneuvers(self.x_distance, self.y_distance, self.curr_degrees))
+        self.land()
+        self.returned_home = True
+
     def end(self):
         self.end()
 
@@ -141,90 +321,309 @@ class HighFlyers():
 
     def fly_up(self, cm):
         self.pre_flight_check()
+        cm = self.clip_to_fence('up', cm)
+        if cm is None:
+            return
         self.drone.move_up(int(cm))
-        self.log.info(f"Drone succesfully flew up {cm} cm")
+        self.log_event("Drone succesfully flew up %s cm", cm, maneuver='up', cm=cm)
 
     def fly_down(self, cm):
         self.pre_flight_check()
+        cm = self.clip_to_fence('down', cm)
+        if cm is None:
+            return
         self.drone.move_down(int(cm))
-        self.log.info(f"Drone succesfully flew down {cm} cm")
+        self.log_event("Drone succesfully flew down %s cm", cm, maneuver='down', cm=cm)
 
     #Fly forward/Fly Back min distance = 20cm, max distance = 500cm
     def fly_forward(self, cm, home=False):
         self.pre_flight_check()
-        #cm = min(cm, self.tether_distance("forward"))
+        cm = self.clip_to_fence('forward', cm)
+        if cm is None:
+            return
         self.drone.move_forward(int(cm))
-        if 0 <= self.curr_degrees < 90 or 270 < self.curr_degrees < 360: #drone has rotated but still facing forward direction
-            self.x_distance += round(abs(math.cos(math.radians(self.curr_degrees)) * cm),0)
-        elif 0 < self.curr_degrees <= 180: #drone has rotated but is still facing left/positive y direction
-            self.x_distance -= round(abs(math.cos(math.radians(self.curr_degrees)) * cm),0)
-        elif 180 < self.curr_degrees < 270: #drone has rotated and is facing lower right direction
-            self.x_distance -= round(abs(math.cos(math.radians(self.curr_degrees)) * cm),0)
-
-        if 0 < self.curr_degrees < 180: #drone is going left. adding to y distance
-            self.y_distance += round(abs(math.sin(math.radians(self.curr_degrees)) * cm),0)
-        elif 180 < self.curr_degrees < 360: #drone is going right. subtracting from y distance
-            self.y_distance -= round(abs(math.sin(math.radians(self.curr_degrees)) * cm),0)
-        self.log.info(f"Drone succesfully flew forward {cm} cm")
+        self.update_pose('forward', cm)
+        self.log_event("Drone succesfully flew forward %s cm", cm, maneuver='forward', cm=cm)
 
     def fly_back(self,cm):
         self.pre_flight_check()
-        #cm = min(cm, self.tether_distance("backward"))
+        cm = self.clip_to_fence('back', cm)
+        if cm is None:
+            return
         self.drone.move_back(int(cm))
-        angle = self.curr_degrees + 180
-        if 0 <= self.curr_degrees < 90 or 270 < self.curr_degrees < 360: #drone has rotated but still facing forward direction
-            self.x_distance += round(abs(math.cos(math.radians(self.curr_degrees)) * cm),0)
-        elif 0 < self.curr_degrees < 180: #drone has rotated but is still facing left/positive y direction
-            self.x_distance -= round(abs(math.cos(math.radians(self.curr_degrees)) * cm),0)
-
-        if 0 < self.curr_degrees < 180:
-            self.y_distance += round(abs(math.sin(math.radians(self.curr_degrees)) * cm),0)
-        elif 180 < self.curr_degrees < 360:
-            self.y_distance -= round(abs(math.sin(math.radians(self.curr_degrees)) * cm),0)
-        self.log.info(f"Drone succesfully flew back {cm} cm")
+        self.update_pose('back', cm)
+        self.log_event("Drone succesfully flew back %s cm", cm, maneuver='back', cm=cm)
 
     def fly_left(self,cm):
         self.pre_flight_check()
-        #cm = min(cm, self.tether_distance("left"))
+        cm = self.clip_to_fence('left', cm)
+        if cm is None:
+            return
         self.drone.move_left(int(cm))
-        angle = self.curr_degrees + 90
-        if 0 <= self.curr_degrees < 90 or 270 < self.curr_degrees < 360: #drone has rotated but still facing forward direction
-            self.x_distance += round(abs(math.cos(math.radians(angle)) * cm),0)
-        elif 0 < self.curr_degrees < 180: #drone has rotated but is still facing left/positive y direction
-            self.x_distance -= round(abs(math.cos(math.radians(angle)) * cm),0)
-
-        if 0 < self.curr_degrees < 180:
-            self.y_distance += round(abs(math.sin(math.radians(angle)) * cm),0)
-        elif 180 < self.curr_degrees < 360:
-            self.y_distance -= round(abs(math.sin(math.radians(angle)) * cm),0)
-        self.log.info(f"Drone succesfully flew left {cm} cm")
+        self.update_pose('left', cm)
+        self.log_event("Drone succesfully flew left %s cm", cm, maneuver='left', cm=cm)
 
     def fly_right(self,cm):
         self.pre_flight_check()
-        #cm = min(cm, self.tether_distance("right"))
+        cm = self.clip_to_fence('right', cm)
+        if cm is None:
+            return
         self.drone.move_right(int(cm))
-        angle = self.curr_degrees + 270
-        if 0 <= self.curr_degrees < 90 or 270 < self.curr_degrees < 360: #drone has rotated but still facing forward direction
-            self.x_distance += round(abs(math.cos(math.radians(angle)) * cm),0)
-        elif 0 < self.curr_degrees < 180: #drone has rotated but is still facing left/positive y direction
-            self.x_distance -= round(abs(math.cos(math.radians(angle)) * cm),0)
-
-        if 0 < self.curr_degrees < 180:
-            self.y_distance += round(abs(math.sin(math.radians(angle)) * cm),0)
-        elif 180 < self.curr_degrees < 360:
-            self.y_distance -= round(abs(math.sin(math.radians(angle)) * cm),0)
-        self.log.info(f"Drone succesfully flew right {cm} cm")
+        self.update_pose('right', cm)
+        self.log_event("Drone succesfully flew right %s cm", cm, maneuver='right', cm=cm)
 
     def rotate_clockwise(self, degrees):
         self.drone.rotate_clockwise(int(degrees))
-        self.curr_degrees = (self.curr_degrees - degrees) % 360
-        self.log.info(f"Drone has rotated {degrees} clockwise")
+        self.update_pose('cw', degrees)
+        self.log_event("Drone has rotated %s clockwise", degrees, maneuver='cw', degrees_turned=degrees)
 
     def rotate_counter_clockwise(self, degrees):
         self.drone.rotate_counter_clockwise(int(degrees))
-        self.curr_degrees += degrees
-        self.curr_degrees = self.curr_degrees % 360
-        self.log.info(f"Drone has rotated {degrees} clockwise")
+        self.update_pose('ccw', degrees)
+        self.log_event("Drone has rotated %s counter clockwise", degrees, maneuver='ccw', degrees_turned=degrees)
+
+    def clip_to_fence(self, maneuver, amount):
+        """ The part of a maneuver that stays inside the geofence, or None
+        if that is too short to fly. Nothing is sent to the drone. """
+        if self.geofence is None:
+            return amount
+        clipped = self.geofence.clip(maneuver, amount, (self.x_distance, self.y_distance, self.curr_degrees),
+                                     self.altitude())
+        if clipped is None:
+            self.log.warning("Geofence: %s %s would leave the fence, skipped", maneuver, amount,
+                             extra={'maneuver': maneuver, 'amount': amount})
+        elif clipped != amount:
+            self.log.warning("Geofence: %s %s shortened to %s", maneuver, amount, clipped,
+                             extra={'maneuver': maneuver, 'amount': amount, 'clipped': clipped})
+        return clipped
+
+    def update_pose(self, maneuver, amount):
+        """ Dead reckoning after a maneuver, see maneuver_queue.pose_after,
+        corrected by the downward camera if visual odometry runs. """
+        before = (self.x_distance, self.y_distance, self.curr_degrees)
+        after = pose_after(maneuver, amount, *before)
+        if self.visual_odometry is not None:
+            after = self.visual_odometry.fuse(maneuver, before, after)
+        self.x_distance, self.y_distance, self.curr_degrees = after
+        if self.pad_map is not None:
+            self.snap_to_pad()
+        if self.map_recorder is not None:
+            self.map_recorder.moved(before, (self.x_distance, self.y_distance))
+
+    def start_mapping(self, filename=None, length=2000, width=2000):
+        """
+        Map the height of everything the drone flies over from the ToF
+        readings, and route fly_to_coordinates() round what is too tall.
+        See occupancy_grid.py.
+        Arguments
+            filename:      .npy map to extend, default mission_params['map'];
+                           created if missing and saved on disconnect()
+            length, width: cm of a new map along x and y, centred on the start
+        """
+        from occupancy_grid import MapRecorder, OccupancyGrid
+        if self.map_recorder is not None:
+            return self.occupancy_grid
+        self.map_file = filename or self.params.get('map')
+        if self.map_file and os.path.exists(self.map_file):
+            self.occupancy_grid = OccupancyGrid.load(self.map_file)
+        else:
+            self.occupancy_grid = OccupancyGrid.create(length, width)
+        self.map_recorder = MapRecorder(self, self.occupancy_grid)
+        self.drone.add_state_listener(self.map_recorder.update)
+        return self.occupancy_grid
+
+    def stop_mapping(self):
+        if self.map_recorder is None:
+            return
+        self.drone.remove_state_listener(self.map_recorder.update)
+        pose = (self.x_distance, self.y_distance)
+        self.map_recorder.moved(pose, pose)
+        self.map_recorder = None
+        if self.map_file:
+            self.occupancy_grid.save(self.map_file)
+            self.log.info("Map saved to %s", self.map_file)
+
+    def start_pad_localisation(self, pads=None, direction=0):
+        """
+        Use the mission pads (Tello EDU) as absolute positions: the pose is
+        set from the pad in view after every maneuver, and fly_to_point()
+        flies relative to a visible pad. See pad_localiser.py.
+        Arguments
+            pads:      {mid: (x, y, yaw)}, default mission_params['pads']
+            direction: pad detection, 0 downward (20 Hz), 1 forward, 2 both
+        """
+        self.pad_map = PadMap(pads if pads is not None else self.params['pads'])
+        self.drone.enable_mission_pads()
+        self.drone.set_mission_pad_detection_direction(direction)
+        self.snap_to_pad()
+        return self.pad_map
+
+    def snap_to_pad(self, since=None):
+        """ Set the pose from the mission pad in view, using a state packet
+        newer than since (default now). Only waits for one if the latest
+        packet saw a known pad, so moves away from the pads cost nothing.
+        Returns True if a known pad was in view. """
+        channel = self.drone.get_own_udp_object()
+        since = since or time.time()
+        state = channel.state
+        if not state or state.get('mid', -1) not in self.pad_map:
+            return False
+        if channel.state_timestamp <= since:
+            state = wait_for_fresh_state(channel, since)
+        pose = self.pad_map.pose_from_state(state) if state else None
+        if pose is None:
+            return False
+        self.log_event("Pose from mission pad %s: (%.0f, %.0f, %.0f), dead reckoning had (%.0f, %.0f, %.0f)",
+                       state['mid'], *pose, self.x_distance, self.y_distance, self.curr_degrees,
+                       maneuver='pad', mid=state['mid'])
+        self.x_distance, self.y_distance = pose[0], pose[1]
+        self.curr_degrees = int(round(pose[2])) % 360
+        return True
+
+    def fly_to_point(self, x, y, z=None, speed=50):
+        """
+        Fly to (x, y) cm of the mission frame. With a known pad in view this
+        is one 'go x y z speed mN' relative to the pad; otherwise the drone
+        turns, flies straight there and turns back to heading 0.
+        Arguments
+            x, y:  target in cm
+            z:     cm above the pad for pad moves, default the current altitude
+            speed: cm/s for pad moves
+        """
+        self.pre_flight_check()
+        mid = self.drone.get_current_state().get('mid', -1)
+        if self.pad_map is not None and mid in self.pad_map:
+            altitude = self.altitude()
+            target = self.fence_point(x, y, z if z is not None else altitude, altitude, speed)
+            if target is None:
+                return
+            x, y, z = target
+            arguments = go_mid_arguments(self.pad_map, mid, x, y, z, speed) if z is not None else None
+            if arguments is not None:
+                sent = time.time()
+                self.drone.go_xyz_speed_mid(*arguments)
+                if not self.snap_to_pad(sent):
+                    self.x_distance, self.y_distance = x, y
+                return
+        self.fly_sequence(home_maneuvers(self.x_distance - x, self.y_distance - y, self.curr_degrees))
+
+    def fence_point(self, x, y, z, altitude, speed):
+        """ (x, y, z) of a point to fly to straight from the current pose,
+        pulled back along the way to end inside the geofence, or None if
+        what is left is too short to fly. z and altitude may be None. """
+        if self.geofence is None:
+            return x, y, z
+        heading = math.radians(self.curr_degrees)
+        cos, sin = math.cos(heading), math.sin(heading)
+        dx, dy = x - self.x_distance, y - self.y_distance
+        dz = z - altitude if z is not None and altitude is not None else 0
+        move = (cos * dx + sin * dy, -sin * dx + cos * dy, dz, speed)
+        clipped = self.clip_to_fence('go', move)
+        if clipped is None:
+            return None
+        if clipped == move:
+            return x, y, z
+        forward, left, up = clipped[:3]
+        dx, dy = body_to_world(forward, left, self.curr_degrees)
+        return self.x_distance + dx, self.y_distance + dy, altitude + up if dz else z
+
+    def fly_waypoints(self, points, z=None, speed=50):
+        """ fly_to_point() for each (x, y) in turn. """
+        for x, y in points:
+            self.fly_to_point(x, y, z, speed)
+
+    def start_visual_odometry(self, weight=0.5):
+        """
+        Switch the video to the downward camera and correct the pose after
+        every move with how far the floor moved under the drone, see
+        visual_odometry.VisualOdometry. Needs OpenCV and a textured floor.
+        Arguments
+            weight: 0-1, how much the camera counts against the commanded
+                    distance
+        """
+        if self.visual_odometry is None:
+            from visual_odometry import VisualOdometry
+            self.drone.set_video_direction(Tello.CAMERA_DOWNWARD)
+            self.drone.streamon()
+            self.visual_odometry = VisualOdometry(self, self.drone.get_frame_read(), weight).start()
+        return self.visual_odometry
+
+    def stop_visual_odometry(self):
+        if self.visual_odometry is not None:
+            self.visual_odometry.stop()
+            self.visual_odometry = None
+
+    def fly_sequence(self, maneuvers, wait=True, abort_to_land=True, optimise=False):
+        """
+        Fly a list of maneuvers back to back, e.g.
+            drone.fly_sequence([('cw', 90), ('forward', 30), ('cw', 90), ('forward', 30)])
+        The whole list is checked before anything is sent, and each command
+        goes out as soon as the previous one is acked. See ManeuverQueue.
+        Arguments
+            maneuvers:     list of (maneuver, amount) tuples
+            wait:          block until done; otherwise call .wait() or
+                           .cancel() on the returned queue
+            abort_to_land: land if a command fails or the battery runs low
+            optimise:      merge and fold the maneuvers first, see peephole.py
+        Returns
+            The ManeuverQueue
+        Raises ReturnedHome if wait is set and the queue stopped to fly home
+        for the battery reserve.
+        """
+        self.pre_flight_check()
+        if optimise:
+            before = len(maneuvers)
+            maneuvers, saved = peephole.optimise(maneuvers)
+            self.log.info("Peephole: %s", peephole.report(before, len(maneuvers), saved),
+                          extra={'commands_saved': before - len(maneuvers)})
+        queue = ManeuverQueue(self, maneuvers, abort_to_land)
+        self.maneuver_queue = queue
+        if wait:
+            queue.run()
+            if queue.status == 'returning':
+                raise ReturnedHome("Returned home to land with the battery reserve")
+        else:
+            queue.start()
+        return queue
+
+    def log_event(self, msg, *args, **fields):
+        """
+        Log a maneuver at INFO level with the pose and cached battery attached
+        as numeric fields (kept as numbers in 'jsonl' log mode). Nothing is
+        formatted when INFO is disabled.
+        """
+        if self.log.isEnabledFor(logging.INFO):
+            fields.update(x=self.x_distance, y=self.y_distance, degrees=self.curr_degrees,
+                          battery=self.drone.get_current_state().get('bat'))
+            self.log.info(msg, *args, extra=fields)
+        return
+
+
+    def enable_profiling(self, name='mission'):
+        """ Start timing every HighFlyers method and drone call. Returns the
+        MissionProfiler. """
+        if self.profiler is None:
+            self.profiler = MissionProfiler(name).attach(self)
+        return self.profiler
+
+
+    def stop_profiling(self, filename=None):
+        """
+        Stop timing, log the timing tree and optionally write it as collapsed
+        stacks (flamegraph.pl / speedscope input). Returns the profiler.
+        Arguments
+            filename: where to write the collapsed stacks, e.g. 'hfm13.folded'
+        """
+        profiler = self.profiler
+        if profiler is None:
+            return None
+        self.profiler = None
+        profiler.detach()
+        self.log.info("Mission profile:\n%s", profiler.report())
+        if filename:
+            profiler.write_collapsed(filename)
+        return profiler
+
 
     def __del__(self):
         """ Destructor that gracefully closes the connection to the drone. """
@@ -235,6 +634,11 @@ class HighFlyers():
 
     def disconnect(self):
         """ Gracefully close the connection with the drone. """
+        if self.reserve_monitor is not None:
+            self.reserve_monitor.stop()
+        self.stop_visual_odometry()
+        self.stop_mapping()
+        self.drone.remove_state_listener(self.altitude_filter.update)
         self.drone.end()
         self.connected = False
         print(f"Drone connection closed gracefully")
@@ -251,19 +655,14 @@ class HighFlyers():
             blue:  0-255
         """
 
-        r = djim.capped_color(red)
-        g = djim.capped_color(green)
-        b = djim.capped_color(blue)
-        cmd = f"EXT led {r} {g} {b}"
-        self.drone.send_control_command(cmd)
+        self.display.send(self.drone, djim.led_command(red, green, blue))
         return
 
 
     def top_led_off(self):
         """ Turn off the top LED. """
 
-        cmd = f"EXT led 0 0 0"
-        self.drone.send_control_command(cmd)
+        self.display.send(self.drone, djim.led_command(0, 0, 0))
         return
 
 
@@ -274,25 +673,36 @@ class HighFlyers():
         off. The first 8 characters are the top row, the next 8 are the second
         row, and so on.
         Arguments
-            flattened_pattern: see examples in dji_matrix.py
+            flattened_pattern: see examples in dji_matrix.py, may also be a
+                               precompiled djim.CompiledPattern
             color:             'r', 'b', or 'p'
         """
 
-        if color.lower() not in "rpb":
-            color = 'b'
-        cmd = f"EXT mled g {flattened_pattern.replace('*', color.lower())}"
-        self.drone.send_control_command(cmd)
+        cmd = djim.compile_pattern(flattened_pattern).command(color)
+        self.display.send(self.drone, cmd)
         return
 
 
     def matrix_off(self):
         """ Turn off the 64 LED matrix. """
 
-        off_pattern = "0" * 64
-        self.matrix_pattern(off_pattern)
+        self.matrix_pattern(djim.compiled_off)
         return
 
 
+    def play_animation(self, frames, loop=False):
+        """
+        Play LED matrix / top LED frames in the background and return right
+        away, so the drone keeps flying while the display changes. Call
+        stop() on the returned object to end a looping animation.
+        Arguments
+            frames: list of frame dictionaries, see matrix_animation.py
+            loop:   repeat the frames until stopped
+        """
+
+        return MatrixAnimation(self.drone, frames, loop, self.display).start()
+
+
     def get_battery(self):
         """ Returns the drone's battery level as a percent. """
         return self.drone.get_battery()
@@ -308,8 +718,50 @@ class HighFlyers():
         return self.drone.get_temperature()
 
 
-    def go_to_floor(self, BAR_floor):
-        if self.params['m_type'] == 'IRS':
+    def altitude(self):
+        """ Fused altitude above the takeoff floor in cm, or None before the
+        first state packet. """
+        estimate = self.altitude_filter.estimate()
+        return None if estimate is None else estimate[0]
+
+    def move_to_altitude(self, target, settle_timeout=1.0):
+        """
+        Climb or sink to target cm above the takeoff floor in one move worked
+        out from the fused altitude. Waits up to settle_timeout seconds for
+        the estimate to settle first. Differences below the 20 cm the Tello
+        can move are left alone.
+        The move is clipped to the geofence floor and ceiling.
+        Returns
+            the move in cm, positive up, 0 if none was needed or no altitude
+            is known yet
+        """
+        self.pre_flight_check()
+        estimate = self.altitude_filter.wait_until_settled(timeout=settle_timeout)
+        if estimate is None:
+            self.log.warning("No altitude known yet, not moving to %s cm", target)
+            return 0
+        altitude, std = estimate
+        change = int(round(target - altitude))
+        self.log_event("Moving from %.0f cm (+/- %.0f) to %s cm", altitude, std, target,
+                       maneuver='altitude', altitude=altitude, altitude_std=std, target=target)
+        clipped = self.clip_to_fence('up' if change > 0 else 'down', abs(change))
+        if clipped is None:
+            return 0
+        change = int(clipped) if change > 0 else -int(clipped)
+        for chunk in peephole.split_distance(abs(change)):
+            if change > 0:
+                self.drone.move_up(chunk)
+            else:
+                self.drone.move_down(chunk)
+        return change if abs(change) >= 20 else 0
+
+    def go_to_floor(self, BAR_floor=None):
+        """ Move to the mission floor. Uses the fused altitude; the single
+        ToF or barometer reading of m_type (and BAR_floor, the barometer on
+        the ground) is only used before any state packet arrived. """
+        if self.altitude_filter.estimate() is not None:
+            self.move_to_altitude(self.params['floor'])
+        elif self.params['m_type'] == 'IRS':
             if self.drone.get_height() <= self.params['floor']:
                 print('IRS going to floor')
                 self.drone.move_up(self.params['floor'] - self.drone.get_height())
@@ -333,8 +785,11 @@ class HighFlyers():
                 self.drone.move_down(int((self.drone.get_barometer() - BAR_floor) - self.params['floor']))
                 print('DONE MOVING DOWN')
 
-    def go_to_ceiling(self, BAR_floor):
-        if self.params['m_type'] == 'IRS': #m_type = measurement type , IR = Infrared Sensor
+    def go_to_ceiling(self, BAR_floor=None):
+        """ Move to the mission ceiling, see go_to_floor. """
+        if self.altitude_filter.estimate() is not None:
+            self.move_to_altitude(self.params['ceiling'])
+        elif self.params['m_type'] == 'IRS': #m_type = measurement type , IR = Infrared Sensor
             if self.drone.get_height() >= self.params['ceiling']:
                 print('IRS going to ceiling')
                 self.drone.move_down(self.drone.get_height() - self.params['ceiling'])
@@ -383,9 +838,11 @@ class HighFlyers():
             self.log.warning("Cannot round Radians to Whole Number")
 
     def fly_home(self):
+        ''' Fly straight home and face the start heading, the path the
+        battery model and mission plans cost 'home' as, see
+        maneuver_queue.home_maneuvers '''
         self.pre_flight_check()
-        self.fly_to_coordinates(0,0,True)
-        self.rotate_to_bearing(0, True)
+        self.fly_sequence(home_maneuvers(self.x_distance, self.y_distance, self.curr_degrees))
 
     def rotate_to_bearing(self, degrees, home=False):
         degrees_to_rotate = abs(degrees - self.curr_degrees)
@@ -398,7 +855,19 @@ class HighFlyers():
     def fly_to_coordinates(self, x_coord, y_coord, direct_flight=False):
         '''This function flies the drone to specific coordinates. There are two modes. Direct flight and "square" flight.
         In direct flight the drone will rotate and fly directly to the coordinates. In "square" mode the drone will fly
-        forward/backward and left/right to reach the coordinates'''
+        forward/backward and left/right to reach the coordinates. With a map
+        from start_mapping() the drone flies straight along a route round the
+        known obstacles instead'''
+        if self.occupancy_grid is not None:
+            altitude = self.altitude()
+            route = self.occupancy_grid.route((self.x_distance, self.y_distance), (x_coord, y_coord),
+                                              altitude if altitude is not None else self.drone.get_height())
+            if route is None:
+                self.log.warning("No route to (%s, %s) round the mapped obstacles", x_coord, y_coord)
+                return
+            maneuvers, _ = path_maneuvers(route, self.x_distance, self.y_distance, self.curr_degrees)
+            self.fly_sequence(maneuvers)
+            return
         if direct_flight == False:
             if self.curr_degrees == 0 and self.x_distance == 0 and self.y_distance == 0: #flying to coordinates from start. drone is not rotated or moved
                 if x_coord > 0 and y_coord > 0: #coordinates are in upper left quadrant
@@ -615,33 +1084,13 @@ class HighFlyers():
                     self.fly_forward(distance_to)
 
     def tether_distance(self, direction):
-        '''This function tethers the drone to a centerpoint with a maximum tether distance
-        that is set as a mission parameter. Note that the drone may not reach the exact tether amount
-        due to rounding.'''
-        if direction == "forward":
-            rotation_angle = self.curr_degrees
-            theta2 = rotation_angle
-
-        elif direction == "backward":
-            rotation_angle = self.curr_degrees
-            theta2 = rotation_angle + 180
-
-        elif direction == "left":
-            rotation_angle = self.curr_degrees
-            theta2 = rotation_angle + 90
-
-        else:
-            rotation_angle = self.curr_degrees
-            theta2 = rotation_angle + 270
-
-        theta1 = math.atan(self.y_distance / self.x_distance) if self.x_distance > 0 else math.atan(self.y_distance / 1)
-        alpha = abs(theta1 - theta2)
-        side_b = abs(math.dist((self.x_distance,self.y_distance),(0,0)))
-        beta = math.asin(side_b*(math.sin(math.radians(alpha))/self.tether))
-        gamma = 180 - alpha - beta
-        side_c = abs(math.sin(gamma) * (self.params.tether/math.sin(alpha)) if math.sin(alpha) > 0 else math.sin(gamma) * (self.params.tether/1))
-
-        return side_c
+        """ cm the drone can fly in direction ('forward', 'backward', 'left'
+        or 'right') from the current pose before it leaves the geofence,
+        inf without one. See geofence.Geofence. """
+        if self.geofence is None:
+            return math.inf
+        move = 'back' if direction == 'backward' else direction
+        return self.geofence.limits(self.x_distance, self.y_distance, self.curr_degrees)[move]
 
     def move_forward_long(self, distance):
         '''This function allows the drone to fly forward more than the maximum
@@ -696,21 +1145,55 @@ class HighFlyers():
         '''wrapper function for flip forward'''
         self.flip_forward()
 
+    def fly_plan(self, plan, abort_to_land=True, battery_model=None):
+        """
+        Fly a compiled mission, see mission_plan.load_mission(). Returns True
+        if every step was flown.
+        With a battery_model.BatteryModel the plan is first cut short if it
+        would land below mission_params['battery_reserve'] (default
+        min_operating_power).
+        """
+        self.log.info("%s", plan.summary())
+        if battery_model is not None:
+            reserve = self.params.get('battery_reserve', self.params['min_operating_power'])
+            plan, left = battery_model.fit_plan(plan, self.get_battery(), reserve)
+            self.log.info("Predicted battery after the mission: %.0f%%", left, extra={'predicted_battery': left})
+        return mission_plan.fly_plan(self, plan, abort_to_land)
+
     def record_video(self, stop_thread_event, display_video_live=False):
         '''This function records video from the drone. Person/Object detection using YOLO has also been incorporated'''
+        import cv2
+        import yolo
+
         movie_name = 'drone_capture.avi'
         movie_codec = cv2.VideoWriter_fourcc(*'mp4v')
         movie_fps = 20
         frame_wait = 1 / movie_fps
         movie_size = (360, 240)
+        detector_size = (416, 416)
 
         print("Thread started")
-        self.streamon()
-        camera = self.get_frame_read()
+        # Ask for no more pixels and frames than the recording and detector
+        # use, and less when decoding cannot keep up, see video_settings.py
+        self.video_settings = VideoSettings(self.drone)
+        self.video_settings.need('recording', *movie_size, movie_fps)
+        if display_video_live:
+            self.video_settings.need('detector', *detector_size, movie_fps)
+        self.video_settings.apply()
+        self.drone.streamon()
+        camera = self.drone.get_frame_read()
+        self.video_settings.watch(camera)
         movie = cv2.VideoWriter(movie_name, movie_codec, movie_fps, movie_size, True)
+        # Receive times of the written frames and of the state packets, so
+        # detections can be placed in space later, see telemetry_index.py
+        self.telemetry_index = TelemetryIndex(self)
+        self.drone.add_state_listener(self.telemetry_index.record_state)
+        movie_frames = 0
         time_prev = time.time()
         if display_video_live:
             cv2.namedWindow("Drone Video Feed")
+            dnn_classifier, dnn_layers, label_names = self.load_dnn_model()
+            dnn_object = (dnn_classifier, dnn_layers)
         print("Video feed started")
 
         while not stop_thread_event.isSet():
@@ -721,24 +1204,27 @@ class HighFlyers():
                 image = camera.frame
                 image = cv2.resize(image, movie_size)
                 if display_video_live:
-                    dnn_classifier, dnn_layers, label_names = yolo.load_yolo_deep_neural_network()
-                    dnn_object = (dnn_classifier, dnn_layers)
                     confidence = 0.90
                     threshold = 0.3
                     img = yolo.process_image(image, dnn_object, confidence, threshold)
                     cv2.imshow("Drone Video Feed", img)
                 cv2.waitKey(1)
                 movie.write(image)
+                self.telemetry_index.add_frame(movie_frames, camera.frame_timestamp)
+                movie_frames += 1
                 time_prev = time_curr
+                self.video_settings.update()
 
             if display_video_live:
                 cv2.waitKey(5)
             else:
                 time.sleep(0.005)
 
-            print("Stopping video feed")
-            self.streamoff()
-            movie.release()
-            print("Thread finished")
+        print("Stopping video feed")
+        self.drone.streamoff()
+        movie.release()
+        self.drone.remove_state_listener(self.telemetry_index.record_state)
+        self.telemetry_index.save(os.path.splitext(movie_name)[0] + '.telemetry.json')
+        print("Thread finished")
 
     #------------------------- END OF HighFlyers CLASS ---------------------------
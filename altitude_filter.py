@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+#High Flyers altitude estimator
+
+import logging
+import time
+from threading import Condition
+
+log = logging.getLogger('colt')
+
+################################################################################
+# go_to_floor and go_to_ceiling used to read one ToF or one barometer sample   #
+# and move by the difference, so one noisy sample meant a corrective move.     #
+# AltitudeFilter is a Kalman filter over altitude and climb rate that is fed   #
+# every state packet (about 10 a second) and fuses the four height sources:    #
+#   h     height above the takeoff point in cm, coarse (10 cm steps)           #
+#   tof   distance to the floor below in cm, precise but sees tables and boxes #
+#   baro  air pressure height in m, noisy and drifts, offset set at the start  #
+#   vgz   climb speed in dm/s, positive downwards                              #
+# A ToF reading more than TOF_AGREEMENT away from h is the ToF seeing a table  #
+# or a box and is left out, as are barometer readings far off the estimate.    #
+# h itself is always used, so the filter cannot lock itself out. Altitudes are #
+# in cm above the takeoff floor, like h and the floor and ceiling params.      #
+################################################################################
+
+TOF_OFFSET = 10         # cm the ToF reads with the drone on the floor
+TOF_INVALID = 6000      # ToF readings above this mean no floor in range
+VGZ_SCALE = -10.0       # vgz to cm/s upwards
+TOF_AGREEMENT = 30      # cm the ToF may differ from h before it is left out
+GATE = 9.0              # squared normalised innovation beyond which baro is left out
+BARO_DRIFT = 0.01       # share of each barometer innovation moved into its offset
+
+
+class AltitudeFilter():
+    """
+    Fused altitude with its uncertainty. Register update() as a state
+    listener of the Tello object:
+
+        altitude = AltitudeFilter()
+        drone.add_state_listener(altitude.update)
+        height, std = altitude.estimate()
+    """
+
+    def __init__(self, accel_std=60.0, h_std=6.0, tof_std=2.0, baro_std=25.0, vgz_std=10.0,
+                 vgz_scale=VGZ_SCALE):
+        """
+        Arguments
+            accel_std: cm/s^2 of unmodelled vertical acceleration
+            h_std:     cm of noise on h
+            tof_std:   cm of noise on tof
+            baro_std:  cm of noise on baro
+            vgz_std:   cm/s of noise on vgz
+            vgz_scale: factor from vgz to cm/s upwards
+        """
+        self.accel_var = accel_std ** 2
+        self.variances = {'h': h_std ** 2, 'tof': tof_std ** 2, 'baro': baro_std ** 2}
+        self.vgz_var = vgz_std ** 2
+        self.vgz_scale = vgz_scale
+        self.changed = Condition()
+        self.reset()
+
+
+    def reset(self):
+        """ Forget the estimate; the next packet starts a new one. """
+        with self.changed:
+            self.altitude = None
+            self.velocity = 0.0
+            # Covariance of (altitude, velocity)
+            self.p = [[0.0, 0.0], [0.0, 0.0]]
+            self.baro_offset = None
+            self.timestamp = None
+            self.updates = 0
+            self.rejected = {'h': 0, 'tof': 0, 'baro': 0, 'vgz': 0}
+
+
+    def heights(self, state):
+        """ The height readings of one state packet in cm, by source. """
+        readings = {}
+        if isinstance(state.get('h'), (int, float)):
+            readings['h'] = float(state['h'])
+        tof = state.get('tof')
+        if isinstance(tof, (int, float)) and TOF_OFFSET <= tof < TOF_INVALID:
+            if 'h' in readings and abs(tof - TOF_OFFSET - readings['h']) > TOF_AGREEMENT:
+                self.rejected['tof'] += 1
+            else:
+                readings['tof'] = float(tof - TOF_OFFSET)
+        if isinstance(state.get('baro'), (int, float)):
+            readings['baro'] = state['baro'] * 100
+        return readings
+
+
+    def update(self, state, timestamp=None):
+        """ Fuse one state packet. Signature of a Tello state listener. """
+        timestamp = time.time() if timestamp is None else timestamp
+        readings = self.heights(state)
+        with self.changed:
+            if self.altitude is None:
+                self.start(readings, timestamp)
+            else:
+                self.predict(timestamp - self.timestamp)
+                self.timestamp = timestamp
+                for source in ('h', 'tof'):
+                    if source in readings:
+                        self.correct(0, readings[source], self.variances[source], source)
+                if 'baro' in readings and self.baro_offset is not None:
+                    baro = readings['baro'] - self.baro_offset
+                    if self.correct(0, baro, self.variances['baro'], 'baro'):
+                        self.baro_offset += BARO_DRIFT * (baro - self.altitude)
+                if isinstance(state.get('vgz'), (int, float)):
+                    self.correct(1, state['vgz'] * self.vgz_scale, self.vgz_var, 'vgz')
+            if self.altitude is not None:
+                self.updates += 1
+                self.changed.notify_all()
+
+
+    def start(self, readings, timestamp):
+        """ First estimate from the best single reading. """
+        for source in ('tof', 'h'):
+            if source in readings:
+                self.altitude = readings[source]
+                self.velocity = 0.0
+                self.p = [[self.variances[source], 0.0], [0.0, self.vgz_var]]
+                self.timestamp = timestamp
+                if 'baro' in readings:
+                    self.baro_offset = readings['baro'] - self.altitude
+                return
+
+
+    def predict(self, dt):
+        """ Constant climb rate for dt seconds, uncertainty grows with dt. """
+        if dt <= 0:
+            return
+        p = self.p
+        self.altitude += self.velocity * dt
+        q = self.accel_var
+        p00 = p[0][0] + dt * (p[0][1] + p[1][0]) + dt * dt * p[1][1] + q * dt ** 4 / 4
+        p01 = p[0][1] + dt * p[1][1] + q * dt ** 3 / 2
+        p11 = p[1][1] + q * dt * dt
+        self.p = [[p00, p01], [p01, p11]]
+
+
+    def correct(self, index, value, variance, source):
+        """
+        Kalman update with one reading of altitude (index 0) or climb rate
+        (index 1). Returns False if the reading was left out.
+        """
+        p = self.p
+        innovation = value - (self.altitude, self.velocity)[index]
+        s = p[index][index] + variance
+        if source == 'baro' and innovation * innovation / s > GATE:
+            self.rejected[source] += 1
+            return False
+        k0 = p[0][index] / s
+        k1 = p[1][index] / s
+        self.altitude += k0 * innovation
+        self.velocity += k1 * innovation
+        row = p[index]
+        self.p = [[p[0][0] - k0 * row[0], p[0][1] - k0 * row[1]],
+                  [p[1][0] - k1 * row[0], p[1][1] - k1 * row[1]]]
+        return True
+
+
+    def estimate(self):
+        """ (altitude in cm, standard deviation in cm), or None before the
+        first state packet. """
+        with self.changed:
+            if self.altitude is None:
+                return None
+            return self.altitude, max(self.p[0][0], 0.0) ** 0.5
+
+
+    def wait_until_settled(self, max_std=5.0, timeout=1.0):
+        """
+        Wait until the estimate is at least as good as max_std and the drone
+        has stopped climbing or sinking, e.g. right after a move.
+        Returns
+            (altitude, std) when settled, the latest estimate after timeout,
+            or None without any state packets
+        """
+        deadline = time.time() + timeout
+        with self.changed:
+            while True:
+                if self.altitude is not None and self.p[0][0] <= max_std ** 2 \
+                        and abs(self.velocity) <= max_std:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    log.debug("Altitude not settled after %.1f s", timeout)
+                    break
+                self.changed.wait(remaining)
+        return self.estimate()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+#High Flyers battery model
+
+import json
+import logging
+import math
+
+import numpy as np
+
+import flight_log
+from maneuver_queue import pose_after
+from mission_plan import (CONTROLLER_STEPS, MissionPlan, PlanStep, step_commands,
+                          step_degrees, step_distance, step_seconds)
+
+log = logging.getLogger('colt')
+
+################################################################################
+# Instead of flying forward/back 20 cm until the battery is flat (HFM08), fit  #
+# the battery drain from the JSON lines flight logs every mission already      #
+# writes (log_mode 'jsonl'). Each response logged by djitellopy carries the    #
+# command and the battery level at that moment, so for every battery reading  #
+# we know how far the drone had flown, how far it had turned, how long it had  #
+# been in the air and how many commands it had sent since the start:           #
+#   start battery - battery = per_cm * cm + per_degree * degrees               #
+#                             + per_second * airborne seconds                 #
+#                             + per_command * commands                         #
+# All readings of all logs are fitted at once with least squares.              #
+################################################################################
+
+FEATURES = ('per_cm', 'per_degree', 'per_second', 'per_command')
+
+# A Tello hovers for roughly 13 minutes on a full battery
+DEFAULT_COEFFICIENTS = {'per_cm': 0.0, 'per_degree': 0.0, 'per_second': 100 / (13 * 60), 'per_command': 0.0}
+
+
+def command_effects(command):
+    """ (cm, degrees) flown by one SDK command string. """
+    words = command.split()
+    if not words:
+        return 0.0, 0.0
+    try:
+        if words[0] in ('forward', 'back', 'left', 'right', 'up', 'down') and len(words) > 1:
+            return float(words[1]), 0.0
+        if words[0] in ('cw', 'ccw') and len(words) > 1:
+            return 0.0, float(words[1])
+        if words[0] in ('go', 'curve') and len(words) > 3:
+            x, y, z = (float(value) for value in words[1:4])
+            return math.sqrt(x * x + y * y + z * z), 0.0
+    except ValueError:
+        pass
+    return 0.0, 0.0
+
+
+def flight_features(events):
+    """
+    Turn the events of one flight log into the fit inputs.
+    Returns
+        (features, drain): an (n, 4) array with cm, degrees, airborne seconds
+        and commands up to each battery reading, and the n battery drops
+        since the first reading. Both are empty if the log has no readings.
+    """
+    command_times = []
+    command_cm = []
+    command_degrees = []
+    takeoffs = []
+    landings = []
+    sample_times = []
+    batteries = []
+    for event in events:
+        battery = event.get('battery')
+        if isinstance(battery, (int, float)) and not isinstance(battery, bool):
+            sample_times.append(event['t'])
+            batteries.append(battery)
+        command = event.get('command')
+        if isinstance(command, str) and isinstance(event.get('response'), str) \
+                and 'ok' in event['response'].lower():
+            cm, degrees = command_effects(command)
+            command_times.append(event['t'])
+            command_cm.append(cm)
+            command_degrees.append(degrees)
+            if command == 'takeoff':
+                takeoffs.append(event['t'])
+            elif command == 'land':
+                landings.append(event['t'])
+
+    if not sample_times:
+        return np.empty((0, len(FEATURES))), np.empty(0)
+
+    t = np.asarray(sample_times, dtype=float)
+    order = np.argsort(t, kind='stable')
+    t = t[order]
+    battery = np.asarray(batteries, dtype=float)[order]
+
+    times = np.asarray(command_times, dtype=float)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    cumulative_cm = np.concatenate(([0.0], np.cumsum(np.asarray(command_cm)[order])))
+    cumulative_degrees = np.concatenate(([0.0], np.cumsum(np.asarray(command_degrees)[order])))
+    done = np.searchsorted(times, t, side='right')   # commands acked by each reading
+
+    # Airborne intervals: each takeoff until the next landing (or the end)
+    starts = np.asarray(sorted(takeoffs), dtype=float)
+    ends = np.asarray(sorted(landings), dtype=float)
+    next_landing = np.searchsorted(ends, starts, side='right')
+    if len(ends):
+        landing = ends[np.minimum(next_landing, len(ends) - 1)]
+        stops = np.where(next_landing < len(ends), landing, t[-1])
+    else:
+        stops = np.full(len(starts), t[-1])
+    durations = np.maximum(stops - starts, 0.0)
+    airborne = np.clip(t[:, None] - starts[None, :], 0.0, durations[None, :]).sum(axis=1)
+
+    features = np.column_stack((cumulative_cm[done], cumulative_degrees[done], airborne, done.astype(float)))
+    return features, battery[0] - battery
+
+
+def nonnegative_least_squares(features, drain):
+    """ Least squares with every coefficient >= 0: coefficients that come out
+    negative are fixed at zero and the rest are fitted again. """
+    active = np.ones(features.shape[1], dtype=bool)
+    coefficients = np.zeros(features.shape[1])
+    while active.any():
+        solution, *_ = np.linalg.lstsq(features[:, active], drain, rcond=None)
+        if (solution >= 0).all():
+            coefficients[active] = solution
+            break
+        indices = np.flatnonzero(active)
+        active[indices[solution < 0]] = False
+    return coefficients
+
+
+class BatteryModel():
+    """ Predicted battery drain in percent for flights and mission plans. """
+
+    def __init__(self, coefficients=None, samples=0, rms_error=None):
+        self.coefficients = dict(DEFAULT_COEFFICIENTS)
+        if coefficients:
+            self.coefficients.update(coefficients)
+        self.samples = samples
+        self.rms_error = rms_error
+
+
+    @classmethod
+    def fit(cls, filenames):
+        """ Fit the model to one or more JSON lines flight logs. """
+        blocks = [flight_features(flight_log.read_events(filename)) for filename in filenames]
+        features = np.concatenate([block[0] for block in blocks]) if blocks else np.empty((0, len(FEATURES)))
+        drain = np.concatenate([block[1] for block in blocks]) if blocks else np.empty(0)
+        if len(drain) < len(FEATURES):
+            raise ValueError(f"Need at least {len(FEATURES)} battery readings to fit, got {len(drain)}")
+
+        # Scale columns so cm and seconds do not swamp each other in the fit
+        scale = np.abs(features).max(axis=0)
+        scale[scale == 0] = 1.0
+        coefficients = nonnegative_least_squares(features / scale, drain) / scale
+        residual = drain - features @ coefficients
+        model = cls(dict(zip(FEATURES, coefficients.tolist())), len(drain),
+                    float(np.sqrt(np.mean(residual ** 2))))
+        log.info("Battery model fitted on %s readings: %s", model.samples, model)
+        return model
+
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as model_file:
+            data = json.load(model_file)
+        return cls(data.get('coefficients'), data.get('samples', 0), data.get('rms_error'))
+
+
+    def save(self, filename):
+        with open(filename, 'w') as model_file:
+            json.dump({'coefficients': self.coefficients, 'samples': self.samples,
+                       'rms_error': self.rms_error}, model_file, indent=2)
+
+
+    def __str__(self):
+        terms = ", ".join(f"{name} {value:.5f}" for name, value in self.coefficients.items())
+        error = f", rms error {self.rms_error:.2f}%" if self.rms_error is not None else ""
+        return f"{terms}{error}"
+
+
+    def drain(self, cm=0.0, degrees=0.0, seconds=0.0, commands=0):
+        """ Predicted battery drop in percent. """
+        c = self.coefficients
+        return (c['per_cm'] * cm + c['per_degree'] * degrees
+                + c['per_second'] * seconds + c['per_command'] * commands)
+
+
+    def step_drain(self, step, pose, speed):
+        return self.drain(step_distance(step, pose), step_degrees(step),
+                          step_seconds(step, pose, speed), step_commands(step, pose))
+
+
+    def plan_drain(self, plan):
+        """ Predicted battery drop for a whole MissionPlan. """
+        return sum(self.step_drain(step, pose, plan.speed) for step, pose in plan.walk())
+
+
+    def fit_plan(self, plan, battery, reserve):
+        """
+        Check that a plan lands with at least reserve percent left. If it
+        would not, the plan is cut at the last step after which the drone
+        can still fly home and land above reserve, and home and land are
+        added. The steps are not reordered: a mission's order is its
+        meaning, and missions here are short enough that cutting the tail
+        loses the least.
+        Arguments
+            plan:    MissionPlan
+            battery: battery percentage now
+            reserve: percentage that must be left after landing
+        Returns
+            (plan to fly, predicted battery after it)
+        """
+        budget = battery - reserve
+        used = 0.0
+        airborne = False
+        kept = []
+        for step, pose in plan.walk():
+            cost = self.step_drain(step, pose, plan.speed)
+            after = plan_pose_after(step, pose)
+            # The step must leave enough to get back from where it ends
+            going_home = 0.0
+            if step.maneuver == 'takeoff' or (airborne and step.maneuver != 'land'):
+                going_home = self.step_drain(PlanStep('land'), after, plan.speed)
+                if after[:2] != (0, 0):
+                    going_home += self.step_drain(PlanStep('home'), after, plan.speed)
+            if used + cost + going_home > budget:
+                return self.truncated(plan, kept, airborne, battery)
+            used += cost
+            kept.append(step)
+            if step.maneuver == 'takeoff':
+                airborne = True
+            elif step.maneuver == 'land':
+                airborne = False
+        return plan, battery - used
+
+
+    def truncated(self, plan, kept, airborne, battery):
+        steps = list(kept)
+        if airborne:
+            pose = (0, 0, 0)
+            for step in steps:
+                pose = plan_pose_after(step, pose)
+            if pose[:2] != (0, 0):
+                steps.append(PlanStep('home'))
+            steps.append(PlanStep('land'))
+        cut = MissionPlan(f"{plan.name} (truncated)", plan.params, steps, plan.speed,
+                          plan.source_count, plan.saved)
+        left = battery - self.plan_drain(cut)
+        log.warning("Mission %s would land below reserve; flying %s of %s steps, predicted %.0f%% left",
+                    plan.name, len(kept), len(plan.steps), left,
+                    extra={'mission': plan.name, 'steps_kept': len(kept), 'predicted_battery': left})
+        return cut, left
+
+
+def plan_pose_after(step, pose):
+    if step.maneuver == 'home':
+        return (0, 0, 0)
+    if step.maneuver in CONTROLLER_STEPS:
+        return pose
+    return pose_after(step.maneuver, step.amount, *pose)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fit the battery model or check a mission against it")
+    commands = parser.add_subparsers(dest='action', required=True)
+    fit_parser = commands.add_parser('fit', help="fit the model to JSON lines flight logs")
+    fit_parser.add_argument('logs', nargs='+')
+    fit_parser.add_argument('--output', default='battery_model.json')
+    check_parser = commands.add_parser('check', help="predict the battery left after a mission")
+    check_parser.add_argument('mission')
+    check_parser.add_argument('--model', default='battery_model.json')
+    check_parser.add_argument('--battery', type=float, default=100)
+    check_parser.add_argument('--reserve', type=float, default=20)
+    args = parser.parse_args()
+
+    if args.action == 'fit':
+        model = BatteryModel.fit(args.logs)
+        model.save(args.output)
+        print(f"{model.samples} readings: {model}")
+        print(f"Model written to {args.output}")
+    else:
+        import mission_plan
+        model = BatteryModel.load(args.model)
+        plan = mission_plan.load_mission(args.mission)
+        print(plan.summary())
+        print(f"Predicted drain {model.plan_drain(plan):.1f}%, "
+              f"{args.battery - model.plan_drain(plan):.1f}% left of {args.battery:.0f}%")
+        fitted, left = model.fit_plan(plan, args.battery, args.reserve)
+        if fitted is not plan:
+            print(f"Below the {args.reserve:.0f}% reserve, truncated to {len(fitted.steps)} steps "
+                  f"with {left:.1f}% left:")
+            for step in fitted.steps:
+                print(f"  {step}")
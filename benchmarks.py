@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+#High Flyers benchmark suite
+#
+# Runs against local emulated drones (tello_emulator.py), so no drone or WiFi
+# is needed. Results are written as JSON so two commits can be compared:
+#   python benchmarks.py                        -> bench_results/<commit>.json
+#   python benchmarks.py --video flight.avi     -> also BackgroundFrameRead fps
+#   python benchmarks.py --compare bench_results/<old commit>.json
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from djitellopy import Tello
+from tello_emulator import EmulatedTello
+
+STATE_PACKET = ("mid:-1;x:0;y:0;z:0;mpry:0,0,0;pitch:1;roll:-2;yaw:37;vgx:0;vgy:0;vgz:0;"
+                "templ:60;temph:63;tof:96;h:80;bat:87;baro:101.37;time:12;"
+                "agx:-3.00;agy:1.00;agz:-999.00;\r\n")
+
+MISSION_PARAMS = {'floor': 50, 'ceiling': 300, 'min_takeoff_power': 10, 'min_operating_power': 5,
+                  'log_mode': 'queue'}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def bench_command_roundtrip(count=2000, host='127.0.0.2'):
+    """ Read commands through Tello.send_command_with_return as fast as the
+    emulator acks them. """
+    emulator = EmulatedTello(host).start()
+    drone = Tello(host)
+    drone.TIME_BTW_COMMANDS = 0
+    try:
+        drone.connect()
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(count):
+            sent = time.perf_counter()
+            drone.send_command_with_return('battery?')
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - start
+    finally:
+        drone.end()
+        emulator.stop()
+    return {
+        'commands': count,
+        'commands_per_second': count / elapsed,
+        'latency_p50_ms': percentile(latencies, 0.50) * 1000,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def bench_parse_state(count=50000):
+    """ Tello.parse_state on a full state packet. """
+    start = time.perf_counter()
+    for _ in range(count):
+        Tello.parse_state(STATE_PACKET)
+    elapsed = time.perf_counter() - start
+    return {'packets': count, 'packets_per_second': count / elapsed}
+
+
+def legacy_enforce_types(func):
+    """ The per-call checker djitellopy used before enforce_types compiled
+    its checks: zip every argument with the argspec and look up its hint. """
+    import inspect
+    import typing
+    from functools import wraps
+    spec = inspect.getfullargspec(func)
+
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        parameters = dict(zip(spec.args, args))
+        parameters.update(kwargs)
+        for name, value in parameters.items():
+            type_hint = spec.annotations.get(name)
+            if type_hint is None:
+                continue
+            actual = typing.get_origin(type_hint) or type_hint
+            if actual is typing.Union:
+                actual = typing.get_args(type_hint)
+            if not isinstance(value, actual):
+                raise TypeError(name)
+        return func(*args, **kwargs)
+
+    return decorated
+
+
+def bench_enforce_types(count=200000, host='127.0.0.6'):
+    """ Per-call overhead of @enforce_types on a send_rc_control-like call:
+    undecorated, with the legacy per-call checker and with the compiled
+    checks. Then the real Tello.get_height and Tello.get_state_field on a
+    drone connected to the emulator, as decorated in this build, and
+    whether get_state_field ended up wrapped. """
+    from djitellopy import enforce_types
+
+    def send_rc_control(self, left_right_velocity: int, forward_backward_velocity: int,
+                        up_down_velocity: int, yaw_velocity: int):
+        return
+
+    variants = {
+        'disabled': lambda func: func,
+        'legacy': legacy_enforce_types,
+        'compiled': enforce_types._decorate,
+    }
+    results = {}
+    for variant, decorate in variants.items():
+        method = decorate(send_rc_control)
+        start = time.perf_counter()
+        for _ in range(count):
+            method(None, 10, -10, 0, 30)
+        results[f"send_rc_control_{variant}_ns"] = (time.perf_counter() - start) / count * 1e9
+
+    emulator = EmulatedTello(host).start()
+    drone = Tello(host)
+    try:
+        drone.connect()
+        for call, method, args in (('get_height', drone.get_height, ()),
+                                   ('get_state_field', drone.get_state_field, ('h',))):
+            start = time.perf_counter()
+            for _ in range(count):
+                method(*args)
+            results[f"tello_{call}_ns"] = (time.perf_counter() - start) / count * 1e9
+    finally:
+        drone.end()
+        emulator.stop()
+    results['get_state_field_wrapped'] = hasattr(Tello.get_state_field, '__wrapped__')
+    return results
+
+
+def bench_frame_read(video, seconds=10.0):
+    """ BackgroundFrameRead decoding a recorded stream (any file or URL
+    OpenCV can open) for up to seconds. """
+    from types import SimpleNamespace
+    from djitellopy.tello import BackgroundFrameRead
+
+    holder = SimpleNamespace(cap=None)
+    start = time.perf_counter()
+    reader = BackgroundFrameRead(holder, video)
+    reader.start()
+    while not reader.stopped and time.perf_counter() - start < seconds:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    reader.stop()
+    holder.cap.release()
+    return {'video': video, 'frames': reader.frame_count, 'frames_per_second': reader.frame_count / elapsed}
+
+
+def hfm09(drone):
+    drone.takeoff()
+    drone.fly_to_coordinates(400, 300, True)
+    drone.fly_home()
+    drone.land()
+
+
+def hfm13(drone):
+    drone.takeoff()
+    drone.rotate_clockwise(90)
+    drone.fly_forward(30)
+    drone.rotate_clockwise(90)
+    drone.fly_forward(30)
+    drone.fly_home()
+    drone.land()
+
+
+def hfm13_queued(drone):
+    drone.takeoff()
+    drone.fly_sequence([('cw', 90), ('forward', 30), ('cw', 90), ('forward', 30)])
+    drone.fly_home()
+    drone.land()
+
+
+def bench_mission(script, host, time_scale=0.05):
+    """ A whole HFM-style mission through HighFlyers against the emulator,
+    timed from after connecting, so the wait for the first state packet is
+    not counted. With time_scale > 0 every move takes that share of its
+    real flying time, so the result shows what the commands themselves
+    cost; time_scale=0 acks at once and leaves only our own overhead. """
+    import HFMController
+
+    emulator = EmulatedTello(host, time_scale=time_scale).start()
+    try:
+        drone = HFMController.HighFlyers(Tello(host), dict(MISSION_PARAMS), logging.WARNING)
+        received = len(emulator.received)
+        start = time.perf_counter()
+        script(drone)
+        elapsed = time.perf_counter() - start
+        commands = len(emulator.received) - received
+        drone.disconnect()
+    finally:
+        emulator.stop()
+    return {'seconds': elapsed, 'sdk_commands': commands, 'time_scale': time_scale}
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import HFMController
+imported = time.perf_counter()
+print(imported - start, 'cv2' in sys.modules, 'yolo' in sys.modules)
+"""
+
+
+def bench_startup(count=5):
+    """ Time from a fresh interpreter to HFMController being importable,
+    which every mission script pays before takeoff. Runs in subprocesses
+    so nothing is already imported; also reports whether OpenCV and YOLO
+    were pulled in. """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [here, env.get('PYTHONPATH')]))
+    wall_times = []
+    import_times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT],
+                                         cwd=here, env=env, text=True)
+        wall_times.append(time.perf_counter() - start)
+        seconds, cv2_loaded, yolo_loaded = output.split()
+        import_times.append(float(seconds))
+    return {
+        'interpreter_start_to_exit_s': statistics.median(wall_times),
+        'import_hfmcontroller_s': statistics.median(import_times),
+        'cv2_imported': cv2_loaded == 'True',
+        'yolo_imported': yolo_loaded == 'True',
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(benchmarks):
+    """ Run each (name, function, args) and collect results. A benchmark that
+    cannot run here (e.g. OpenCV missing) is recorded as skipped. """
+    results = {}
+    for name, func, args in benchmarks:
+        print(f"{name} ...", end=' ', flush=True)
+        try:
+            results[name] = func(*args)
+            print("done")
+        except ImportError as excp:
+            results[name] = {'skipped': str(excp)}
+            print(f"skipped ({excp})")
+    return results
+
+
+def compare(old, new):
+    """ Print old -> new for every numeric metric both results share. """
+    for name, metrics in new['results'].items():
+        previous = old['results'].get(name, {})
+        for metric, value in metrics.items():
+            before = previous.get(metric)
+            if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                print(f"{name:<24} {metric:<26} {before:>12.3f} -> {value:>12.3f} ({value / before:5.2f}x)")
+    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="High Flyers benchmark suite")
+    parser.add_argument('--video', help="recorded stream for the BackgroundFrameRead benchmark")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, the median is kept")
+    parser.add_argument('--output', help="result file, default bench_results/<commit>.json")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    Tello.LOGGER.setLevel(logging.WARNING)
+    benchmarks = [
+        ('command_roundtrip', bench_command_roundtrip, ()),
+        ('startup', bench_startup, ()),
+        ('parse_state', bench_parse_state, ()),
+        ('enforce_types', bench_enforce_types, ()),
+        ('mission_hfm09', bench_mission, (hfm09, '127.0.0.3')),
+        ('mission_hfm13', bench_mission, (hfm13, '127.0.0.4')),
+        ('mission_hfm13_queued', bench_mission, (hfm13_queued, '127.0.0.5')),
+    ]
+    if args.video:
+        benchmarks.append(('frame_read', bench_frame_read, (args.video,)))
+
+    runs = [run(benchmarks) for _ in range(args.repeat)]
+    results = {}
+    for name in runs[0]:
+        merged = dict(runs[0][name])
+        for metric, value in runs[0][name].items():
+            if isinstance(value, float):
+                merged[metric] = statistics.median(r[name][metric] for r in runs)
+        results[name] = merged
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    output = args.output or os.path.join('bench_results', f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as old_file:
+            compare(json.load(old_file), report)
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+#High Flyers offline object detection over recorded flight videos
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+
+log = logging.getLogger('colt')
+
+################################################################################
+# Running YOLO in record_video costs frame rate in the air. This job runs it   #
+# after landing instead, over the recorded videos, on every core: each video   #
+# is cut into chunks of frames and a pool of worker processes, each with its   #
+# own copy of the network, detects objects in one chunk at a time. The parent  #
+# process is the only one writing to the SQLite file, one transaction per      #
+# chunk, and a chunk is marked done in the same transaction, so a job that is  #
+# stopped halfway picks up at the first chunk not done. When the recording     #
+# has a telemetry index (<video>.telemetry.json, see telemetry_index.py) each  #
+# detection is also stored with the pose and height of the drone at its frame. #
+################################################################################
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, frames INTEGER, fps REAL);
+CREATE TABLE IF NOT EXISTS chunks (
+    video_id INTEGER NOT NULL, start INTEGER NOT NULL, stop INTEGER NOT NULL, seconds REAL,
+    PRIMARY KEY (video_id, start));
+CREATE TABLE IF NOT EXISTS detections (
+    video_id INTEGER NOT NULL, frame INTEGER NOT NULL, t REAL NOT NULL, class TEXT NOT NULL,
+    confidence REAL NOT NULL, x INTEGER, y INTEGER, w INTEGER, h INTEGER,
+    pose_x REAL, pose_y REAL, pose_degrees REAL, altitude REAL);
+CREATE INDEX IF NOT EXISTS detections_frame ON detections (video_id, frame);
+CREATE INDEX IF NOT EXISTS detections_class ON detections (class);
+"""
+
+DNN_INPUT_SIZE = (416, 416)
+
+# Set in each worker process by load_worker_model
+worker_model = None
+
+
+def detect(image, model, confidence=0.5, threshold=0.3):
+    """
+    YOLO detections in one image with the network of the yolo helper.
+    Arguments
+        image:      BGR image
+        model:      (classifier, layers, labels) from yolo.load_yolo_deep_neural_network()
+        confidence: lowest class score kept
+        threshold:  overlap above which non-maximum suppression drops a box
+    Returns
+        list of (label, confidence, x, y, w, h) in pixels of image
+    """
+    import cv2
+    import numpy as np
+
+    classifier, layers, labels = model
+    height, width = image.shape[:2]
+    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, DNN_INPUT_SIZE, swapRB=True, crop=False)
+    classifier.setInput(blob)
+    outputs = np.vstack(classifier.forward(layers))
+    scores = outputs[:, 5:]
+    class_ids = scores.argmax(axis=1)
+    best = scores[np.arange(len(scores)), class_ids]
+    keep = best > confidence
+    if not keep.any():
+        return []
+    centres = outputs[keep, :4] * np.array([width, height, width, height])
+    boxes = np.column_stack((centres[:, 0] - centres[:, 2] / 2, centres[:, 1] - centres[:, 3] / 2,
+                             centres[:, 2], centres[:, 3])).astype(int).tolist()
+    kept_scores = best[keep].astype(float).tolist()
+    kept_ids = class_ids[keep].tolist()
+    chosen = cv2.dnn.NMSBoxes(boxes, kept_scores, confidence, threshold)
+    return [(labels[kept_ids[i]], kept_scores[i], *boxes[i]) for i in np.asarray(chosen).flatten()]
+
+
+def load_worker_model():
+    """ Pool initializer: one network per worker process, one thread each,
+    as the processes already use every core. """
+    global worker_model
+    import cv2
+    import yolo
+    cv2.setNumThreads(1)
+    worker_model = yolo.load_yolo_deep_neural_network()
+
+
+def detect_chunk(job):
+    """
+    Run in a worker: detect objects in frames start to stop of a video.
+    Returns
+        (video_id, start, stop, [(frame, label, confidence, x, y, w, h)], seconds)
+    """
+    import cv2
+
+    video_id, path, start, stop, every, confidence, threshold = job
+    began = time.perf_counter()
+    capture = cv2.VideoCapture(path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    found = []
+    for frame in range(start, stop):
+        if (frame - start) % every:
+            if not capture.grab():
+                break
+            continue
+        grabbed, image = capture.read()
+        if not grabbed:
+            break
+        found += [(frame,) + detection for detection in detect(image, worker_model, confidence, threshold)]
+    capture.release()
+    return video_id, start, stop, found, time.perf_counter() - began
+
+
+def register_video(db, path):
+    """ Add a video to the database. Returns (video_id, frames, fps). """
+    import cv2
+
+    path = os.path.abspath(path)
+    row = db.execute("SELECT id, frames, fps FROM videos WHERE path = ?", (path,)).fetchone()
+    if row:
+        return row
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise OSError(f"Cannot open {path}")
+    frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 20.0
+    capture.release()
+    with db:
+        cursor = db.execute("INSERT INTO videos (path, frames, fps) VALUES (?, ?, ?)", (path, frames, fps))
+    return cursor.lastrowid, frames, fps
+
+
+def telemetry_for(path):
+    """ The telemetry index saved next to a recording, or None. """
+    index_file = os.path.splitext(path)[0] + '.telemetry.json'
+    if not os.path.exists(index_file):
+        return None
+    from telemetry_index import TelemetryIndex
+    return TelemetryIndex.load(index_file)
+
+
+def run(videos, db_file, workers=None, chunk=200, every=1, confidence=0.5, threshold=0.3):
+    """
+    Detect objects in every frame of the videos not done yet.
+    Returns
+        (frames processed, seconds)
+    """
+    db = sqlite3.connect(db_file)
+    db.executescript(SCHEMA)
+    jobs = []
+    info = {}
+    for path in videos:
+        video_id, frames, fps = register_video(db, path)
+        done = {start for start, in db.execute("SELECT start FROM chunks WHERE video_id = ?", (video_id,))}
+        info[video_id] = (fps, telemetry_for(path))
+        jobs += [(video_id, os.path.abspath(path), start, min(start + chunk, frames), every, confidence, threshold)
+                 for start in range(0, frames, chunk) if start not in done]
+    if not jobs:
+        print("Nothing to do, every chunk is done")
+        return 0, 0.0
+    print(f"{len(jobs)} chunks of up to {chunk} frames to process on {workers or os.cpu_count()} workers")
+
+    processed = 0
+    began = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=load_worker_model) as pool:
+        for video_id, start, stop, found, seconds in pool.imap_unordered(detect_chunk, jobs):
+            fps, telemetry = info[video_id]
+            rows = []
+            for frame, label, score, x, y, w, h in found:
+                where = (telemetry.at_frame(frame) if telemetry is not None else None) or {}
+                pose = tuple(where.get(field) for field in ('pose_x', 'pose_y', 'pose_degrees', 'h'))
+                rows.append((video_id, frame, frame / fps, label, score, x, y, w, h) + pose)
+            with db:
+                db.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                db.execute("INSERT INTO chunks VALUES (?, ?, ?, ?)", (video_id, start, stop, seconds))
+            processed += (stop - start + every - 1) // every
+            elapsed = time.perf_counter() - began
+            print(f"video {video_id} frames {start}-{stop - 1}: {len(found)} detections, "
+                  f"{processed / elapsed:.1f} frames/s overall")
+    db.close()
+    return processed, time.perf_counter() - began
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Detect objects in recorded flight videos with YOLO, resumably")
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--db', default='detections.sqlite', help="SQLite file the detections go into")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, default one per core")
+    parser.add_argument('--chunk', type=int, default=200, help="frames per work unit")
+    parser.add_argument('--every', type=int, default=1, help="detect in every Nth frame")
+    parser.add_argument('--confidence', type=float, default=0.5)
+    parser.add_argument('--threshold', type=float, default=0.3)
+    args = parser.parse_args()
+
+    frames, seconds = run(args.videos, args.db, args.workers, args.chunk, args.every, args.confidence, args.threshold)
+    if frames:
+        print(f"{frames} frames in {seconds:.1f} s, {frames / seconds:.1f} frames/s")
@@ -1,4 +1,6 @@
 
+from threading import Lock
+
 ################################################################################
 # The final matrix parameters must specify either: (0) off, (r)ed, (b)lue, or  #
 # (p)urple. We use the * as a wildcard that allows the user to change colors   #
@@ -120,3 +122,98 @@ def capped_color(value):
     value = min(value, 255)
     value = max(value, 0)
     return value
+
+
+################################################################################
+# Building the SDK command for a pattern means a str.replace over 64 letters,  #
+# and the top LED needs three capped_color calls. Patterns like the logo and   #
+# the numbers never change, so compile them once and reuse the commands.       #
+################################################################################
+
+class CompiledPattern():
+    """ A flattened pattern whose SDK command is cached for every color. """
+
+    def __init__(self, flattened_pattern):
+        self.pattern = flattened_pattern
+        self.commands = {}
+
+    def command(self, color='b'):
+        """ Returns the 'EXT mled g ...' command with * replaced by color. """
+        color = color.lower()
+        if color not in ('r', 'p', 'b'):
+            color = 'b'
+        cmd = self.commands.get(color)
+        if cmd is None:
+            cmd = f"EXT mled g {self.pattern.replace('*', color)}"
+            self.commands[color] = cmd
+        return cmd
+
+
+compiled_patterns = {}
+
+def compile_pattern(flattened_pattern):
+    """ Returns the cached CompiledPattern for a flattened pattern. Passing a
+    CompiledPattern returns it unchanged. """
+    if isinstance(flattened_pattern, CompiledPattern):
+        return flattened_pattern
+    compiled = compiled_patterns.get(flattened_pattern)
+    if compiled is None:
+        compiled = CompiledPattern(flattened_pattern)
+        compiled_patterns[flattened_pattern] = compiled
+    return compiled
+
+
+led_commands = {}
+
+def led_command(red, green, blue):
+    """ Returns the cached 'EXT led r g b' command for a top LED color. """
+    key = (red, green, blue)
+    cmd = led_commands.get(key)
+    if cmd is None:
+        cmd = f"EXT led {capped_color(red)} {capped_color(green)} {capped_color(blue)}"
+        led_commands[key] = cmd
+    return cmd
+
+
+compiled_logo = compile_pattern(heads_up_flight_logo)
+compiled_key = compile_pattern(key)
+compiled_numbers = [compile_pattern(number) for number in numbers]
+compiled_off = compile_pattern("0" * 64)
+
+
+class DisplayState():
+    """
+    Remembers which matrix and top LED commands the drone is showing and
+    skips sending a command that would not change anything. Counts how many
+    sends were suppressed that way.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.matrix = None
+        self.led = None
+        self.sent_count = 0
+        self.suppressed_count = 0
+
+    def send(self, drone, cmd):
+        """ Send cmd unless the display already shows it. Returns True if the
+        command went to the drone. """
+        is_matrix = cmd.startswith("EXT mled")
+        with self.lock:
+            if cmd == (self.matrix if is_matrix else self.led):
+                self.suppressed_count += 1
+                return False
+            drone.send_control_command(cmd)
+            if is_matrix:
+                self.matrix = cmd
+            else:
+                self.led = cmd
+            self.sent_count += 1
+        return True
+
+    def forget(self):
+        """ Call when the display may have changed behind our back, e.g. after
+        reconnecting, so the next command is sent for sure. """
+        with self.lock:
+            self.matrix = None
+            self.led = None
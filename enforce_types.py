@@ -0,0 +1,113 @@
+"""Runtime type checks for the annotated arguments of Tello methods.
+
+Based on a StackOverflow post by @301_Moved_Permanently
+(https://stackoverflow.com/a/50622643), adapted to wrap all methods of a
+class by adding the decorator to the class itself.
+
+The checks are compiled once per method when the class is decorated: every
+annotated parameter becomes an (index, name, types) entry that is tested with
+a single isinstance call. Methods without checkable annotations are not
+wrapped at all; this includes the get_* telemetry accessors and the
+get_state_field they all read through, which is why that one is unannotated.
+
+Set the environment variable DJITELLOPY_ENFORCE_TYPES=0 before importing
+djitellopy to skip enforcement entirely (production mode).
+"""
+
+import inspect
+import os
+import typing
+from functools import wraps
+from typing import Optional, Tuple
+
+ENFORCE_TYPES = os.environ.get('DJITELLOPY_ENFORCE_TYPES', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+def _checkable_types(type_hint) -> Optional[Tuple[type, ...]]:
+    """Turn a type hint into a tuple usable with isinstance, or None if the
+    hint cannot be checked cheaply (Any, TypeVars, forward references...)
+    """
+    if type_hint is typing.Any or isinstance(type_hint, (typing.TypeVar, str)):
+        return None
+
+    origin = typing.get_origin(type_hint)
+    if origin is typing.Union:
+        types: Tuple[type, ...] = ()
+        for arg in typing.get_args(type_hint):
+            arg_types = _checkable_types(arg)
+            if arg_types is None:
+                return None
+            types += arg_types
+        return types
+    if origin is not None:
+        # Dict[str, int] -> dict, Type[int] -> type, ...
+        return (origin,) if isinstance(origin, type) else None
+    if isinstance(type_hint, type):
+        return (type_hint,)
+    return None
+
+
+def _compile_checks(func):
+    """Build the argument checks of one function.
+    Returns:
+        tuple of (position, name, types, type_hint), empty if nothing to check
+    """
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        return ()
+
+    annotations = getattr(func, '__annotations__', {})
+    checks = []
+    for position, (name, parameter) in enumerate(signature.parameters.items()):
+        if name not in annotations:
+            continue  # Assume un-annotated parameters can be any type
+        if parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+            continue
+        types = _checkable_types(annotations[name])
+        if types is not None:
+            checks.append((position, name, types, annotations[name]))
+    return tuple(checks)
+
+
+def _decorate(func):
+    checks = _compile_checks(func)
+    if not checks:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        count = len(args)
+        for position, name, types, type_hint in checks:
+            if position < count:
+                value = args[position]
+            elif name in kwargs:
+                value = kwargs[name]
+            else:
+                continue  # default value, not passed by the caller
+            if not isinstance(value, types):
+                raise TypeError("Unexpected type for '{}' (expected {} but found {})"
+                                .format(name, type_hint, type(value)))
+        return func(*args, **kwargs)
+
+    wrapper.__enforced_checks__ = checks
+    return wrapper
+
+
+def enforce_types(target):
+    """Class decorator adding type checks to all member functions
+    """
+    if not ENFORCE_TYPES:
+        return target
+
+    if not inspect.isclass(target):
+        return _decorate(target)
+
+    for name, member in list(vars(target).items()):
+        if isinstance(member, staticmethod):
+            setattr(target, name, staticmethod(_decorate(member.__func__)))
+        elif isinstance(member, classmethod):
+            setattr(target, name, classmethod(_decorate(member.__func__)))
+        elif inspect.isfunction(member):
+            setattr(target, name, _decorate(member))
+    return target
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#High Flyers background logging
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+################################################################################
+# Logging through FileHandler/StreamHandler writes (and flushes) in the thread #
+# that logged, which is the thread sending commands to the drone. In queue     #
+# mode the mission thread only puts the record on a queue and a background     #
+# listener formats and writes it. In jsonl mode each record becomes one JSON   #
+# object with its extra fields (command, latency, battery, x, y, ...) kept as  #
+# numbers, so a flight log can be loaded for analysis without parsing text.    #
+################################################################################
+
+TEXT_FORMAT = '%(asctime)s|%(levelname)s: %(message)s [%(name)s@%(filename)s.%(funcName)s.%(lineno)d]'
+TEXT_DATEFMT = '%Y-%m-%dT%H:%M:%S'
+CONSOLE_FORMAT = '%(levelname)s: %(message)s [%(name)s@%(filename)s.%(funcName)s.%(lineno)d]'
+
+# Attributes every LogRecord has; anything else on a record came from extra=
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """ Formats a record as one line of JSON including its extra fields. """
+
+    def format(self, record):
+        event = {
+            't': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                event[key] = value
+        if record.exc_info:
+            event['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            event['exc'] = record.exc_text
+        return json.dumps(event, separators=(',', ':'), default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves the message unformatted. The standard handler
+    formats every record before queueing it, which puts the formatting cost
+    back into the logging thread. Log arguments must therefore not be changed
+    after logging; the strings and numbers we log never are.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Traceback objects do not outlive the except block, render now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+listeners = {}
+# logname -> (the settings of its listener, the handlers it replaced)
+listener_setups = {}
+
+
+def start_queue_logging(logname, filename, structured=True, console_level=logging.WARNING,
+                        extra_loggers=('djitellopy',)):
+    """
+    Route a logger (and e.g. the djitellopy logger) through a queue to a file
+    and the console, written by a background thread. Calling it again for
+    the same logger with the same settings returns the running listener;
+    with other settings the running one is stopped and replaced.
+    Arguments
+        logname:       name of the mission logger, e.g. 'colt'
+        filename:      log file; JSON lines if structured is True
+        structured:    write JSON lines instead of text lines
+        console_level: only records at this level or higher go to stderr
+        extra_loggers: other loggers to move onto the same queue
+    Returns
+        The QueueListener; call stop_queue_logging() to flush it
+    """
+    settings = (filename, structured, console_level, tuple(extra_loggers))
+    if logname in listeners:
+        if listener_setups[logname][0] == settings:
+            return listeners[logname]
+        stop_queue_logging(logname)
+
+    file_handler = logging.FileHandler(filename, mode='a')
+    if structured:
+        file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT, TEXT_DATEFMT))
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                              respect_handler_level=True)
+    listener.start()
+    queue_handler = DeferredQueueHandler(log_queue)
+
+    replaced = []
+    for name in (logname,) + tuple(extra_loggers):
+        logger = logging.getLogger(name)
+        replaced.append((logger, list(logger.handlers), logger.propagate))
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+    logging.getLogger(logname).setLevel(logging.DEBUG)
+
+    listeners[logname] = listener
+    listener_setups[logname] = (settings, replaced)
+    atexit.register(stop_queue_logging, logname)
+    return listener
+
+
+def stop_queue_logging(logname):
+    """ Write out everything still queued, stop the background writer and
+    give the loggers back the handlers they had before. """
+    listener = listeners.pop(logname, None)
+    if listener is not None:
+        _, replaced = listener_setups.pop(logname)
+        for logger, handlers, propagate in replaced:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+            for handler in handlers:
+                logger.addHandler(handler)
+            logger.propagate = propagate
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    return
+
+
+def read_events(filename):
+    """ Load a JSON lines flight log as a list of dictionaries. """
+    with open(filename) as log_file:
+        return [json.loads(line) for line in log_file if line.strip()]
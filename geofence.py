@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+#High Flyers geofence
+
+import logging
+import math
+
+from maneuver_queue import GO_MIN, MANEUVER_LIMITS
+
+log = logging.getLogger('colt')
+
+################################################################################
+# Keeps the drone inside a circle or polygon on the floor and between a floor  #
+# and a ceiling. Every move is checked against the fence before its command is #
+# sent and shortened to end on the fence, so no round trip is spent on a move  #
+# that has to be undone. For each pose the reach along the four move          #
+# directions (forward, left, back, right) is worked out once and kept until    #
+# the pose changes; a circle costs one square root per direction, a polygon    #
+# one pass over its edges. From outside the fence only moves back in are       #
+# allowed, up to the far side.                                                 #
+#                                                                              #
+#   mission_params['geofence'] = {'polygon': [(-100, -300), (600, -300),       #
+#                                             (600, 300), (-100, 300)],        #
+#                                 'floor': 50, 'ceiling': 250}                 #
+#   mission_params['tether'] = 1000     # circle of 1000 cm round the start    #
+################################################################################
+
+# Direction of each move, counter clockwise from the drone's heading
+MOVE_ANGLES = {'forward': 0, 'left': 90, 'back': 180, 'right': 270}
+EPSILON = 1e-9
+
+
+class Geofence():
+    """ A horizontal boundary and optional floor and ceiling, in cm of the
+    mission frame (x along the start heading, y to its left). """
+
+    def __init__(self, circle=None, polygon=None, floor=None, ceiling=None):
+        """
+        Arguments
+            circle:  (x, y, radius) of a circular fence
+            polygon: list of (x, y) corners of a polygon fence, either order
+            floor:   lowest altitude in cm, None for no limit
+            ceiling: highest altitude in cm, None for no limit
+        """
+        if circle is not None and polygon is not None:
+            raise ValueError("A geofence is either a circle or a polygon, not both")
+        if polygon is not None and len(polygon) < 3:
+            raise ValueError("A polygon geofence needs at least 3 corners")
+        if circle is not None and circle[2] <= 0:
+            raise ValueError("A circular geofence needs a positive radius")
+        if floor is not None and ceiling is not None and floor >= ceiling:
+            raise ValueError(f"Geofence floor {floor} must be below its ceiling {ceiling}")
+        self.circle = tuple(circle) if circle is not None else None
+        # Each edge as its start point and the vector to its end
+        self.edges = None
+        if polygon is not None:
+            corners = [tuple(corner) for corner in polygon]
+            self.edges = [(ax, ay, bx - ax, by - ay)
+                          for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1])]
+        self.floor = floor
+        self.ceiling = ceiling
+        self.cached_pose = None
+        self.cached_limits = None
+
+
+    @classmethod
+    def from_params(cls, params):
+        """ The fence of mission_params['geofence'], a circle of radius
+        mission_params['tether'] round the start, or None. """
+        if params.get('geofence'):
+            return cls(**params['geofence'])
+        if params.get('tether'):
+            return cls(circle=(0, 0, params['tether']))
+        return None
+
+
+    def contains(self, x, y, altitude=None):
+        if altitude is not None:
+            if self.floor is not None and altitude < self.floor:
+                return False
+            if self.ceiling is not None and altitude > self.ceiling:
+                return False
+        if self.circle is not None:
+            cx, cy, radius = self.circle
+            return (x - cx) ** 2 + (y - cy) ** 2 <= radius ** 2
+        if self.edges is not None:
+            inside = False
+            for ax, ay, ex, ey in self.edges:
+                if (ay > y) != (ay + ey > y) and x < ax + ex * (y - ay) / ey:
+                    inside = not inside
+            return inside
+        return True
+
+
+    def crossings(self, x, y, dx, dy):
+        """ Distances along the unit vector (dx, dy) at which the ray from
+        (x, y) crosses the boundary, nearest first. """
+        if self.circle is not None:
+            cx, cy, radius = self.circle
+            fx, fy = x - cx, y - cy
+            b = fx * dx + fy * dy
+            discriminant = b * b - (fx * fx + fy * fy - radius * radius)
+            if discriminant < 0:
+                return []
+            root = math.sqrt(discriminant)
+            return [t for t in (-b - root, -b + root) if t > EPSILON]
+        found = []
+        for ax, ay, ex, ey in self.edges:
+            denominator = dx * ey - dy * ex
+            if abs(denominator) < EPSILON:
+                continue  # Parallel to the edge
+            wx, wy = ax - x, ay - y
+            t = (wx * ey - wy * ex) / denominator
+            s = (wx * dy - wy * dx) / denominator
+            if t > EPSILON and -EPSILON <= s <= 1 + EPSILON:
+                found.append(t)
+        return sorted(found)
+
+
+    def reach(self, x, y, degrees):
+        """ cm the drone can fly from (x, y) along a heading before it
+        leaves the fence, inf without a horizontal fence. """
+        if self.circle is None and self.edges is None:
+            return math.inf
+        heading = math.radians(degrees)
+        crossings = self.crossings(x, y, math.cos(heading), math.sin(heading))
+        if self.contains(x, y):
+            return crossings[0] if crossings else 0.0
+        # Outside: only a move back in, as far as the far side
+        return crossings[1] if len(crossings) > 1 else 0.0
+
+
+    def limits(self, x, y, degrees):
+        """ {move: cm allowed} for forward, left, back and right from a pose.
+        Worked out once per pose. """
+        pose = (x, y, degrees)
+        if pose != self.cached_pose:
+            self.cached_limits = {move: self.reach(x, y, degrees + angle) for move, angle in MOVE_ANGLES.items()}
+            self.cached_pose = pose
+        return self.cached_limits
+
+
+    def vertical(self, altitude):
+        """ (cm allowed down, cm allowed up) from an altitude. """
+        down = max(altitude - self.floor, 0) if self.floor is not None else math.inf
+        up = max(self.ceiling - altitude, 0) if self.ceiling is not None else math.inf
+        return down, up
+
+
+    def clip(self, maneuver, amount, pose, altitude=None):
+        """
+        Shorten a maneuver so it ends inside the fence.
+        Arguments
+            maneuver: as in maneuver_queue.MANEUVER_LIMITS, or 'go'
+            amount:   cm, degrees, or (x, y, z, speed) for go
+            pose:     (x, y, degrees) before the maneuver
+            altitude: cm before the maneuver, None skips the floor and ceiling
+        Returns
+            the amount to fly, or None if what is left is too short to fly
+        """
+        if maneuver in ('cw', 'ccw'):
+            return amount
+        if maneuver in MOVE_ANGLES:
+            allowed = self.limits(*pose)[maneuver]
+        elif maneuver in ('up', 'down'):
+            if altitude is None:
+                return amount
+            allowed = self.vertical(altitude)[0 if maneuver == 'down' else 1]
+        elif maneuver == 'go':
+            return self.clip_go(amount, pose, altitude)
+        else:
+            return amount
+        if amount <= allowed:
+            return amount
+        allowed = int(math.floor(allowed))
+        return allowed if allowed >= MANEUVER_LIMITS[maneuver][0] else None
+
+
+    def clip_go(self, amount, pose, altitude):
+        """ Scale a go down along its own line until it ends inside. """
+        x, y, z, speed = amount
+        scale = 1.0
+        length = math.hypot(x, y)
+        if length:
+            reach = self.reach(pose[0], pose[1], pose[2] + math.degrees(math.atan2(y, x)))
+            scale = min(scale, reach / length)
+        if z and altitude is not None:
+            down, up = self.vertical(altitude)
+            scale = min(scale, (up if z > 0 else down) / abs(z))
+        if scale >= 1:
+            return amount
+        clipped = tuple(int(value * scale) for value in (x, y, z))
+        if all(-GO_MIN <= value <= GO_MIN for value in clipped):
+            return None
+        return clipped + (speed,)
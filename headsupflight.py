@@ -2,6 +2,7 @@
 
 import dji_matrix as djim
 import logging
+from matrix_animation import MatrixAnimation
 
 
 #------------------------- BEGIN HeadsUpTello CLASS ----------------------------
@@ -32,6 +33,10 @@ class HeadsUpTello():
         self.drone = drone_baseobject
         self.drone.LOGGER.setLevel(debug_level)
 
+        # Tracks what the LED matrix and top LED show so unchanged frames are
+        # not sent again, see dji_matrix.DisplayState
+        self.display = djim.DisplayState()
+
         try:
             self.drone.connect()
             self.connected = True
@@ -73,19 +78,14 @@ class HeadsUpTello():
             blue:  0-255
         """
 
-        r = djim.capped_color(red)
-        g = djim.capped_color(green)
-        b = djim.capped_color(blue)
-        cmd = f"EXT led {r} {g} {b}"
-        self.drone.send_control_command(cmd)
+        self.display.send(self.drone, djim.led_command(red, green, blue))
         return
             
 
     def top_led_off(self):
         """ Turn off the top LED. """
 
-        cmd = f"EXT led 0 0 0"
-        self.drone.send_control_command(cmd)
+        self.display.send(self.drone, djim.led_command(0, 0, 0))
         return
 
 
@@ -97,25 +97,36 @@ class HeadsUpTello():
         row, and so on.
         
         Arguments
-            flattened_pattern: see examples in dji_matrix.py
+            flattened_pattern: see examples in dji_matrix.py, may also be a
+                               precompiled djim.CompiledPattern
             color:             'r', 'b', or 'p'
         """
 
-        if color.lower() not in "rpb":
-            color = 'b'
-        cmd = f"EXT mled g {flattened_pattern.replace('*', color.lower())}"
-        self.drone.send_control_command(cmd)
+        cmd = djim.compile_pattern(flattened_pattern).command(color)
+        self.display.send(self.drone, cmd)
         return
 
 
     def matrix_off(self):
         """ Turn off the 64 LED matrix. """
         
-        off_pattern = "0" * 64
-        self.matrix_pattern(off_pattern)
+        self.matrix_pattern(djim.compiled_off)
         return
 
 
+    def play_animation(self, frames, loop=False):
+        """
+        Play LED matrix / top LED frames in the background and return right
+        away. Call stop() on the returned object to end a looping animation.
+
+        Arguments
+            frames: list of frame dictionaries, see matrix_animation.py
+            loop:   repeat the frames until stopped
+        """
+
+        return MatrixAnimation(self.drone, frames, loop, self.display).start()
+
+
     def get_battery(self):
         """ Returns the drone's battery level as a percent. """
         return self.drone.get_battery()
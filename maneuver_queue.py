@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+#High Flyers maneuver queue
+
+import logging
+import math
+from threading import Event, Thread
+
+log = logging.getLogger('colt')
+
+################################################################################
+# A mission like HFM13 is a fixed list of moves and turns. Calling fly_forward #
+# and rotate_clockwise one after the other checks the battery, prints, logs    #
+# and updates the pose between every two commands. ManeuverQueue checks the    #
+# whole list before the first command goes out, works out the pose after each  #
+# step up front, and then sends each SDK command as soon as the drone acked    #
+# the one before. If a command fails the drone lands instead of carrying on    #
+# with a pose that is no longer true.                                          #
+################################################################################
+
+# Tello SDK limits per maneuver, (min, max)
+MANEUVER_LIMITS = {
+    'forward': (20, 500),
+    'back': (20, 500),
+    'left': (20, 500),
+    'right': (20, 500),
+    'up': (20, 500),
+    'down': (20, 500),
+    'cw': (1, 360),
+    'ccw': (1, 360),
+}
+
+# go x y z speed: each of x, y, z in -500..500, not all inside -20..20
+GO_LIMIT = 500
+GO_MIN = 20
+GO_SPEEDS = (10, 100)
+
+
+# Body axes of each move: (forward, left) per cm
+MOVE_AXES = {'forward': (1, 0), 'back': (-1, 0), 'left': (0, 1), 'right': (0, -1)}
+
+
+def body_to_world(forward, left, degrees):
+    """ Turn a move relative to the drone into the x, y of HighFlyers' pose
+    (x along heading 0, y to its left, degrees counter clockwise). """
+    heading = math.radians(degrees)
+    return (forward * math.cos(heading) - left * math.sin(heading),
+            forward * math.sin(heading) + left * math.cos(heading))
+
+
+def pose_after(maneuver, amount, x_distance, y_distance, curr_degrees):
+    """
+    Dead reckoning for one maneuver: the pose HighFlyers tracks after it.
+    Forward, left, back and right move along the heading +0, +90, +180 and
+    +270 degrees; go moves by its x (forward) and y (left).
+    Arguments
+        maneuver:     'forward', 'back', 'left', 'right', 'up', 'down', 'cw', 'ccw' or 'go'
+        amount:       cm for moves, degrees for rotations, (x, y, z, speed) for go
+        x_distance:   current x in cm
+        y_distance:   current y in cm
+        curr_degrees: current heading, counter clockwise from the start heading
+    Returns
+        (x_distance, y_distance, curr_degrees)
+    """
+    if maneuver == 'cw':
+        return x_distance, y_distance, (curr_degrees - amount) % 360
+    if maneuver == 'ccw':
+        return x_distance, y_distance, (curr_degrees + amount) % 360
+    if maneuver in ('up', 'down'):
+        return x_distance, y_distance, curr_degrees
+    if maneuver == 'go':
+        forward, left = amount[0], amount[1]
+    elif maneuver in MOVE_AXES:
+        forward, left = (axis * amount for axis in MOVE_AXES[maneuver])
+    else:
+        raise ValueError(f"Unknown maneuver '{maneuver}'")
+    dx, dy = body_to_world(forward, left, curr_degrees)
+    # Rounded so that e.g. cos(90) = 6e-17 leaves no crumbs in the pose
+    return x_distance + round(dx, 6), y_distance + round(dy, 6), curr_degrees
+
+
+def turn(from_degrees, to_degrees):
+    """ The shorter rotation from one heading to another, or None. """
+    ccw = int(round(to_degrees - from_degrees)) % 360
+    if ccw == 0:
+        return None
+    return ('ccw', ccw) if ccw <= 180 else ('cw', 360 - ccw)
+
+
+def path_maneuvers(points, x_distance, y_distance, curr_degrees):
+    """
+    Maneuvers that fly straight from a pose through a list of (x, y)
+    points: turn towards each, fly there in moves of at most 500 cm.
+    Points closer than the shortest move are skipped.
+    Returns
+        (maneuvers, heading at the end)
+    """
+    low, high = MANEUVER_LIMITS['forward']
+    maneuvers = []
+    heading = curr_degrees
+    for x, y in points:
+        dx, dy = x - x_distance, y - y_distance
+        distance = math.hypot(dx, dy)
+        if distance < low:
+            continue
+        bearing = math.degrees(math.atan2(dy, dx)) % 360
+        rotation = turn(heading, bearing)
+        if rotation is not None:
+            maneuvers.append(rotation)
+            heading = bearing
+        chunks = math.ceil(distance / high)
+        base, extra = divmod(int(round(distance)), chunks)
+        maneuvers += [('forward', base + 1 if i < extra else base) for i in range(chunks)]
+        x_distance, y_distance = x, y
+    return maneuvers, heading
+
+
+def home_maneuvers(x_distance, y_distance, curr_degrees):
+    """
+    Maneuvers that fly straight home from a pose and face the start heading
+    again: turn towards home, fly there in moves of at most 500 cm, turn
+    back to heading 0.
+    """
+    maneuvers, heading = path_maneuvers([(0, 0)], x_distance, y_distance, curr_degrees)
+    rotation = turn(heading, 0)
+    if rotation is not None:
+        maneuvers.append(rotation)
+    return maneuvers
+
+
+class Maneuver():
+    """ One validated step: the SDK command to send and the pose after it. """
+
+    def __init__(self, maneuver, amount, pose):
+        self.maneuver = maneuver
+        self.amount = amount
+        if maneuver == 'go':
+            self.command = "go {} {} {} {}".format(*(int(value) for value in amount))
+        else:
+            self.command = f"{maneuver} {int(amount)}"
+        self.pose = pose
+
+    def __repr__(self):
+        return f"Maneuver({self.command!r}, pose={self.pose})"
+
+
+class ManeuverQueue():
+    """
+    Flies a whole list of maneuvers on one HighFlyers object.
+
+    Example
+        queue = ManeuverQueue(drone, [('cw', 90), ('forward', 30), ('cw', 90)])
+        queue.start().wait()
+    """
+
+    def __init__(self, controller, maneuvers=(), abort_to_land=True):
+        """
+        Arguments
+            controller:    HighFlyers object to fly and whose pose to update
+            maneuvers:     list of (maneuver, amount) tuples, see MANEUVER_LIMITS;
+                           go takes (x, y, z, speed)
+            abort_to_land: land if a command fails or the battery runs low
+        """
+        self.controller = controller
+        self.abort_to_land = abort_to_land
+        self.steps = []
+        self.completed = 0
+        self.status = 'pending'
+        self.error = None
+        self.cancelled = Event()
+        self.finished = Event()
+        self.worker = None
+        # Altitude the queued moves get to, for the geofence floor and ceiling
+        self.altitude = controller.altitude() if controller.geofence is not None else None
+        self.extend(maneuvers)
+
+
+    def start_pose(self):
+        if self.steps:
+            return self.steps[-1].pose
+        return (self.controller.x_distance, self.controller.y_distance, self.controller.curr_degrees)
+
+
+    def add(self, maneuver, amount):
+        """ Validate one maneuver and queue it. Raises ValueError if the
+        Tello would refuse it, so nothing is flown for a bad mission. """
+        if self.status != 'pending':
+            raise RuntimeError("Cannot add maneuvers once the queue has started")
+        fence = self.controller.geofence
+        if fence is not None:
+            clipped = fence.clip(maneuver, amount, self.start_pose(), self.altitude)
+            if clipped is None:
+                log.warning("Geofence: queued %s %s would leave the fence, skipped", maneuver, amount)
+                return self
+            if clipped != amount:
+                log.warning("Geofence: queued %s %s shortened to %s", maneuver, amount, clipped)
+                amount = clipped
+        if maneuver == 'go':
+            x, y, z, speed = amount
+            if not all(-GO_LIMIT <= value <= GO_LIMIT for value in (x, y, z)):
+                raise ValueError(f"go {amount} is out of range, x, y and z must be -{GO_LIMIT}-{GO_LIMIT}")
+            if all(-GO_MIN <= value <= GO_MIN for value in (x, y, z)):
+                raise ValueError(f"go {amount} is too short, one of x, y, z must be beyond {GO_MIN}")
+            if not GO_SPEEDS[0] <= speed <= GO_SPEEDS[1]:
+                raise ValueError(f"go {amount} speed must be {GO_SPEEDS[0]}-{GO_SPEEDS[1]}")
+        elif maneuver not in MANEUVER_LIMITS:
+            raise ValueError(f"Unknown maneuver '{maneuver}', expected one of {', '.join(MANEUVER_LIMITS)}, go")
+        else:
+            low, high = MANEUVER_LIMITS[maneuver]
+            if not low <= int(amount) <= high:
+                raise ValueError(f"{maneuver} {amount} is out of range, must be {low}-{high}")
+        pose = pose_after(maneuver, amount, *self.start_pose())
+        self.steps.append(Maneuver(maneuver, amount, pose))
+        if self.altitude is not None:
+            if maneuver in ('up', 'down'):
+                self.altitude += amount if maneuver == 'up' else -amount
+            elif maneuver == 'go':
+                self.altitude += amount[2]
+        return self
+
+
+    def extend(self, maneuvers):
+        for maneuver, amount in maneuvers:
+            self.add(maneuver, amount)
+        return self
+
+
+    def final_pose(self):
+        """ The (x, y, degrees) the mission ends on if every step succeeds. """
+        return self.start_pose()
+
+
+    def start(self):
+        """ Fly the queue on a background thread. Returns self. """
+        self.worker = Thread(target=self.run, daemon=True, name='maneuver-queue')
+        self.worker.start()
+        return self
+
+
+    def wait(self, timeout=None):
+        """ Wait until the queue is done, cancelled, aborted or returning
+        home for the battery reserve. Returns True if every step was flown. """
+        self.finished.wait(timeout)
+        return self.status == 'done'
+
+
+    def cancel(self):
+        """ Stop after the maneuver in flight; the drone hovers where it is. """
+        self.cancelled.set()
+
+
+    def run(self):
+        """ Fly every step in order, blocking until done. Returns True if
+        every step was flown. """
+        controller = self.controller
+        drone = controller.drone
+        min_power = controller.params['min_operating_power']
+        self.status = 'running'
+        try:
+            for step in self.steps:
+                if self.cancelled.is_set():
+                    self.status = 'cancelled'
+                    log.warning("Maneuver queue cancelled after %s of %s steps", self.completed, len(self.steps))
+                    return False
+                if controller.should_return_home():
+                    self.status = 'returning'
+                    log.warning("Maneuver queue stopped after %s of %s steps to return home",
+                                self.completed, len(self.steps))
+                    controller.return_home()
+                    return False
+                # Cached state, no extra command between two maneuvers
+                if drone.get_battery() <= min_power:
+                    raise RuntimeError(f"Battery is below Min Operating Power before '{step.command}'")
+                if not drone.send_control_command(step.command):
+                    raise RuntimeError(f"Command '{step.command}' failed")
+                # Same as step.pose unless visual odometry corrects the pose
+                controller.update_pose(step.maneuver, step.amount)
+                self.completed += 1
+                controller.log_event("Queued maneuver %s done", step.command,
+                                     maneuver=step.maneuver, amount=step.amount)
+            self.status = 'done'
+            return True
+        except Exception as excp:
+            self.error = excp
+            self.status = 'aborted'
+            log.error("Maneuver queue aborted after %s of %s steps: %s", self.completed, len(self.steps), excp)
+            if self.abort_to_land:
+                self.land_safely()
+            return False
+        finally:
+            self.finished.set()
+
+
+    def land_safely(self):
+        try:
+            self.controller.drone.land()
+            log.warning("Drone landed after the maneuver queue aborted")
+        except Exception as excp:
+            log.error("Landing after abort failed: %s, trying emergency stop", excp)
+            self.controller.drone.emergency()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+#High Flyers LED animation engine
+
+import logging
+import time
+from threading import Event, Thread
+
+import dji_matrix as djim
+
+# Animation problems are reported through the mission logger, the display is
+# never allowed to stop the mission.
+log = logging.getLogger('colt')
+
+
+################################################################################
+# A frame is a dictionary describing what the display should look like and for #
+# how long. Every key except 'duration' is optional, a missing key leaves that #
+# part of the display as it was:                                               #
+#   {'pattern': djim.key, 'color': 'r', 'led': (0, 200, 50), 'duration': 1.0}  #
+# The pattern may also be a djim.CompiledPattern.                              #
+################################################################################
+
+def encode_frames(frames):
+    """
+    Turn a list of frames into a timeline of pre-built SDK commands. Returns a
+    list of (start offset in seconds, matrix command, led command) tuples and
+    the total duration. A command is None when the frame does not change it.
+    """
+    timeline = []
+    offset = 0.0
+    prev_matrix = None
+    prev_led = None
+    for frame in frames:
+        matrix_cmd = None
+        led_cmd = None
+        if 'pattern' in frame:
+            matrix_cmd = djim.compile_pattern(frame['pattern']).command(frame.get('color', 'b'))
+        if 'led' in frame:
+            led_cmd = djim.led_command(*frame['led'])
+
+        # Drop commands that repeat the previous frame, they would not change
+        # anything on the drone
+        if matrix_cmd == prev_matrix:
+            matrix_cmd = None
+        if led_cmd == prev_led:
+            led_cmd = None
+        prev_matrix = matrix_cmd or prev_matrix
+        prev_led = led_cmd or prev_led
+
+        timeline.append((offset, matrix_cmd, led_cmd))
+        offset += frame.get('duration', 0)
+    return timeline, offset
+
+
+class MatrixAnimation():
+    """
+    Plays a sequence of LED matrix / top LED frames from a background thread
+    so the mission thread can keep flying. All SDK commands are built before
+    the animation starts, and a frame that would not change the display is
+    not sent at all.
+    """
+
+    def __init__(self, drone, frames, loop=False, display=None):
+        """
+        Arguments
+            drone:   a djitellopy.Tello object (HighFlyers.drone)
+            frames:  list of frame dictionaries, see the comment above
+            loop:    start again from the first frame after the last one
+            display: the djim.DisplayState shared with the controller, so
+                     commands the display already shows are not resent
+        """
+        self.drone = drone
+        self.loop = loop
+        self.display = display if display is not None else djim.DisplayState()
+        self.timeline, self.duration = encode_frames(frames)
+        self.pending_matrix = None
+        self.pending_led = None
+        self.sent_count = 0
+        self.skipped_count = 0
+        self.stopped = Event()
+        self.worker = Thread(target=self.play, daemon=True)
+
+
+    def start(self):
+        """ Start playing the animation in the background. """
+        self.worker.start()
+        return self
+
+
+    def stop(self, wait=True):
+        """ Stop the animation. The display keeps showing the last frame. """
+        self.stopped.set()
+        if wait and self.worker.is_alive():
+            self.worker.join()
+        return
+
+
+    def wait(self, timeout=None):
+        """ Block until a non-looping animation has shown its last frame. """
+        self.worker.join(timeout)
+        return
+
+
+    def is_playing(self):
+        return self.worker.is_alive()
+
+
+    def play(self):
+        """ Thread worker that sends each frame at its start time. """
+        if not self.timeline:
+            return
+        start = time.perf_counter()
+        index = 0
+        while not self.stopped.is_set():
+            if index == len(self.timeline):
+                if not self.loop or self.duration <= 0:
+                    break
+                start += self.duration
+                index = 0
+
+            offset, matrix_cmd, led_cmd = self.timeline[index]
+            delay = start + offset - time.perf_counter()
+            if delay > 0 and self.stopped.wait(delay):
+                break
+
+            # If sending fell behind (e.g. a slow ack while the drone was busy)
+            # jump straight to the frame that should be showing by now
+            next_offset = self.timeline[index + 1][0] if index + 1 < len(self.timeline) else self.duration
+            if time.perf_counter() - start >= next_offset and index + 1 < len(self.timeline):
+                self.skipped_count += 1
+                self.catch_up(matrix_cmd, led_cmd)
+                index += 1
+                continue
+
+            self.show(matrix_cmd, led_cmd)
+            index += 1
+        return
+
+
+    def catch_up(self, matrix_cmd, led_cmd):
+        """ Carry a skipped frame's commands over to the next frame that is
+        shown, since the next frame only holds what changed. """
+        self.pending_matrix = matrix_cmd or self.pending_matrix
+        self.pending_led = led_cmd or self.pending_led
+
+
+    def show(self, matrix_cmd, led_cmd):
+        """ Send whatever part of the frame differs from the display. """
+        matrix_cmd = matrix_cmd or self.pending_matrix
+        led_cmd = led_cmd or self.pending_led
+        self.pending_matrix = None
+        self.pending_led = None
+
+        for cmd in (matrix_cmd, led_cmd):
+            if cmd is None:
+                continue
+            try:
+                if self.display.send(self.drone, cmd):
+                    self.sent_count += 1
+            except Exception as excp:
+                log.warning(f"LED animation could not send '{cmd}': {excp}")
+        return
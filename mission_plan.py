@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+#High Flyers mission plans
+
+import json
+import logging
+import math
+import os
+import time
+
+import peephole
+from maneuver_queue import MANEUVER_LIMITS, home_maneuvers, pose_after
+from peephole import split_distance
+
+log = logging.getLogger('colt')
+
+################################################################################
+# A mission file lists the maneuvers of a mission instead of a script calling  #
+# HighFlyers step by step. compile_mission() turns it into a MissionPlan:      #
+# every step is checked against the SDK limits, moves longer than the Tello    #
+# allows are split, and the runs of maneuvers between takeoff, land, home and  #
+# hover go through the peephole optimiser (merged moves, cancelled rotations,  #
+# go commands; 'use_go: false' keeps the original path). The plan predicts its #
+# command count and flight time, all before takeoff.                           #
+#                                                                              #
+#   name: HFM13                                                                #
+#   params: {floor: 100, ceiling: 300, min_takeoff_power: 25, ...}             #
+#   speed: 100                                                                 #
+#   steps:                                                                     #
+#     - takeoff                                                                #
+#     - cw: 90                                                                 #
+#     - forward: 30                                                            #
+#     - home                                                                   #
+#     - land                                                                   #
+################################################################################
+
+MOVES = ('forward', 'back', 'left', 'right', 'up', 'down')
+ROTATIONS = ('cw', 'ccw')
+# Steps run by HighFlyers itself rather than sent as one SDK command
+CONTROLLER_STEPS = ('takeoff', 'land', 'home', 'hover')
+# A Tello lands by itself after about 15 s without a command
+HOVER_KEEPALIVE_SECONDS = 5.0
+
+# Rough timings of a Tello for the flight time prediction
+DEFAULT_SPEED = 100         # cm/s
+ROTATION_SPEED = 90         # degrees/s
+TAKEOFF_SECONDS = 5.0
+LAND_SECONDS = 4.0
+COMMAND_OVERHEAD = 0.1      # seconds per SDK command for the ack round trip
+
+
+class MissionError(ValueError):
+    """ Raised when a mission file describes something the drone cannot fly. """
+
+
+class PlanStep():
+    """ One step of a compiled plan. source lists the mission file step
+    numbers it came from, for error messages and reports. """
+
+    def __init__(self, maneuver, amount=None, source=()):
+        self.maneuver = maneuver
+        self.amount = amount
+        self.source = tuple(source)
+
+    def __repr__(self):
+        if self.amount is None:
+            return f"PlanStep({self.maneuver!r})"
+        return f"PlanStep({self.maneuver!r}, {self.amount})"
+
+    def __eq__(self, other):
+        return (isinstance(other, PlanStep) and self.maneuver == other.maneuver
+                and self.amount == other.amount)
+
+
+class MissionPlan():
+    """ A compiled mission: params for HighFlyers plus the steps to fly. """
+
+    def __init__(self, name, params, steps, speed=DEFAULT_SPEED, source_count=0, saved=None):
+        self.name = name
+        self.params = params
+        self.steps = steps
+        self.speed = speed
+        self.source_count = source_count
+        self.saved = saved or {}
+
+
+    def command_count(self):
+        """ Predicted number of SDK commands, not counting retries. A 'home'
+        step is counted as up to two rotations and the moves to get home. """
+        return sum(step_commands(step, pose) for step, pose in self.walk())
+
+
+    def flight_seconds(self):
+        """ Predicted time from the first to the last step in seconds. """
+        seconds = 0.0
+        for step, pose in self.walk():
+            seconds += step_seconds(step, pose, self.speed)
+        return seconds
+
+
+    def walk(self):
+        """ Yields (step, pose before the step) with the dead-reckoned pose. """
+        pose = (0, 0, 0)
+        for step in self.steps:
+            yield step, pose
+            if step.maneuver not in CONTROLLER_STEPS:
+                pose = pose_after(step.maneuver, step.amount, *pose)
+            elif step.maneuver == 'home':
+                pose = (0, 0, 0)
+
+
+    def maneuvers(self):
+        """ The SDK maneuvers of the plan as (maneuver, amount) tuples. """
+        return [(step.maneuver, step.amount) for step in self.steps if step.maneuver not in CONTROLLER_STEPS]
+
+
+    def summary(self):
+        saved = peephole.commands_saved(self.saved)
+        details = peephole.details(self.saved)
+        return (f"Mission {self.name}: {self.source_count} steps compiled to {len(self.steps)}, "
+                f"{self.command_count()} SDK commands ({saved} saved{': ' + details if details else ''}), "
+                f"about {self.flight_seconds():.1f} s of flight")
+
+
+def step_commands(step, pose):
+    if step.maneuver == 'home':
+        return 2 + len(split_distance(math.hypot(pose[0], pose[1])))
+    if step.maneuver == 'hover':
+        return 0
+    return 1
+
+
+def step_distance(step, pose):
+    """ cm flown by one step; 'home' is the straight line back. """
+    if step.maneuver in MOVES:
+        return step.amount
+    if step.maneuver == 'go':
+        x, y, z = step.amount[:3]
+        return math.sqrt(x * x + y * y + z * z)
+    if step.maneuver == 'home':
+        return math.hypot(pose[0], pose[1])
+    return 0
+
+
+def step_degrees(step):
+    """ Degrees turned by one step; 'home' may turn up to a full circle. """
+    if step.maneuver in ROTATIONS:
+        return step.amount
+    if step.maneuver == 'home':
+        return 360
+    return 0
+
+
+def step_seconds(step, pose, speed):
+    if step.maneuver == 'takeoff':
+        return TAKEOFF_SECONDS
+    if step.maneuver == 'land':
+        return LAND_SECONDS
+    if step.maneuver == 'hover':
+        return step.amount
+    if step.maneuver in ROTATIONS:
+        return step.amount / ROTATION_SPEED + COMMAND_OVERHEAD
+    if step.maneuver in MOVES:
+        return step.amount / speed + COMMAND_OVERHEAD
+    if step.maneuver == 'go':
+        return step_distance(step, pose) / step.amount[3] + COMMAND_OVERHEAD
+    # home: turn towards the start, fly straight back, turn to heading 0
+    return (step_distance(step, pose) / speed + step_degrees(step) / ROTATION_SPEED
+            + step_commands(step, pose) * COMMAND_OVERHEAD)
+
+
+def parse_step(entry, number):
+    """ A mission file step is either a name ('land') or a one-entry
+    mapping ({'forward': 30}). Returns a PlanStep. """
+    if isinstance(entry, str):
+        maneuver, amount = entry, None
+    elif isinstance(entry, dict) and len(entry) == 1:
+        (maneuver, amount), = entry.items()
+    else:
+        raise MissionError(f"Step {number}: expected a maneuver name or {{maneuver: amount}}, got {entry!r}")
+
+    if maneuver in MOVES or maneuver in ROTATIONS:
+        if not isinstance(amount, (int, float)) or isinstance(amount, bool) or amount <= 0:
+            raise MissionError(f"Step {number}: {maneuver} needs a positive number, got {amount!r}")
+    elif maneuver == 'hover':
+        if not isinstance(amount, (int, float)) or amount < 0:
+            raise MissionError(f"Step {number}: hover needs a number of seconds, got {amount!r}")
+    elif maneuver in CONTROLLER_STEPS:
+        if amount is not None:
+            raise MissionError(f"Step {number}: {maneuver} takes no amount")
+    else:
+        known = ', '.join(MOVES + ROTATIONS + CONTROLLER_STEPS)
+        raise MissionError(f"Step {number}: unknown maneuver '{maneuver}', expected one of {known}")
+    return PlanStep(maneuver, amount, (number,))
+
+
+def check_limits(steps):
+    """ Split long moves and reject moves and rotations the SDK refuses. """
+    checked = []
+    for step in steps:
+        if step.maneuver not in MANEUVER_LIMITS:
+            checked.append(step)
+            continue
+        low, high = MANEUVER_LIMITS[step.maneuver]
+        amount = step.amount
+        if step.maneuver in ROTATIONS:
+            amount = amount % 360 if amount > high else amount
+            if amount == 0:
+                continue  # Whole turns
+        if amount < low:
+            raise MissionError(f"Step {', '.join(map(str, step.source))}: {step.maneuver} {step.amount} "
+                               f"is below the minimum of {low}")
+        if amount > high:
+            checked.extend(PlanStep(step.maneuver, chunk, step.source) for chunk in split_distance(amount))
+        else:
+            checked.append(PlanStep(step.maneuver, int(round(amount)), step.source))
+    return checked
+
+
+def optimise_steps(steps, use_go, speed):
+    """ Run the peephole optimiser over each run of SDK maneuvers. The
+    optimised steps keep the mission file step numbers of their run. """
+    optimised = []
+    saved = {}
+    run = []
+
+    def flush():
+        if run:
+            maneuvers, run_saved = peephole.optimise([(step.maneuver, step.amount) for step in run],
+                                                     use_go, speed)
+            source = tuple(number for step in run for number in step.source)
+            optimised.extend(PlanStep(maneuver, amount, source) for maneuver, amount in maneuvers)
+            for rewrite, count in run_saved.items():
+                saved[rewrite] = saved.get(rewrite, 0) + count
+            run.clear()
+
+    for step in steps:
+        if step.maneuver in CONTROLLER_STEPS:
+            flush()
+            optimised.append(step)
+        else:
+            run.append(step)
+    flush()
+    return optimised, saved
+
+
+def compile_mission(mission):
+    """
+    Compile a mission description (as loaded from a mission file) into a plan.
+    Arguments
+        mission: dictionary with 'steps' and optionally 'name', 'params',
+                 'speed' and 'use_go'
+    Returns
+        MissionPlan
+    Raises MissionError if the mission cannot be flown.
+    """
+    entries = mission.get('steps')
+    if not isinstance(entries, list) or not entries:
+        raise MissionError("A mission needs a non-empty list of steps")
+    speed = mission.get('speed', DEFAULT_SPEED)
+    steps = check_limits([parse_step(entry, number) for number, entry in enumerate(entries, 1)])
+    steps, saved = optimise_steps(steps, mission.get('use_go', True), speed)
+    plan = MissionPlan(mission.get('name', 'mission'), dict(mission.get('params', {})), steps,
+                       speed, len(entries), saved)
+    log.info("%s", plan.summary(), extra={'mission': plan.name, 'commands': plan.command_count(),
+                                          'predicted_seconds': plan.flight_seconds()})
+    return plan
+
+
+def load_mission(filename):
+    """ Read a .json, .yaml or .yml mission file and compile it. YAML files
+    need PyYAML. """
+    with open(filename) as mission_file:
+        if os.path.splitext(filename)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+            mission = yaml.safe_load(mission_file)
+        else:
+            mission = json.load(mission_file)
+    if not isinstance(mission, dict):
+        raise MissionError(f"{filename}: expected a mapping with a list of steps")
+    mission.setdefault('name', os.path.splitext(os.path.basename(filename))[0])
+    return compile_mission(mission)
+
+
+def fly_plan(controller, plan, abort_to_land=True):
+    """
+    Fly a compiled plan with a HighFlyers object. Runs of SDK maneuvers go
+    through one ManeuverQueue each, so they are sent back to back. 'home'
+    flies the straight line of maneuver_queue.home_maneuvers, the path the
+    plan's estimates assume. 'hover' sends a keepalive every
+    HOVER_KEEPALIVE_SECONDS so the drone does not land by itself. With
+    abort_to_land, a step that raises lands the drone before the error is
+    passed on.
+    Returns True if every step was flown.
+    """
+    pending = []
+
+    def flush():
+        if not pending:
+            return True
+        queue = controller.fly_sequence(list(pending), abort_to_land=abort_to_land)
+        pending.clear()
+        return queue.status == 'done'
+
+    def fly_home():
+        pending.extend(home_maneuvers(controller.x_distance, controller.y_distance, controller.curr_degrees))
+        return flush()
+
+    def hover(seconds):
+        end = time.perf_counter() + seconds
+        left = seconds
+        while left > HOVER_KEEPALIVE_SECONDS:
+            time.sleep(HOVER_KEEPALIVE_SECONDS)
+            controller.drone.send_keepalive()
+            left = end - time.perf_counter()
+        time.sleep(max(left, 0))
+
+    start = time.perf_counter()
+    for step in plan.steps:
+        if step.maneuver not in CONTROLLER_STEPS:
+            pending.append((step.maneuver, step.amount))
+            continue
+        if not flush():
+            return False
+        try:
+            if step.maneuver == 'takeoff':
+                controller.takeoff()
+            elif step.maneuver == 'land':
+                controller.land()
+            elif step.maneuver == 'home':
+                if not fly_home():
+                    return False
+            elif step.maneuver == 'hover':
+                hover(step.amount)
+        except Exception:
+            if abort_to_land:
+                log.error("Mission %s step %s failed, landing", plan.name, step.maneuver)
+                try:
+                    controller.drone.land()
+                except Exception as error:
+                    log.error("Landing after the failed step failed too: %s", error)
+            raise
+    done = flush()
+    log.info("Mission %s flown in %.1f s (predicted %.1f s)", plan.name,
+             time.perf_counter() - start, plan.flight_seconds())
+    return done
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile a High Flyers mission file and optionally fly it")
+    parser.add_argument('mission', help="mission file (.json, .yaml or .yml)")
+    parser.add_argument('--fly', action='store_true', help="connect to the drone and fly the plan")
+    parser.add_argument('--host', default='192.168.10.1', help="drone address")
+    args = parser.parse_args()
+
+    plan = load_mission(args.mission)
+    print(plan.summary())
+    for step in plan.steps:
+        amount = '' if step.amount is None else ' '.join(map(str, step.amount)) if step.maneuver == 'go' else step.amount
+        print(f"  {step.maneuver} {amount}")
+    if args.fly:
+        import HFMController
+        from djitellopy import Tello
+        drone = HFMController.HighFlyers(Tello(args.host), plan.params)
+        try:
+            fly_plan(drone, plan)
+        finally:
+            drone.disconnect()
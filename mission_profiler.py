@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+#High Flyers mission profiler
+
+import builtins
+import functools
+import inspect
+import threading
+import time
+
+################################################################################
+# The profiler wraps every public HighFlyers method and every Tello method on  #
+# one controller instance, plus time.sleep and print while it is attached,    #
+# and builds a tree of where the wall time went:                               #
+#   mission -> fly_forward -> pre_flight_check -> drone.get_battery ...        #
+# Nothing is wrapped until attach() is called, so a mission that does not ask  #
+# for profiling runs the original methods with zero overhead.                  #
+################################################################################
+
+
+class ProfileNode():
+    """ One entry of the timing tree: total wall time and number of calls. """
+
+    def __init__(self, name):
+        self.name = name
+        self.total = 0.0
+        self.count = 0
+        self.children = {}
+
+    @property
+    def self_time(self):
+        """ Time spent in this node that no child accounts for. """
+        return max(self.total - sum(child.total for child in self.children.values()), 0.0)
+
+
+class MissionProfiler():
+    """
+    Attach to a HighFlyers object to time every maneuver and SDK call it
+    makes. Export the result with report() or as collapsed stacks for
+    flamegraph.pl / speedscope with write_collapsed().
+    """
+
+    def __init__(self, name='mission'):
+        self.root = ProfileNode(name)
+        self.start_time = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.restore = []
+
+
+    def stack(self):
+        """ The call stack of the current thread. Threads other than the main
+        thread (e.g. record_video) get their own branch under the root. """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            thread = threading.current_thread()
+            if thread is threading.main_thread():
+                stack = [self.root]
+            else:
+                stack = [self.child(self.root, f"[thread {thread.name}]")]
+            self.local.stack = stack
+        return stack
+
+
+    def child(self, parent, name):
+        node = parent.children.get(name)
+        if node is None:
+            with self.lock:
+                node = parent.children.setdefault(name, ProfileNode(name))
+        return node
+
+
+    def timed(self, func, name):
+        """ Returns func wrapped so every call is timed under name. """
+        profiler = self
+
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            stack = profiler.stack()
+            node = profiler.child(stack[-1], name)
+            stack.append(node)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                node.total += time.perf_counter() - start
+                node.count += 1
+                stack.pop()
+
+        return profiled
+
+
+    def wrap_methods(self, obj, prefix=''):
+        """ Time every public method of one object (not its class); private
+        helpers would be counted again inside the public methods calling them. """
+        for name, member in inspect.getmembers(type(obj)):
+            if name.startswith('_') or not inspect.isfunction(member):
+                continue
+            bound = getattr(obj, name)
+            setattr(obj, name, self.timed(bound, prefix + name))
+            self.restore.append((obj, name, None))
+        return
+
+
+    def wrap_attribute(self, owner, name, label):
+        original = getattr(owner, name)
+        setattr(owner, name, self.timed(original, label))
+        self.restore.append((owner, name, original))
+        return
+
+
+    def attach(self, controller, sleeps=True, prints=True):
+        """
+        Start profiling a HighFlyers object and the drone it controls.
+        Arguments
+            controller: HighFlyers (or HeadsUpTello) object
+            sleeps:     also time time.sleep calls, e.g. command pacing
+            prints:     also time print calls
+        """
+        self.start_time = time.perf_counter()
+        self.wrap_methods(controller)
+        self.wrap_methods(controller.drone, 'drone.')
+        if sleeps:
+            self.wrap_attribute(time, 'sleep', 'sleep')
+        if prints:
+            self.wrap_attribute(builtins, 'print', 'print')
+        return self
+
+
+    def detach(self):
+        """ Put every wrapped method back and close the mission total. """
+        for owner, name, original in reversed(self.restore):
+            if original is None:
+                # Instance attribute shadowing the class method
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.restore = []
+        if self.start_time is not None:
+            self.root.total += time.perf_counter() - self.start_time
+            self.root.count += 1
+            self.start_time = None
+        return
+
+
+    def elapsed(self):
+        """ Wall time of the mission so far. """
+        running = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+        return self.root.total + running
+
+
+    def collapsed_stacks(self):
+        """
+        Yields 'mission;fly_forward;drone.move_forward 1234' lines with the
+        self time in microseconds: the collapsed stack format read by
+        flamegraph.pl, speedscope and inferno.
+        """
+        root_total = self.elapsed()
+        root_self = max(root_total - sum(child.total for child in self.root.children.values()), 0.0)
+        if root_self > 0:
+            yield f"{self.root.name} {int(root_self * 1e6)}"
+        pending = [(self.root.name, child) for child in self.root.children.values()]
+        while pending:
+            path, node = pending.pop()
+            path = f"{path};{node.name}"
+            micros = int(node.self_time * 1e6)
+            if micros > 0:
+                yield f"{path} {micros}"
+            pending.extend((path, child) for child in node.children.values())
+
+
+    def write_collapsed(self, filename):
+        with open(filename, 'w') as out:
+            for line in self.collapsed_stacks():
+                out.write(line + "\n")
+        return
+
+
+    def report(self, min_fraction=0.001):
+        """ Returns the timing tree as indented text, slowest first. Nodes
+        below min_fraction of the mission time are left out. """
+        total = self.elapsed() or 1e-9
+        lines = [f"{self.root.name}: {total:.3f}s"]
+
+        def walk(node, depth):
+            for child in sorted(node.children.values(), key=lambda c: -c.total):
+                if child.total / total < min_fraction:
+                    continue
+                lines.append(f"{'  ' * depth}{child.name}: {child.total:.3f}s "
+                             f"({100 * child.total / total:.1f}%, {child.count} calls, "
+                             f"self {child.self_time:.3f}s)")
+                walk(child, depth + 1)
+
+        walk(self.root, 1)
+        return "\n".join(lines)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#High Flyers occupancy grid map
+
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from threading import Lock
+
+import numpy as np
+
+from altitude_filter import TOF_INVALID, TOF_OFFSET
+
+log = logging.getLogger('colt')
+
+################################################################################
+# The ToF sensor looks straight down, so wherever the drone flies it measures  #
+# how far below it the first thing is. The fused altitude minus that distance  #
+# is the height of whatever is under the drone: about 0 over the floor, 75 cm  #
+# over a table. OccupancyGrid keeps, for every CELL_CM square of the floor,    #
+# the highest thing seen there and how many readings saw it (a 2.5-D map), in  #
+# one float32 array of shape (2, rows, columns). A* over the cells that are    #
+# too tall to fly over at the current altitude gives a route round them. The   #
+# cells next to them can be crossed but cost more, so a route keeps its        #
+# distance unless the start or goal is right next to an obstacle.              #
+#                                                                              #
+# A map is saved as a .npy file plus a .json sidecar with its origin and cell  #
+# size, and loaded by memory-mapping the .npy, so a big map costs nothing to   #
+# open and only the pages used are read.                                       #
+################################################################################
+
+CELL_CM = 20            # cm per side of a grid cell
+OBSTACLE_CM = 30        # lower things (carpet, ToF noise) are not obstacles
+MIN_HITS = 2            # readings needed before a cell counts as an obstacle
+CLEARANCE = 30          # cm kept above and beside obstacles
+NEAR_COST = 5           # cost of a cell within CLEARANCE of an obstacle, per cm of a free one
+HEIGHT, HITS = 0, 1     # layers of the grid array
+NEIGHBOURS = [(dr, dc, math.hypot(dr, dc)) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+def sidecar(filename):
+    return filename[:-4] + '.json' if filename.endswith('.npy') else filename + '.json'
+
+
+class OccupancyGrid():
+    """ 2.5-D map of obstacle heights in cm of the mission frame. """
+
+    def __init__(self, data, origin, cell=CELL_CM):
+        """
+        Arguments
+            data:   array of shape (2, rows, columns): the highest thing seen
+                    in each cell in cm and the number of readings
+            origin: (x, y) of the corner of cell (0, 0)
+            cell:   cm per side of a cell
+        """
+        self.data = data
+        self.origin = tuple(origin)
+        self.cell = cell
+
+
+    @classmethod
+    def create(cls, length=2000, width=2000, cell=CELL_CM, origin=None):
+        """ An empty map of length (x) by width (y) cm, centred on the
+        start unless origin is given. """
+        rows, columns = int(math.ceil(length / cell)), int(math.ceil(width / cell))
+        if origin is None:
+            origin = (-rows * cell / 2, -columns * cell / 2)
+        return cls(np.zeros((2, rows, columns), dtype=np.float32), origin, cell)
+
+
+    @classmethod
+    def load(cls, filename, writable=True):
+        """ Memory-map a saved map. With writable, changes stay in memory
+        until save(). """
+        with open(sidecar(filename)) as info_file:
+            info = json.load(info_file)
+        data = np.load(filename, mmap_mode='c' if writable else 'r')
+        return cls(data, info['origin'], info['cell'])
+
+
+    def save(self, filename):
+        """ Write the map to filename (.npy) and its sidecar. The map may be
+        memory-mapped from filename itself, so a copy is written to a new
+        file that then replaces the old one. """
+        temporary = filename + '.tmp'
+        with open(temporary, 'wb') as data_file:
+            np.save(data_file, np.array(self.data))
+        os.replace(temporary, filename)
+        with open(sidecar(filename), 'w') as info_file:
+            json.dump({'origin': self.origin, 'cell': self.cell, 'shape': list(self.data.shape[1:])},
+                      info_file)
+
+
+    @property
+    def shape(self):
+        return self.data.shape[1:]
+
+
+    def cells(self, x, y):
+        """ (rows, columns) of points; points off the map get -1. """
+        rows = np.floor((np.asarray(x, dtype=float) - self.origin[0]) / self.cell).astype(int)
+        columns = np.floor((np.asarray(y, dtype=float) - self.origin[1]) / self.cell).astype(int)
+        off = (rows < 0) | (rows >= self.shape[0]) | (columns < 0) | (columns >= self.shape[1])
+        return np.where(off, -1, rows), np.where(off, -1, columns)
+
+
+    def centre(self, row, column):
+        return (self.origin[0] + (row + 0.5) * self.cell, self.origin[1] + (column + 0.5) * self.cell)
+
+
+    def add_samples(self, x, y, heights):
+        """ Add obstacle heights seen at points (x, y); points off the map
+        are dropped. """
+        rows, columns = self.cells(x, y)
+        on_map = rows >= 0
+        rows, columns = rows[on_map], columns[on_map]
+        heights = np.maximum(np.asarray(heights, dtype=np.float32)[on_map], 0)
+        np.maximum.at(self.data[HEIGHT], (rows, columns), heights)
+        np.add.at(self.data[HITS], (rows, columns), 1)
+
+
+    def obstacles(self, altitude):
+        """ Cells too tall to clear at altitude cm. """
+        height, hits = self.data[HEIGHT], self.data[HITS]
+        return (hits >= MIN_HITS) & (height >= OBSTACLE_CM) & (height + CLEARANCE >= altitude)
+
+
+    def blocked(self, altitude):
+        """ obstacles() grown by CLEARANCE to the sides. """
+        tall = self.obstacles(altitude)
+        grown = tall.copy()
+        reach = int(math.ceil(CLEARANCE / self.cell))
+        rows, columns = tall.shape
+        for dr in range(-reach, reach + 1):
+            for dc in range(-reach, reach + 1):
+                if (dr or dc) and dr * dr + dc * dc <= reach * reach:
+                    grown[max(dr, 0):rows + min(dr, 0), max(dc, 0):columns + min(dc, 0)] |= \
+                        tall[max(-dr, 0):rows + min(-dr, 0), max(-dc, 0):columns + min(-dc, 0)]
+        return grown
+
+
+    def clear_line(self, blocked, start, end):
+        """ True if the straight line between two cells misses every
+        blocked cell. """
+        steps = int(max(abs(end[0] - start[0]), abs(end[1] - start[1])) * 2) + 1
+        for i in range(steps + 1):
+            row = int(round(start[0] + (end[0] - start[0]) * i / steps))
+            column = int(round(start[1] + (end[1] - start[1]) * i / steps))
+            if blocked[row, column]:
+                return False
+        return True
+
+
+    def route(self, start, goal, altitude):
+        """
+        Shortest route between two points round the obstacles known at an
+        altitude, by A* over the cells.
+        Arguments
+            start, goal: (x, y) in cm
+            altitude:    cm the route is flown at
+        Returns
+            list of (x, y) waypoints after start ending on goal, only the
+            corners of the route; [goal] if either end is off the map, None if
+            the obstacles cut the goal off
+        """
+        (start_row, goal_row), (start_column, goal_column) = self.cells((start[0], goal[0]), (start[1], goal[1]))
+        if start_row < 0 or goal_row < 0:
+            return [tuple(goal)]
+        tall = self.obstacles(altitude)
+        blocked = self.blocked(altitude)
+        source, target = (int(start_row), int(start_column)), (int(goal_row), int(goal_column))
+        tall[source] = tall[target] = False
+        if self.clear_line(blocked, source, target):
+            return [tuple(goal)]
+
+        rows, columns = blocked.shape
+        walls = tall.tolist()
+        near = blocked.tolist()
+
+        def estimate(cell):
+            dr, dc = abs(cell[0] - target[0]), abs(cell[1] - target[1])
+            return max(dr, dc) + (math.sqrt(2) - 1) * min(dr, dc)
+
+        costs = {source: 0.0}
+        parents = {source: None}
+        frontier = [(estimate(source), source)]
+        while frontier:
+            _, cell = heapq.heappop(frontier)
+            if cell == target:
+                break
+            for dr, dc, step in NEIGHBOURS:
+                row, column = cell[0] + dr, cell[1] + dc
+                if not (0 <= row < rows and 0 <= column < columns) or walls[row][column]:
+                    continue
+                if dr and dc and (walls[cell[0]][column] or walls[row][cell[1]]):
+                    continue  # No cutting corners of an obstacle
+                cost = costs[cell] + (step * NEAR_COST if near[row][column] else step)
+                if cost < costs.get((row, column), math.inf):
+                    costs[(row, column)] = cost
+                    parents[(row, column)] = cell
+                    heapq.heappush(frontier, (cost + estimate((row, column)), (row, column)))
+        if target not in parents:
+            return None
+
+        path = [target]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        path.reverse()
+        # Keep only the corners: the furthest cell still in a straight line of sight
+        corners = []
+        anchor = 0
+        while anchor < len(path) - 1:
+            furthest = len(path) - 1
+            while furthest > anchor + 1 and not self.clear_line(tall if near[path[anchor][0]][path[anchor][1]]
+                                                                 else blocked, path[anchor], path[furthest]):
+                furthest -= 1
+            corners.append(path[furthest])
+            anchor = furthest
+        return [self.centre(*cell) for cell in corners[:-1]] + [tuple(goal)]
+
+
+class MapRecorder():
+    """
+    Feeds a grid from the state packets while HighFlyers flies. Readings
+    are kept until the next pose update and then placed along the move by
+    their time, as the pose is only known at the ends of each move.
+    """
+
+    def __init__(self, controller, grid):
+        self.controller = controller
+        self.grid = grid
+        self.lock = Lock()
+        self.times = []
+        self.heights = []
+        self.last_pose_time = time.time()
+
+
+    def update(self, state, timestamp):
+        """ Tello state listener. """
+        tof = state.get('tof')
+        if not isinstance(tof, (int, float)) or not TOF_OFFSET <= tof < TOF_INVALID:
+            return
+        altitude = self.controller.altitude()
+        if altitude is None:
+            return
+        with self.lock:
+            self.times.append(timestamp)
+            self.heights.append(altitude - (tof - TOF_OFFSET))
+
+
+    def moved(self, before, after):
+        """ The pose went from before to after; place the readings since the
+        last pose update along the way. """
+        now = time.time()
+        with self.lock:
+            times, heights = self.times, self.heights
+            self.times, self.heights = [], []
+            start, self.last_pose_time = self.last_pose_time, now
+        if not times:
+            return
+        share = np.clip((np.asarray(times) - start) / max(now - start, 1e-6), 0.0, 1.0)
+        self.grid.add_samples(before[0] + share * (after[0] - before[0]),
+                              before[1] + share * (after[1] - before[1]), heights)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#High Flyers mission pad localisation
+
+import logging
+import math
+import time
+
+from maneuver_queue import GO_LIMIT, GO_MIN, GO_SPEEDS
+
+log = logging.getLogger('colt')
+
+################################################################################
+# A Tello EDU sees the numbered mission pads on the floor and reports in each  #
+# state packet which pad it is over (mid) and where it is relative to it (x,   #
+# y, z and the yaw in mpry). With the pads laid out at known coordinates, that #
+# is an absolute pose, so the drift of dead reckoning is thrown away after     #
+# every maneuver flown over a pad. Moves to a point near a visible pad are     #
+# sent as 'go x y z speed mN', which the drone flies to relative to the pad    #
+# itself, so repeated waypoint runs land on the same spots without any         #
+# corrective moves.                                                            #
+#                                                                              #
+# Pad coordinates are in HighFlyers' frame: x along the start heading, y to    #
+# its left, in cm, and the pad's yaw is the direction its rocket points,       #
+# counter clockwise from the start heading. A pad's own x axis points along    #
+# the rocket and its y axis to the left of it; Tello yaw angles are clockwise. #
+################################################################################
+
+PAD_IDS = range(1, 9)
+
+
+class PadMap():
+    """ Known mission pad positions and the pose maths between pads and
+    HighFlyers' frame. """
+
+    def __init__(self, pads):
+        """
+        Arguments
+            pads: {mid: (x, y, yaw)} or {mid: (x, y)}, as in
+                  mission_params['pads']; mids may be strings (JSON)
+        """
+        self.pads = {}
+        for mid, position in pads.items():
+            mid = int(mid)
+            if mid not in PAD_IDS:
+                raise ValueError(f"Mission pad {mid} does not exist, pads are numbered 1-8")
+            x, y, yaw = (tuple(position) + (0,))[:3]
+            heading = math.radians(yaw)
+            self.pads[mid] = (x, y, yaw % 360, math.cos(heading), math.sin(heading))
+
+
+    def __contains__(self, mid):
+        return mid in self.pads
+
+
+    def pose_from_state(self, state):
+        """
+        Absolute (x, y, degrees) from one state packet, or None if no known
+        pad is in view.
+        """
+        mid = state.get('mid', -1)
+        if mid not in self.pads:
+            return None
+        pad_x, pad_y, pad_yaw, cos, sin = self.pads[mid]
+        x, y = state.get('x', 0), state.get('y', 0)
+        try:
+            yaw = float(str(state.get('mpry', '0,0,0')).split(',')[2])
+        except (IndexError, ValueError):
+            return None
+        return (pad_x + cos * x - sin * y, pad_y + sin * x + cos * y, (pad_yaw - yaw) % 360)
+
+
+    def to_pad(self, mid, x, y):
+        """ A point of HighFlyers' frame relative to pad mid, in the pad's axes. """
+        pad_x, pad_y, _, cos, sin = self.pads[mid]
+        dx, dy = x - pad_x, y - pad_y
+        return cos * dx + sin * dy, -sin * dx + cos * dy
+
+
+def go_mid_arguments(pad_map, mid, x, y, z, speed):
+    """
+    Arguments of go_xyz_speed_mid for flying to (x, y) of HighFlyers' frame
+    at z cm above pad mid, or None if the SDK cannot fly it from that pad.
+    """
+    px, py = (int(round(value)) for value in pad_map.to_pad(mid, x, y))
+    z = int(round(z))
+    if not all(-GO_LIMIT <= value <= GO_LIMIT for value in (px, py, z)):
+        return None
+    if all(-GO_MIN <= value <= GO_MIN for value in (px, py, z)):
+        return None
+    return px, py, z, min(max(int(speed), GO_SPEEDS[0]), GO_SPEEDS[1]), mid
+
+
+def wait_for_fresh_state(channel, since, timeout=0.3):
+    """ Wait for a state packet received after since. Returns the state, or
+    None if none arrived in time. """
+    deadline = time.time() + timeout
+    while channel.state_timestamp <= since:
+        if time.time() >= deadline:
+            return None
+        time.sleep(0.01)
+    return channel.state
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+#High Flyers peephole optimiser for maneuver sequences
+
+import math
+
+from maneuver_queue import GO_LIMIT, GO_MIN, GO_SPEEDS, MANEUVER_LIMITS
+
+################################################################################
+# Looks at short windows of consecutive maneuvers and rewrites them into fewer #
+# SDK commands that end on the same pose, as maneuver_queue.pose_after tracks  #
+# it (test_peephole.py checks this):                                           #
+#   forward 100, forward 50, back 30      -> forward 120                       #
+#   cw 90, ccw 90                         -> (nothing)                         #
+#   cw 270                                -> ccw 90                            #
+#   forward 100, left 50, up 30           -> go 100 50 30 <speed>              #
+# A rewrite is only made if every resulting command is one the Tello accepts.  #
+# Moves are never merged across a rotation, as their direction depends on the  #
+# heading. Folding into go flies a straight line instead of an L, so it can be #
+# switched off for missions that must keep to the original path.               #
+################################################################################
+
+# Opposite directions on the same axis, with the sign of the first one
+AXES = {
+    'forward': ('x', 1), 'back': ('x', -1),
+    'left': ('y', 1), 'right': ('y', -1),
+    'up': ('z', 1), 'down': ('z', -1),
+}
+AXIS_MOVES = {'x': ('forward', 'back'), 'y': ('left', 'right'), 'z': ('up', 'down')}
+# Rewrites counted in commands saved; 'shorter rotations' only turns less
+COMMAND_SAVINGS = ('merged moves', 'cancelled rotations', 'folded into go')
+
+
+def split_distance(cm):
+    """ Split a distance into as few equal moves as the SDK allows. """
+    low, high = MANEUVER_LIMITS['forward']
+    if cm < low:
+        return []
+    chunks = math.ceil(cm / high)
+    base, extra = divmod(int(round(cm)), chunks)
+    return [base + 1 if i < extra else base for i in range(chunks)]
+
+
+def axis_moves(axis, net):
+    """ The fewest valid moves covering net cm along an axis, or None if the
+    remainder is too short to fly. """
+    if net == 0:
+        return []
+    positive, negative = AXIS_MOVES[axis]
+    chunks = split_distance(abs(net))
+    if not chunks:
+        return None
+    return [(positive if net > 0 else negative, chunk) for chunk in chunks]
+
+
+def merge_moves(maneuvers, saved):
+    """ Sum runs of moves along one axis into the fewest moves. """
+    result = []
+    i = 0
+    while i < len(maneuvers):
+        maneuver, amount = maneuvers[i]
+        if maneuver not in AXES:
+            result.append(maneuvers[i])
+            i += 1
+            continue
+        axis = AXES[maneuver][0]
+        j = i
+        net = 0
+        while j < len(maneuvers) and maneuvers[j][0] in AXES and AXES[maneuvers[j][0]][0] == axis:
+            net += AXES[maneuvers[j][0]][1] * maneuvers[j][1]
+            j += 1
+        replacement = axis_moves(axis, net)
+        if replacement is not None and len(replacement) < j - i:
+            result.extend(replacement)
+            saved['merged moves'] += (j - i) - len(replacement)
+        else:
+            result.extend(maneuvers[i:j])
+        i = j
+    return result
+
+
+def merge_rotations(maneuvers, saved):
+    """ Sum runs of rotations and turn the short way round. """
+    result = []
+    i = 0
+    while i < len(maneuvers):
+        if maneuvers[i][0] not in ('cw', 'ccw'):
+            result.append(maneuvers[i])
+            i += 1
+            continue
+        j = i
+        ccw = 0
+        while j < len(maneuvers) and maneuvers[j][0] in ('cw', 'ccw'):
+            ccw += maneuvers[j][1] if maneuvers[j][0] == 'ccw' else -maneuvers[j][1]
+            j += 1
+        ccw %= 360
+        if ccw == 0:
+            replacement = []
+        elif ccw < 180 or (ccw == 180 and maneuvers[i][0] == 'ccw'):
+            replacement = [('ccw', ccw)]
+        else:
+            replacement = [('cw', 360 - ccw)]
+        if len(replacement) < j - i:
+            saved['cancelled rotations'] += (j - i) - len(replacement)
+        elif replacement != maneuvers[i:j]:
+            saved['shorter rotations'] += 1
+        result.extend(replacement)
+        i = j
+    return result
+
+
+def fold_go(maneuvers, saved, speed):
+    """ Replace runs of moves on different axes by one go command. """
+    result = []
+    i = 0
+    while i < len(maneuvers):
+        offset = {'x': 0, 'y': 0, 'z': 0}
+        j = i
+        while j < len(maneuvers) and maneuvers[j][0] in AXES:
+            axis, sign = AXES[maneuvers[j][0]]
+            moved = offset[axis] + sign * maneuvers[j][1]
+            if abs(moved) > GO_LIMIT:
+                break
+            offset[axis] = moved
+            j += 1
+        if j - i >= 2 and any(abs(value) > GO_MIN for value in offset.values()):
+            result.append(('go', (offset['x'], offset['y'], offset['z'], speed)))
+            saved['folded into go'] += (j - i) - 1
+            i = j
+        else:
+            result.append(maneuvers[i])
+            i += 1
+    return result
+
+
+def optimise(maneuvers, use_go=True, go_speed=50):
+    """
+    Rewrite a list of (maneuver, amount) tuples into fewer SDK commands.
+    Arguments
+        maneuvers: as taken by ManeuverQueue, e.g. [('cw', 90), ('forward', 30)]
+        use_go:    fold moves on different axes into go commands
+        go_speed:  speed in cm/s for go commands
+    Returns
+        (optimised maneuvers, {rewrite: count}); the counts of
+        COMMAND_SAVINGS are commands saved, 'shorter rotations' counts
+        rotations that now turn the short way in as many commands
+    """
+    saved = {'merged moves': 0, 'cancelled rotations': 0, 'shorter rotations': 0, 'folded into go': 0}
+    go_speed = min(max(int(go_speed), GO_SPEEDS[0]), GO_SPEEDS[1])
+    result = [(maneuver, amount) for maneuver, amount in maneuvers]
+    # Cancelling rotations can bring moves next to each other, so repeat
+    while True:
+        before = len(result)
+        result = merge_moves(merge_rotations(result, saved), saved)
+        if len(result) == before:
+            break
+    if use_go:
+        result = fold_go(result, saved, go_speed)
+    return result, saved
+
+
+def commands_saved(saved):
+    """ Commands saved by the rewrites counted in saved. """
+    return sum(saved.get(rewrite, 0) for rewrite in COMMAND_SAVINGS)
+
+
+def details(saved):
+    """ The rewrites of saved as text, the ones saving commands first. """
+    savings = ", ".join(f"{saved[rewrite]} {rewrite}" for rewrite in COMMAND_SAVINGS if saved.get(rewrite))
+    others = ", ".join(f"{count} {rewrite}" for rewrite, count in saved.items()
+                       if count and rewrite not in COMMAND_SAVINGS)
+    return "; ".join(part for part in (savings, others) if part)
+
+
+def report(before, after, saved):
+    """ One line describing what optimise() did. """
+    text = details(saved)
+    return f"{before} -> {after} commands ({before - after} saved{': ' + text if text else ''})"
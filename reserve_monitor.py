@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#High Flyers return-to-home reserve monitor
+
+import logging
+from threading import Event, Thread
+
+from mission_plan import DEFAULT_SPEED, PlanStep
+
+log = logging.getLogger('colt')
+
+################################################################################
+# pre_flight_check lands where the drone is once the battery falls below       #
+# min_operating_power, which can be 80 m down the track. The monitor instead   #
+# works out, a couple of times a second, how much battery flying home from the #
+# current dead-reckoned pose and landing would take, and asks for a return as  #
+# soon as the battery left after that would drop below the reserve. It only    #
+# reads the battery from the cached state packets, so it adds no commands.     #
+################################################################################
+
+
+class ReturnedHome(Exception):
+    """ Raised by HighFlyers.pre_flight_check, on every call once the
+    monitor sent the drone home, and by fly_sequence when it stopped a
+    queue to go home, so the rest of the mission script does not run. """
+
+
+class ReserveMonitor():
+    """
+    Background check of battery against the cost of getting home.
+    Call start(); HighFlyers.pre_flight_check and ManeuverQueue look at
+    return_home before every maneuver.
+    """
+
+    def __init__(self, controller, battery_model=None, reserve=None, margin=2.0, interval=0.5):
+        """
+        Arguments
+            controller:    HighFlyers object whose pose and drone to watch
+            battery_model: battery_model.BatteryModel, default coefficients if None
+            reserve:       percent to land with, default mission_params['battery_reserve']
+                           or min_operating_power
+            margin:        extra percent to allow for the model being wrong
+            interval:      seconds between checks
+        """
+        if battery_model is None:
+            from battery_model import BatteryModel
+            battery_model = BatteryModel()
+        params = controller.params
+        self.controller = controller
+        self.model = battery_model
+        self.reserve = reserve if reserve is not None else params.get('battery_reserve', params['min_operating_power'])
+        self.margin = margin
+        self.interval = interval
+        self.speed = params.get('speed', DEFAULT_SPEED)
+        self.return_home = Event()
+        self.stopped = Event()
+        self.needed = 0.0
+        self.headroom = None
+        self.worker = Thread(target=self.run, daemon=True, name='reserve-monitor')
+
+
+    def start(self):
+        self.worker.start()
+        return self
+
+
+    def stop(self):
+        self.stopped.set()
+        if self.worker.is_alive():
+            self.worker.join()
+
+
+    def cost_home(self):
+        """ Predicted percent to fly home from the current pose and land. """
+        controller = self.controller
+        pose = (controller.x_distance, controller.y_distance, controller.curr_degrees)
+        needed = self.model.step_drain(PlanStep('land'), (0, 0, 0), self.speed)
+        if pose[:2] != (0, 0):
+            needed += self.model.step_drain(PlanStep('home'), pose, self.speed)
+        return needed
+
+
+    def check(self):
+        """ One check; sets return_home when it is time. Returns the percent
+        that would be left above reserve after getting home. """
+        battery = self.controller.drone.get_battery()
+        self.needed = self.cost_home()
+        self.headroom = battery - self.needed - self.reserve - self.margin
+        if self.headroom <= 0 and not self.return_home.is_set():
+            log.warning("Battery %s%% only just covers flying home (%.1f%%) and the %s%% reserve, returning home",
+                        battery, self.needed, self.reserve,
+                        extra={'battery': battery, 'needed': self.needed, 'reserve': self.reserve})
+            self.return_home.set()
+        return self.headroom
+
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as excp:
+                log.error("Reserve monitor check failed: %s", excp)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+#High Flyers startup sequence
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Event
+
+log = logging.getLogger('colt')
+
+################################################################################
+# Getting a drone in the air used to be strictly one thing after the other:    #
+# SDK handshake, wait for the first state packet, battery check, takeoff, and  #
+# for video missions only then streamon, the first frame and the YOLO model.   #
+# Most of that is waiting on the drone or on the disk, so StartupSequence runs #
+# every stage on its own thread as soon as the stages it needs are done. Only  #
+# the required stages hold up the mission; optional ones (video warm-up, model #
+# loading) keep going in the background while the drone takes off.            #
+################################################################################
+
+
+class StartupError(Exception):
+    """ Raised when a required startup stage failed or timed out. """
+
+
+class StartupStage():
+    """ One step of the startup sequence and when it ran. """
+
+    def __init__(self, name, func, after=(), required=True):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.required = required
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.done = Event()
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class StartupSequence():
+    """
+    Runs startup stages concurrently, each one once every stage listed in its
+    after= has succeeded. A stage whose dependency failed is skipped with the
+    same error. Once run() gives up (a required stage failed or timed out)
+    the sequence is cancelled: stages that have not started yet are skipped,
+    so takeoff cannot fire after startup has already failed.
+
+    Example
+        sequence = StartupSequence()
+        sequence.add_stage('handshake', drone.connect, wait_for_state=False)
+        sequence.add_stage('model', load_model, required=False)
+        sequence.add_stage('takeoff', drone.takeoff, after=['handshake'])
+        sequence.run(timeout=15)
+        print(sequence.report())
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.start_time = None
+        self.ready_time = None
+        self.pool = None
+        self.cancelled = Event()
+
+
+    def add_stage(self, name, func, *args, after=(), required=True, **kwargs):
+        """
+        Arguments
+            name:     label used in after= lists and in the report
+            func:     called as func(*args, **kwargs); its return value is kept
+            after:    names of the stages that must succeed first
+            required: run() waits for required stages only
+        """
+        for dependency in after:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+        self.stages[name] = StartupStage(name, lambda: func(*args, **kwargs), after, required)
+        return self
+
+
+    def run_stage(self, stage):
+        for dependency in stage.after:
+            needed = self.stages[dependency]
+            while not needed.done.wait(0.05) and not self.cancelled.is_set():
+                pass
+            if needed.error is not None:
+                stage.error = needed.error
+                stage.done.set()
+                return
+        if self.cancelled.is_set():
+            stage.error = StartupError(f"Stage '{stage.name}' cancelled, startup failed")
+            stage.done.set()
+            return
+        stage.started = time.perf_counter()
+        try:
+            stage.result = stage.func()
+        except Exception as excp:
+            stage.error = excp
+            log.warning("Startup stage %s failed: %s", stage.name, excp)
+        finally:
+            stage.finished = time.perf_counter()
+            stage.done.set()
+        log.debug("Startup stage %s finished in %.3f s", stage.name, stage.duration)
+
+
+    def run(self, timeout=None):
+        """
+        Start all stages and wait until the required ones are done. Optional
+        stages keep running; wait_for() or result() picks them up later.
+        Raises StartupError if a required stage failed or did not finish in
+        timeout seconds.
+        """
+        self.start_time = time.perf_counter()
+        self.pool = ThreadPoolExecutor(max_workers=max(len(self.stages), 1),
+                                       thread_name_prefix='startup')
+        futures = {name: self.pool.submit(self.run_stage, stage) for name, stage in self.stages.items()}
+        self.pool.shutdown(wait=False)
+
+        required = {futures[name] for name, stage in self.stages.items() if stage.required}
+        deadline = self.start_time + timeout if timeout is not None else None
+        pending = required
+        while pending:
+            remaining = max(deadline - time.perf_counter(), 0) if deadline is not None else None
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done or self.failed_stages():
+                break  # Timed out, or a failure means the rest cannot help
+        self.ready_time = time.perf_counter()
+
+        failed = self.failed_stages()
+        if failed or pending:
+            self.cancelled.set()
+        if failed:
+            summary = ", ".join(f"{stage.name}: {stage.error}" for stage in failed)
+            raise StartupError(f"Startup failed: {summary}") from failed[0].error
+        if pending:
+            late = [stage.name for stage in self.stages.values() if stage.required and not stage.done.is_set()]
+            raise StartupError(f"Startup stages did not finish in {timeout} s: {', '.join(late)}")
+        return self
+
+
+    def failed_stages(self):
+        """ Required stages that failed, not counting ones skipped because
+        a stage they depend on failed. """
+        return [stage for stage in self.stages.values()
+                if stage.required and stage.error is not None and stage.started is not None]
+
+
+    def wait_for(self, name, timeout=None):
+        """ Wait for one stage, e.g. an optional one. Returns True if it
+        finished without error. """
+        stage = self.stages[name]
+        return stage.done.wait(timeout) and stage.error is None
+
+
+    def result(self, name, timeout=None):
+        """ The return value of a stage, waiting for it if needed. Returns
+        None if it failed or is still running after timeout. """
+        if self.wait_for(name, timeout):
+            return self.stages[name].result
+        return None
+
+
+    def timings(self):
+        """
+        Returns a dictionary stage -> {'start', 'end', 'duration', 'status'}
+        with times in seconds since run() was called, plus 'ready', the time
+        when every required stage was done (time-to-airborne when takeoff is
+        a required stage).
+        """
+        report = {}
+        for name, stage in self.stages.items():
+            if stage.error is not None:
+                status = 'skipped' if stage.started is None else 'failed'
+            else:
+                status = 'done' if stage.done.is_set() else 'running'
+            report[name] = {
+                'start': stage.started - self.start_time if stage.started is not None else None,
+                'end': stage.finished - self.start_time if stage.finished is not None else None,
+                'duration': stage.duration,
+                'status': status,
+            }
+        report['ready'] = self.ready_time - self.start_time if self.ready_time is not None else None
+        return report
+
+
+    def report(self):
+        """ Returns the timings as a small text table. """
+        timings = self.timings()
+        lines = [f"{'stage':<12} {'start':>7} {'end':>7} {'took':>7}  status"]
+
+        def seconds(value):
+            return f"{value:7.3f}" if value is not None else f"{'-':>7}"
+
+        for name, stage in self.stages.items():
+            entry = timings[name]
+            flag = '' if stage.required else ' (optional)'
+            lines.append(f"{name:<12} {seconds(entry['start'])} {seconds(entry['end'])} "
+                         f"{seconds(entry['duration'])}  {entry['status']}{flag}")
+        lines.append(f"ready after {seconds(timings['ready']).strip()} s")
+        return "\n".join(lines)
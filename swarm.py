@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#High Flyers swarm controller
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Barrier
+
+from djitellopy import Tello
+
+log = logging.getLogger('colt')
+
+
+class SwarmError(Exception):
+    """ Raised when a swarm command failed on one or more drones. The results
+    of the drones that did succeed are kept in .results. """
+
+    def __init__(self, errors, results):
+        self.errors = errors
+        self.results = results
+        summary = ", ".join(f"{host}: {excp}" for host, excp in errors.items())
+        super().__init__(f"Swarm command failed on {len(errors)} drone(s): {summary}")
+
+
+def timeout_for(timeout, host):
+    """ A drone's response timeout from either one timeout for all drones
+    or a mapping host -> timeout; hosts missing from the mapping get the
+    Tello default. """
+    if isinstance(timeout, dict):
+        timeout = timeout.get(host, Tello.RESPONSE_TIMEOUT)
+    return float(timeout)
+
+
+class Swarm():
+    """
+    Commands several Tello drones at once. Every drone gets its own worker
+    thread, so a command goes out to all drones together and the swarm waits
+    for all acks concurrently instead of one drone after the other. All
+    djitellopy Tello objects already share one UDP socket and sort responses
+    by drone address, so no extra sockets are needed.
+    """
+
+    def __init__(self, drones):
+        """
+        Arguments
+            drones: list of djitellopy.Tello objects
+        """
+        self.drones = list(drones)
+        self.hosts = [drone.address[0] for drone in self.drones]
+        self.pool = ThreadPoolExecutor(max_workers=max(len(self.drones), 1),
+                                       thread_name_prefix='swarm')
+
+
+    @classmethod
+    def from_hosts(cls, hosts, retry_count=Tello.RETRY_COUNT):
+        """ Build a swarm from a list of drone IP addresses. """
+        return cls([Tello(host, retry_count) for host in hosts])
+
+
+    def __len__(self):
+        return len(self.drones)
+
+
+    def run(self, func, *args):
+        """
+        Call func(drone, *args) for every drone in parallel and wait until all
+        of them return. Returns a dictionary host -> return value. If any drone
+        raised, the others are still allowed to finish before SwarmError is
+        raised with every failure.
+        """
+        return self.run_each({host: (func,) + args for host in self.hosts})
+
+
+    def run_each(self, calls):
+        """
+        Call a different function on each drone in parallel. calls maps a host
+        to a (func, *args) tuple; func is called as func(drone, *args). Drones
+        missing from calls sit this one out.
+        """
+        futures = {}
+        for drone, host in zip(self.drones, self.hosts):
+            if host in calls:
+                func, *args = calls[host]
+                futures[host] = self.pool.submit(func, drone, *args)
+        wait(futures.values())
+
+        results = {}
+        errors = {}
+        for host, future in futures.items():
+            excp = future.exception()
+            if excp is None:
+                results[host] = future.result()
+            else:
+                errors[host] = excp
+        if errors:
+            raise SwarmError(errors, results)
+        return results
+
+
+    def send_command(self, command, timeout=Tello.RESPONSE_TIMEOUT):
+        """ Send the same command to every drone and return each response
+        text. timeout is seconds for every drone on its own, or a mapping
+        host -> seconds, e.g. longer for a drone further away. """
+        return self.run_each({host: (Tello.send_command_with_return, command, timeout_for(timeout, host))
+                              for host in self.hosts})
+
+
+    def send_commands(self, commands, timeout=Tello.RESPONSE_TIMEOUT):
+        """ Send a different command to each drone, commands maps host ->
+        command. timeout as for send_command. Returns each response text. """
+        return self.run_each({host: (Tello.send_command_with_return, command, timeout_for(timeout, host))
+                              for host, command in commands.items()})
+
+
+    def send_control_command(self, command, timeout=Tello.RESPONSE_TIMEOUT):
+        """ Send the same control command to every drone, retrying like
+        Tello.send_control_command. timeout as for send_command. Raises
+        SwarmError if any drone fails. """
+        return self.run_each({host: (Tello.send_control_command, command, timeout_for(timeout, host))
+                              for host in self.hosts})
+
+
+    def barrier(self, timeout=None):
+        """ Returns a barrier sized for this swarm. Pass it to per-drone
+        functions that must line up before a step, see run_synchronized. """
+        return Barrier(len(self.drones), timeout=timeout)
+
+
+    def run_synchronized(self, func, *args, timeout=None):
+        """
+        Like run, but every drone waits until all drones are ready before
+        func is called, so a synchronised move starts at the same moment on
+        every drone instead of as soon as each worker happens to get going.
+        """
+        barrier = self.barrier(timeout)
+
+        def synchronized(drone, *args):
+            barrier.wait()
+            return func(drone, *args)
+
+        return self.run(synchronized, *args)
+
+
+    def connect(self):
+        """ Put every drone into SDK mode and wait for its state packets. """
+        return self.run(Tello.connect)
+
+
+    def takeoff(self):
+        return self.run_synchronized(Tello.takeoff)
+
+
+    def land(self):
+        return self.run_synchronized(Tello.land)
+
+
+    def move(self, direction, x):
+        """ Move every drone in the same direction at the same time. """
+        return self.run_synchronized(Tello.move, direction, x)
+
+
+    def get_batteries(self):
+        """ Returns host -> battery percentage from the cached state. """
+        return {host: drone.get_battery() for drone, host in zip(self.drones, self.hosts)}
+
+
+    def end(self):
+        """ Land any flying drones and release the worker threads. """
+        try:
+            self.run(Tello.end)
+        except SwarmError as excp:
+            log.warning(f"Swarm did not end cleanly: {excp}")
+        self.pool.shutdown(wait=True)
+        return
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+#High Flyers video to telemetry time alignment
+
+import bisect
+import json
+import logging
+from threading import Lock
+
+log = logging.getLogger('colt')
+
+################################################################################
+# Video frames and state packets arrive on different threads at different      #
+# rates (about 30 and 10 a second), so a detection in frame N cannot be placed #
+# in space by looking at "the state at the time". TelemetryIndex keeps the     #
+# receive time of every state packet with the attitude, heights and the pose   #
+# HighFlyers tracked at that moment, and the receive time of every frame       #
+# written to the recording. The telemetry at frame N is then two binary        #
+# searches and a linear interpolation between the packets either side, with    #
+# headings interpolated the short way round. Saved as JSON next to the video,  #
+# so detections can be geotagged after the flight without reading any logs.    #
+################################################################################
+
+# State fields kept, the pose fields come from HighFlyers
+STATE_FIELDS = ('pitch', 'roll', 'yaw', 'h', 'tof', 'baro', 'vgx', 'vgy', 'vgz', 'bat')
+POSE_FIELDS = ('pose_x', 'pose_y', 'pose_degrees')
+# Interpolated as angles in degrees
+ANGLE_FIELDS = ('yaw', 'pose_degrees')
+
+
+def interpolate(first, second, share, angle=False):
+    if first is None or second is None:
+        return first if share < 0.5 else second
+    if angle:
+        return (first + ((second - first + 180) % 360 - 180) * share) % 360
+    return first + (second - first) * share
+
+
+class TelemetryIndex():
+    """
+    Receive times of state packets and video frames, for looking up the
+    telemetry at a frame. Feed it with record_state (a Tello state
+    listener) and add_frame.
+    """
+
+    def __init__(self, controller=None, fields=STATE_FIELDS):
+        """
+        Arguments
+            controller: HighFlyers object whose pose to record with each
+                        packet, None for the state fields only
+            fields:     state fields to keep
+        """
+        self.controller = controller
+        self.state_fields = tuple(fields)
+        self.fields = self.state_fields + (POSE_FIELDS if controller is not None else ())
+        self.lock = Lock()
+        self.state_times = []
+        self.rows = []
+        self.frame_numbers = []
+        self.frame_times = []
+
+
+    def record_state(self, state, timestamp):
+        """ Tello state listener. """
+        row = [state.get(field) for field in self.state_fields]
+        if self.controller is not None:
+            row += [self.controller.x_distance, self.controller.y_distance, self.controller.curr_degrees]
+        with self.lock:
+            # Packets can be handed over slightly out of order
+            position = bisect.bisect_right(self.state_times, timestamp)
+            self.state_times.insert(position, timestamp)
+            self.rows.insert(position, row)
+
+
+    def add_frame(self, number, timestamp):
+        """ Frame number of the recording was received at timestamp. """
+        with self.lock:
+            if self.frame_numbers and number <= self.frame_numbers[-1]:
+                position = bisect.bisect_left(self.frame_numbers, number)
+                if position < len(self.frame_numbers) and self.frame_numbers[position] == number:
+                    self.frame_times[position] = timestamp
+                    return
+                self.frame_numbers.insert(position, number)
+                self.frame_times.insert(position, timestamp)
+            else:
+                self.frame_numbers.append(number)
+                self.frame_times.append(timestamp)
+
+
+    def frame_time(self, number):
+        """ Receive time of a frame, interpolated between recorded frames,
+        or None without any. """
+        with self.lock:
+            numbers, times = self.frame_numbers, self.frame_times
+            if not numbers:
+                return None
+            position = bisect.bisect_left(numbers, number)
+            if position < len(numbers) and numbers[position] == number:
+                return times[position]
+            if position == 0:
+                return times[0]
+            if position == len(numbers):
+                return times[-1]
+            share = (number - numbers[position - 1]) / (numbers[position] - numbers[position - 1])
+            return interpolate(times[position - 1], times[position], share)
+
+
+    def at(self, timestamp):
+        """
+        Telemetry at a moment, interpolated between the packets either side
+        of it; before the first or after the last packet that packet.
+        Returns
+            dictionary of field: value with 't', or None without packets
+        """
+        with self.lock:
+            times = self.state_times
+            if not times:
+                return None
+            position = bisect.bisect_right(times, timestamp)
+            if position == 0:
+                values = self.rows[0]
+            elif position == len(times):
+                values = self.rows[-1]
+            else:
+                before, after = times[position - 1], times[position]
+                share = (timestamp - before) / (after - before) if after > before else 0.0
+                first, second = self.rows[position - 1], self.rows[position]
+                values = [interpolate(a, b, share, field in ANGLE_FIELDS)
+                          for field, a, b in zip(self.fields, first, second)]
+        telemetry = dict(zip(self.fields, values))
+        telemetry['t'] = timestamp
+        return telemetry
+
+
+    def at_frame(self, number):
+        """ Telemetry when frame number of the recording was received, or
+        None. """
+        timestamp = self.frame_time(number)
+        return None if timestamp is None else self.at(timestamp)
+
+
+    def save(self, filename):
+        with self.lock:
+            data = {'fields': self.fields, 'state_times': self.state_times, 'rows': self.rows,
+                    'frame_numbers': self.frame_numbers, 'frame_times': self.frame_times}
+        with open(filename, 'w') as index_file:
+            json.dump(data, index_file)
+        log.info("Telemetry index of %s frames and %s state packets saved to %s",
+                 len(data['frame_numbers']), len(data['state_times']), filename)
+
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as index_file:
+            data = json.load(index_file)
+        index = cls(fields=data['fields'])
+        index.state_times = data['state_times']
+        index.rows = data['rows']
+        index.frame_numbers = data['frame_numbers']
+        index.frame_times = data['frame_times']
+        return index
@@ -2,20 +2,28 @@
 """
 
 # coding=utf-8
+import bisect
 import logging
 import socket
+import math
 import time
-from threading import Thread
-from typing import Optional, Union, Type, Dict
+from queue import Empty, SimpleQueue
+from threading import Event, Lock, Thread, current_thread
+from typing import Callable, Optional, Union, Type, Dict, TYPE_CHECKING
 
-import cv2 # type: ignore
 from .enforce_types import enforce_types
 
 
 threads_initialized = False
-drones: Optional[dict] = {}
+threads_lock = Lock()
+drones: Dict[str, 'DroneChannel'] = {}
 client_socket: socket.socket
 
+# OpenCV is only imported once video is used, see get_video_capture and
+# BackgroundFrameRead, so connecting and flying do not pay for it
+if TYPE_CHECKING:
+    import cv2  # type: ignore
+
 
 @enforce_types
 class Tello:
@@ -30,6 +38,7 @@ class Tello:
     FRAME_GRAB_TIMEOUT = 3
     TIME_BTW_COMMANDS = 0.1  # in seconds
     TIME_BTW_RC_CONTROL_COMMANDS = 0.001  # in seconds
+    RC_CONTROL_RATE = 20  # in Hz, used by the background rc sender
     RETRY_COUNT = 3  # number of retries after a failed command
     TELLO_IP = '192.168.10.1'  # Tello IP address
 
@@ -55,7 +64,8 @@ class Tello:
     CAMERA_FORWARD = 0
     CAMERA_DOWNWARD = 1
 
-    # Set up logger
+    # Set up logger. Messages use %-style arguments so they are only formatted
+    # when a handler actually emits them.
     HANDLER = logging.StreamHandler()
     FORMATTER = logging.Formatter('[%(levelname)s] %(filename)s - %(lineno)d - %(message)s')
     HANDLER.setFormatter(FORMATTER)
@@ -84,8 +94,10 @@ class Tello:
     state_field_converters.update({key : float for key in FLOAT_STATE_FIELDS})
 
     # VideoCapture object
-    cap: Optional[cv2.VideoCapture] = None
+    cap: Optional['cv2.VideoCapture'] = None
     background_frame_read: Optional['BackgroundFrameRead'] = None
+    rc_sender: Optional['RCControlSender'] = None
+    stats_dump_stop: Optional[Event] = None
 
     stream_on = False
     is_flying = False
@@ -94,42 +106,57 @@ class Tello:
                  host=TELLO_IP,
                  retry_count=RETRY_COUNT):
 
-        global threads_initialized, client_socket, drones
-
         self.address = (host, Tello.CONTROL_UDP_PORT)
         self.stream_on = False
         self.retry_count = retry_count
         self.last_received_command_timestamp = time.time()
         self.last_rc_control_timestamp = time.time()
+        # Only one command may wait for a response at a time, otherwise a
+        # background thread (e.g. an LED animation) could take our ack
+        self.command_lock = Lock()
+        self.command_stats = CommandStats()
+
+        with threads_lock:
+            if not threads_initialized:
+                Tello.start_receivers()
+
+            # Receivers look up the channel by address, one dict lookup per packet
+            self.channel = DroneChannel(host)
+            drones[host] = self.channel
 
-        if not threads_initialized:
-            # Run Tello command responses UDP receiver on background
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            client_socket.bind(('', Tello.CONTROL_UDP_PORT))
-            response_receiver_thread = Thread(target=Tello.udp_response_receiver)
-            response_receiver_thread.daemon = True
-            response_receiver_thread.start()
+        self.LOGGER.info("Tello instance was initialized. Host: '%s'. Port: '%s'.", host, Tello.CONTROL_UDP_PORT)
 
-            # Run state UDP receiver on background
-            state_receiver_thread = Thread(target=Tello.udp_state_receiver)
-            state_receiver_thread.daemon = True
-            state_receiver_thread.start()
+    @staticmethod
+    def start_receivers():
+        """Bind the shared client socket and start the response and state
+        receiver threads. Called once, by the first Tello instance.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        global threads_initialized, client_socket
 
-            threads_initialized = True
+        # Run Tello command responses UDP receiver on background
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Allows emulated drones to bind the same port on their own
+        # loopback address next to us (see tello_emulator.py)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        client_socket.bind(('', Tello.CONTROL_UDP_PORT))
+        response_receiver_thread = Thread(target=Tello.udp_response_receiver)
+        response_receiver_thread.daemon = True
+        response_receiver_thread.start()
 
-        drones[host] = {'responses': [], 'state': {}}
+        # Run state UDP receiver on background
+        state_receiver_thread = Thread(target=Tello.udp_state_receiver)
+        state_receiver_thread.daemon = True
+        state_receiver_thread.start()
 
-        self.LOGGER.info("Tello instance was initialized. Host: '{}'. Port: '{}'.".format(host, Tello.CONTROL_UDP_PORT))
+        threads_initialized = True
 
-    def get_own_udp_object(self):
-        """Get own object from the global drones dict. This object is filled
-        with responses and state information by the receiver threads.
+    def get_own_udp_object(self) -> 'DroneChannel':
+        """Get own channel, which is also registered in the global drones dict.
+        It is filled with responses and state information by the receiver threads.
         Internal method, you normally wouldn't call this yourself.
         """
-        global drones
-
-        host = self.address[0]
-        return drones[host]
+        return self.channel
 
     @staticmethod
     def udp_response_receiver():
@@ -141,13 +168,11 @@ class Tello:
             try:
                 data, address = client_socket.recvfrom(1024)
 
-                address = address[0]
-                Tello.LOGGER.debug('Data received from {} at client_socket'.format(address))
-
-                if address not in drones:
+                channel = drones.get(address[0])
+                if channel is None:
                     continue
 
-                drones[address]['responses'].append(data)
+                channel.put_response(data)
 
             except Exception as e:
                 Tello.LOGGER.error(e)
@@ -167,14 +192,11 @@ class Tello:
             try:
                 data, address = state_socket.recvfrom(1024)
 
-                address = address[0]
-                Tello.LOGGER.debug('Data received from {} at state_socket'.format(address))
-
-                if address not in drones:
+                channel = drones.get(address[0])
+                if channel is None:
                     continue
 
-                data = data.decode('ASCII')
-                drones[address]['state'] = Tello.parse_state(data)
+                channel.set_state(Tello.parse_state(data.decode('ASCII')))
 
             except Exception as e:
                 Tello.LOGGER.error(e)
@@ -186,7 +208,7 @@ class Tello:
         Internal method, you normally wouldn't call this yourself.
         """
         state = state.strip()
-        Tello.LOGGER.debug('Raw state data: {}'.format(state))
+        Tello.LOGGER.debug('Raw state data: %s', state)
 
         if state == 'ok':
             return {}
@@ -205,8 +227,7 @@ class Tello:
                 try:
                     value = num_type(value)
                 except ValueError as e:
-                    Tello.LOGGER.debug('Error parsing state value for {}: {} to {}'
-                                       .format(key, value, num_type))
+                    Tello.LOGGER.debug('Error parsing state value for %s: %s to %s', key, value, num_type)
                     Tello.LOGGER.error(e)
                     continue
 
@@ -219,11 +240,13 @@ class Tello:
         with all fields.
         Internal method, you normally wouldn't call this yourself.
         """
-        return self.get_own_udp_object()['state']
+        return self.channel.state
 
-    def get_state_field(self, key: str):
+    def get_state_field(self, key):
         """Get a specific sate field by name.
         Internal method, you normally wouldn't call this yourself.
+        Left unannotated so enforce_types does not wrap it: every get_*
+        accessor goes through here.
         """
         state = self.get_current_state()
 
@@ -232,6 +255,19 @@ class Tello:
         else:
             raise Exception('Could not get state property: {}'.format(key))
 
+    def add_state_listener(self, callback: Callable[[dict, float], None]):
+        """Call callback(state, timestamp) for every state packet of this drone,
+        e.g. to filter telemetry as it arrives instead of polling it.
+        The callback runs on the state receiver thread, so it must be quick
+        and must not send commands.
+        """
+        self.channel.add_listener(callback)
+
+    def remove_state_listener(self, callback: Callable[[dict, float], None]):
+        """Stop calling a callback added with add_state_listener.
+        """
+        self.channel.remove_listener(callback)
+
     def get_mission_pad_id(self) -> int:
         """Mission pad ID of the currently detected mission pad
         Only available on Tello EDUs after calling enable_mission_pads
@@ -401,6 +437,8 @@ class Tello:
             VideoCapture
         """
 
+        import cv2  # type: ignore
+
         if self.cap is None:
             self.cap = cv2.VideoCapture(self.get_udp_video_address())
 
@@ -421,44 +459,57 @@ class Tello:
             self.background_frame_read.start()
         return self.background_frame_read
 
-    def send_command_with_return(self, command: str, timeout: int = RESPONSE_TIMEOUT) -> str:
+    def send_command_with_return(self, command: str, timeout: Union[int, float] = RESPONSE_TIMEOUT) -> str:
         """Send command to Tello and wait for its response.
         Internal method, you normally wouldn't call this yourself.
         Return:
             bool/str: str with response text on success, False when unsuccessfull.
         """
+        with self.command_lock:
+            return self._send_command_with_return(command, timeout)
+
+    def _send_command_with_return(self, command: str, timeout: Union[int, float]) -> str:
+        """Body of send_command_with_return, called with command_lock held.
+        Internal method, you normally wouldn't call this yourself.
+        """
         # Commands very consecutive makes the drone not respond to them.
         # So wait at least self.TIME_BTW_COMMANDS seconds
         diff = time.time() - self.last_received_command_timestamp
         if diff < self.TIME_BTW_COMMANDS:
-            self.LOGGER.debug('Waiting {} seconds to execute command: {}...'.format(diff, command))
+            self.LOGGER.debug('Waiting %s seconds to execute command: %s...', diff, command)
             time.sleep(diff)
 
-        self.LOGGER.info("Send command: '{}'".format(command))
+        self.LOGGER.info("Send command: '%s'", command, extra={'command': command})
         timestamp = time.time()
 
+        # A response that arrived after an earlier command timed out would
+        # otherwise be taken as the answer to this one
+        self.channel.clear_responses()
         client_socket.sendto(command.encode('utf-8'), self.address)
 
-        responses = self.get_own_udp_object()['responses']
-
-        while not responses:
-            if time.time() - timestamp > timeout:
-                message = "Aborting command '{}'. Did not receive a response after {} seconds".format(command, timeout)
-                self.LOGGER.warning(message)
-                return message
-            time.sleep(0.1)  # Sleep during send command
+        first_response = self.channel.get_response(timeout)
+        if first_response is None:
+            message = "Aborting command '{}'. Did not receive a response after {} seconds".format(command, timeout)
+            self.LOGGER.warning(message, extra={'command': command, 'latency': time.time() - timestamp})
+            self.command_stats.record_timeout(command)
+            return message
 
         self.last_received_command_timestamp = time.time()
+        latency = self.last_received_command_timestamp - timestamp
 
-        first_response = responses.pop(0)  # first datum from socket
         try:
             response = first_response.decode("utf-8")
         except UnicodeDecodeError as e:
             self.LOGGER.error(e)
+            self.command_stats.record_response(command, latency, "response decode error")
             return "response decode error"
         response = response.rstrip("\r\n")
 
-        self.LOGGER.info("Response {}: '{}'".format(command, response))
+        self.command_stats.record_response(command, latency, response)
+        self.LOGGER.info("Response %s: '%s'", command, response,
+                         extra={'command': command, 'response': response,
+                                'latency': latency,
+                                'battery': self.channel.state.get('bat')})
         return response
 
     def send_command_without_return(self, command: str):
@@ -467,21 +518,31 @@ class Tello:
         """
         # Commands very consecutive makes the drone not respond to them. So wait at least self.TIME_BTW_COMMANDS seconds
 
-        self.LOGGER.info("Send command (no response expected): '{}'".format(command))
+        self.LOGGER.info("Send command (no response expected): '%s'", command, extra={'command': command})
+        client_socket.sendto(command.encode('utf-8'), self.address)
+
+    def send_rc_command(self, command: str):
+        """Send an already formatted rc command. Logged at debug level only,
+        as the background rc sender calls this many times a second.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        self.LOGGER.debug("Send rc command: '%s'", command)
         client_socket.sendto(command.encode('utf-8'), self.address)
 
-    def send_control_command(self, command: str, timeout: int = RESPONSE_TIMEOUT) -> bool:
+    def send_control_command(self, command: str, timeout: Union[int, float] = RESPONSE_TIMEOUT) -> bool:
         """Send control command to Tello and wait for its response.
         Internal method, you normally wouldn't call this yourself.
         """
         response = "max retries exceeded"
         for i in range(0, self.retry_count):
+            if i > 0:
+                self.command_stats.record_retry(command)
             response = self.send_command_with_return(command, timeout=timeout)
 
             if 'ok' in response.lower():
                 return True
 
-            self.LOGGER.debug("Command attempt #{} failed for command: '{}'".format(i, command))
+            self.LOGGER.debug("Command attempt #%s failed for command: '%s'", i, command)
 
         self.raise_result_error(command, response)
         return False # never reached
@@ -534,16 +595,10 @@ class Tello:
         self.send_control_command("command")
 
         if wait_for_state:
-            REPS = 20
-            for i in range(REPS):
-                if self.get_current_state():
-                    t = i / REPS  # in seconds
-                    Tello.LOGGER.debug("'.connect()' received first state packet after {} seconds".format(t))
-                    break
-                time.sleep(1 / REPS)
-
-            if not self.get_current_state():
+            start = time.time()
+            if not self.channel.wait_for_state(1):
                 raise Exception('Did not receive a state packet from the Tello')
+            Tello.LOGGER.debug("'.connect()' received first state packet after %s seconds", time.time() - start)
 
     def send_keepalive(self):
         """Send a keepalive packet to prevent the drone from landing after 15s
@@ -805,28 +860,66 @@ class Tello:
         """
         self.send_control_command("speed {}".format(x))
 
+    @staticmethod
+    def format_rc_command(left_right_velocity: int, forward_backward_velocity: int, up_down_velocity: int,
+                          yaw_velocity: int) -> str:
+        """Build the rc command string, clamping every channel to -100~100.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        def clamp100(x: int) -> int:
+            return max(-100, min(100, x))
+
+        return 'rc {} {} {} {}'.format(
+            clamp100(left_right_velocity),
+            clamp100(forward_backward_velocity),
+            clamp100(up_down_velocity),
+            clamp100(yaw_velocity)
+        )
+
     def send_rc_control(self, left_right_velocity: int, forward_backward_velocity: int, up_down_velocity: int,
                         yaw_velocity: int):
         """Send RC control via four channels. Command is sent every self.TIME_BTW_RC_CONTROL_COMMANDS seconds.
+        If the background rc sender is running (see start_rc_sender) the values
+        only replace its setpoint and are sent on its next tick instead.
         Arguments:
             left_right_velocity: -100~100 (left/right)
             forward_backward_velocity: -100~100 (forward/backward)
             up_down_velocity: -100~100 (up/down)
             yaw_velocity: -100~100 (yaw)
         """
-        def clamp100(x: int) -> int:
-            return max(-100, min(100, x))
+        if self.rc_sender is not None:
+            self.rc_sender.set_setpoint(left_right_velocity, forward_backward_velocity,
+                                        up_down_velocity, yaw_velocity)
+            return
 
         if time.time() - self.last_rc_control_timestamp > self.TIME_BTW_RC_CONTROL_COMMANDS:
             self.last_rc_control_timestamp = time.time()
-            cmd = 'rc {} {} {} {}'.format(
-                clamp100(left_right_velocity),
-                clamp100(forward_backward_velocity),
-                clamp100(up_down_velocity),
-                clamp100(yaw_velocity)
-            )
+            cmd = Tello.format_rc_command(left_right_velocity, forward_backward_velocity,
+                                          up_down_velocity, yaw_velocity)
             self.send_command_without_return(cmd)
 
+    def start_rc_sender(self, rate: Optional[Union[int, float]] = None) -> 'RCControlSender':
+        """Start a background thread that sends the latest rc setpoint at a
+        fixed rate. Afterwards send_rc_control only updates the setpoint, so
+        a fast control loop never loses its most recent values.
+        Arguments:
+            rate: send rate in Hz, defaults to Tello.RC_CONTROL_RATE
+        Returns:
+            RCControlSender
+        """
+        if self.rc_sender is None:
+            self.rc_sender = RCControlSender(self, rate or self.RC_CONTROL_RATE)
+            self.rc_sender.start()
+        return self.rc_sender
+
+    def stop_rc_sender(self):
+        """Stop the background rc sender. The last setpoint is not repeated
+        afterwards, send 'rc 0 0 0 0' yourself if the drone should hover.
+        """
+        if self.rc_sender is not None:
+            self.rc_sender.stop()
+            self.rc_sender = None
+
     def set_wifi_credentials(self, ssid: str, password: str):
         """Set the Wi-Fi SSID and password. The Tello will reboot afterwords.
         """
@@ -999,26 +1092,248 @@ class Tello:
         """
         return self.send_read_command('active?')
 
+    def get_command_stats(self) -> dict:
+        """Get counters and latency figures per command verb, e.g.
+        stats['forward']['latency_p90']. See CommandStats.snapshot.
+        Returns:
+            dict: verb -> statistics
+        """
+        return self.command_stats.snapshot()
+
+    def start_stats_dump(self, interval: float = 60.0):
+        """Log a summary of the command statistics every interval seconds
+        from a background thread, until end() or stop_stats_dump() is called.
+        """
+        if self.stats_dump_stop is not None:
+            return
+        self.stats_dump_stop = Event()
+
+        def dump(stop_event):
+            while not stop_event.wait(interval):
+                self.LOGGER.info("Command statistics for %s:\n%s", self.address[0], self.command_stats)
+
+        Thread(target=dump, args=(self.stats_dump_stop,), daemon=True).start()
+
+    def stop_stats_dump(self):
+        """Stop the periodic statistics summary.
+        """
+        if self.stats_dump_stop is not None:
+            self.stats_dump_stop.set()
+            self.stats_dump_stop = None
+
     def end(self):
         """Call this method when you want to end the tello object
         """
+        self.stop_stats_dump()
         if self.is_flying:
             self.land()
         if self.stream_on:
             self.streamoff()
+        if self.rc_sender is not None:
+            self.stop_rc_sender()
         if self.background_frame_read is not None:
             self.background_frame_read.stop()
         if self.cap is not None:
             self.cap.release()
 
         host = self.address[0]
-        if host in drones:
-            del drones[host]
+        with threads_lock:
+            if drones.get(host) is self.channel:
+                del drones[host]
 
     def __del__(self):
         self.end()
 
 
+class CommandStats:
+    """
+    Counts, retries, timeouts, error replies and a send-to-ack latency
+    histogram for every command verb. Verbs are the first word of a command,
+    plus the second for EXT commands ('EXT led', 'EXT mled').
+    """
+    # Upper bounds of the latency histogram buckets in seconds, the last
+    # bucket counts everything slower
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+    def __init__(self):
+        self.lock = Lock()
+        self.verbs: Dict[str, dict] = {}
+
+    @staticmethod
+    def verb_of(command: str) -> str:
+        words = command.split(' ', 2)
+        if words[0] == 'EXT' and len(words) > 1:
+            return 'EXT ' + words[1]
+        return words[0]
+
+    def entry(self, command: str) -> dict:
+        """Get the counters of a command's verb, call with lock held.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        verb = CommandStats.verb_of(command)
+        entry = self.verbs.get(verb)
+        if entry is None:
+            entry = {'count': 0, 'retries': 0, 'timeouts': 0, 'errors': 0,
+                     'latency_sum': 0.0, 'latency_max': 0.0,
+                     'histogram': [0] * (len(self.LATENCY_BUCKETS) + 1)}
+            self.verbs[verb] = entry
+        return entry
+
+    def record_response(self, command: str, latency: float, response: str):
+        bucket = bisect.bisect_left(self.LATENCY_BUCKETS, latency)
+        with self.lock:
+            entry = self.entry(command)
+            entry['count'] += 1
+            entry['latency_sum'] += latency
+            entry['latency_max'] = max(entry['latency_max'], latency)
+            entry['histogram'][bucket] += 1
+            if 'error' in response.lower():
+                entry['errors'] += 1
+
+    def record_timeout(self, command: str):
+        with self.lock:
+            entry = self.entry(command)
+            entry['count'] += 1
+            entry['timeouts'] += 1
+
+    def record_retry(self, command: str):
+        with self.lock:
+            self.entry(command)['retries'] += 1
+
+    def reset(self):
+        with self.lock:
+            self.verbs = {}
+
+    def percentile(self, histogram: list, fraction: float) -> Optional[float]:
+        """Estimate a latency percentile as the upper bound of its bucket.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        total = sum(histogram)
+        if not total:
+            return None
+        needed = fraction * total
+        seen = 0
+        for i, n in enumerate(histogram):
+            seen += n
+            if seen >= needed:
+                return self.LATENCY_BUCKETS[i] if i < len(self.LATENCY_BUCKETS) else math.inf
+        return math.inf
+
+    def snapshot(self) -> dict:
+        """Copy of all counters, with mean and p50/p90/p99 latency added.
+        Returns:
+            dict: verb -> statistics (latencies in seconds)
+        """
+        with self.lock:
+            verbs = {verb: dict(entry, histogram=list(entry['histogram'])) for verb, entry in self.verbs.items()}
+        for entry in verbs.values():
+            answered = sum(entry['histogram'])
+            entry['latency_mean'] = entry['latency_sum'] / answered if answered else None
+            entry['latency_p50'] = self.percentile(entry['histogram'], 0.50)
+            entry['latency_p90'] = self.percentile(entry['histogram'], 0.90)
+            entry['latency_p99'] = self.percentile(entry['histogram'], 0.99)
+        return verbs
+
+    def __str__(self):
+        lines = ['{:<10} {:>6} {:>7} {:>8} {:>6} {:>9} {:>9} {:>9}'.format(
+            'verb', 'count', 'retries', 'timeouts', 'errors', 'mean ms', 'p90 ms', 'max ms')]
+        stats = self.snapshot()
+        for verb in sorted(stats, key=lambda v: -stats[v]['latency_sum']):
+            entry = stats[verb]
+            mean = entry['latency_mean']
+            lines.append('{:<10} {:>6} {:>7} {:>8} {:>6} {:>9} {:>9} {:>9.1f}'.format(
+                verb, entry['count'], entry['retries'], entry['timeouts'], entry['errors'],
+                '-' if mean is None else '{:.1f}'.format(mean * 1000),
+                '-' if entry['latency_p90'] is None else '<={:g}'.format(entry['latency_p90'] * 1000),
+                entry['latency_max'] * 1000))
+        return '\n'.join(lines)
+
+
+class DroneChannel:
+    """
+    Mailbox of one drone, owned by its Tello object and filled by the receiver
+    threads. Responses go through a SimpleQueue, so the receiver never waits
+    on a lock and a waiting command wakes up as soon as its ack arrives. The
+    state dict is swapped as a whole on every packet, so readers always see
+    one complete packet without locking.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.responses = SimpleQueue()
+        self.state: dict = {}
+        self.state_timestamp = 0.0
+        self.state_count = 0
+        self.response_count = 0
+        self.first_state = Event()
+        # Replaced as a whole when changed, so the receiver can iterate
+        # it without a lock
+        self.listeners: tuple = ()
+
+    def put_response(self, data: bytes):
+        """Called by the response receiver thread only.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        self.response_count += 1
+        self.responses.put(data)
+
+    def get_response(self, timeout) -> Optional[bytes]:
+        """Wait up to timeout seconds for the next response.
+        Returns:
+            bytes or None when no response arrived in time
+        """
+        try:
+            return self.responses.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def clear_responses(self) -> int:
+        """Drop responses nobody is waiting for anymore.
+        Returns:
+            int: number of dropped responses
+        """
+        dropped = 0
+        while True:
+            try:
+                self.responses.get_nowait()
+            except Empty:
+                break
+            dropped += 1
+        if dropped:
+            Tello.LOGGER.debug('Dropped %s stale response(s) from %s', dropped, self.host)
+        return dropped
+
+    def set_state(self, state: dict):
+        """Called by the state receiver thread only.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        self.state = state
+        self.state_timestamp = time.time()
+        self.state_count += 1
+        self.first_state.set()
+        for listener in self.listeners:
+            try:
+                listener(state, self.state_timestamp)
+            except Exception as e:
+                # A broken listener must not stop the state receiver
+                Tello.LOGGER.error('State listener %s failed: %s', listener, e)
+
+    def add_listener(self, callback):
+        """See Tello.add_state_listener"""
+        self.listeners = self.listeners + (callback,)
+
+    def remove_listener(self, callback):
+        """See Tello.remove_state_listener"""
+        self.listeners = tuple(listener for listener in self.listeners if listener != callback)
+
+    def wait_for_state(self, timeout) -> bool:
+        """Wait until the first state packet arrived.
+        Returns:
+            bool: False if none arrived within timeout seconds
+        """
+        return self.first_state.wait(timeout)
+
+
 class BackgroundFrameRead:
     """
     This class read frames from a VideoCapture in background. Use
@@ -1026,6 +1341,8 @@ class BackgroundFrameRead:
     """
 
     def __init__(self, tello, address):
+        import cv2  # type: ignore
+
         tello.cap = cv2.VideoCapture(address)
 
         self.cap = tello.cap
@@ -1047,6 +1364,11 @@ class BackgroundFrameRead:
         if not self.grabbed or self.frame is None:
             raise Exception('Failed to grab first frame from video stream')
 
+        self.frame_count = 1
+        # Receive time of the current frame, to line it up with the state
+        self.frame_timestamp = time.time()
+        # CPU time this worker spent receiving and decoding, for the decode load
+        self.decode_seconds = 0.0
         self.stopped = False
         self.worker = Thread(target=self.update_frame, args=(), daemon=True)
 
@@ -1064,11 +1386,123 @@ class BackgroundFrameRead:
             if not self.grabbed or not self.cap.isOpened():
                 self.stop()
             else:
+                started = time.thread_time()
                 self.grabbed, self.frame = self.cap.read()
+                self.frame_timestamp = time.time()
+                self.decode_seconds += time.thread_time() - started
+                self.frame_count += 1
 
     def stop(self):
         """Stop the frame update worker
         Internal method, you normally wouldn't call this yourself.
         """
         self.stopped = True
+        # The worker stops itself when the stream ends and cannot join itself
+        if self.worker.is_alive() and current_thread() is not self.worker:
+            self.worker.join()
+
+
+class RCControlSender:
+    """
+    This class sends rc commands to the Tello in background at a fixed rate.
+    Use rcControlSender.set_setpoint(...) to change the values; setpoints
+    that arrive between two ticks are coalesced and only the latest is sent.
+    """
+
+    def __init__(self, tello, rate):
+        self.tello = tello
+        self.period = 1 / rate
+        self.lock = Lock()
+        self.setpoint = (0, 0, 0, 0)
+        self.command = Tello.format_rc_command(*self.setpoint)
+
+        self.sent_count = 0
+        self.coalesced_count = 0
+        self.missed_ticks = 0
+        self.updates_since_send = 0
+        self.jitter_sum = 0.0
+        self.jitter_square_sum = 0.0
+        self.jitter_max = 0.0
+
+        self.stopped = Event()
+        self.worker = Thread(target=self.send_loop, args=(), daemon=True)
+
+    def start(self):
+        """Start the rc send worker
+        Internal method, you normally wouldn't call this yourself.
+        """
+        self.worker.start()
+
+    def set_setpoint(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        """Replace the setpoint sent on the next tick. Never blocks on the network.
+        """
+        setpoint = (left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity)
+        command = Tello.format_rc_command(*setpoint)
+        with self.lock:
+            if self.updates_since_send:
+                self.coalesced_count += 1
+            self.updates_since_send += 1
+            self.setpoint = setpoint
+            self.command = command
+
+    def send_loop(self):
+        """Thread worker function sending the latest setpoint every period.
+        Deadlines are absolute, so a slow tick does not shift all later ones.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        next_tick = time.perf_counter()
+        while not self.stopped.is_set():
+            delay = next_tick - time.perf_counter()
+            if delay > 0 and self.stopped.wait(delay):
+                break
+
+            with self.lock:
+                command = self.command
+                self.updates_since_send = 0
+
+            self.tello.send_rc_command(command)
+            now = time.perf_counter()
+            self.record_jitter(now - next_tick)
+
+            next_tick += self.period
+            if next_tick < now:
+                # We fell behind by more than a whole period, skip the lost
+                # ticks instead of sending a burst to catch up
+                skipped = int((now - next_tick) / self.period) + 1
+                self.missed_ticks += skipped
+                next_tick += skipped * self.period
+
+    def record_jitter(self, jitter):
+        """Accumulate send lateness statistics
+        Internal method, you normally wouldn't call this yourself.
+        """
+        self.sent_count += 1
+        self.jitter_sum += jitter
+        self.jitter_square_sum += jitter * jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+
+    def get_jitter_stats(self) -> dict:
+        """Get statistics about how late the rc commands were sent compared to
+        their scheduled tick.
+        Returns:
+            dict: sent, coalesced and missed counts, mean/std/max jitter in ms
+        """
+        n = self.sent_count
+        mean = self.jitter_sum / n if n else 0.0
+        variance = self.jitter_square_sum / n - mean * mean if n else 0.0
+        return {
+            'rate_hz': 1 / self.period,
+            'sent': n,
+            'coalesced': self.coalesced_count,
+            'missed_ticks': self.missed_ticks,
+            'jitter_mean_ms': mean * 1000,
+            'jitter_std_ms': math.sqrt(max(variance, 0.0)) * 1000,
+            'jitter_max_ms': self.jitter_max * 1000,
+        }
+
+    def stop(self):
+        """Stop the rc send worker
+        Internal method, you normally wouldn't call this yourself.
+        """
+        self.stopped.set()
         self.worker.join()
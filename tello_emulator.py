@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+#Local Tello emulator for testing without a drone
+
+import math
+import socket
+import time
+from threading import Event, Lock, Thread
+
+CONTROL_UDP_PORT = 8889
+STATE_UDP_PORT = 8890
+
+# Commands that answer with a value instead of 'ok'
+READ_COMMANDS = ('speed?', 'battery?', 'time?', 'height?', 'temp?', 'attitude?',
+                 'baro?', 'tof?', 'wifi?', 'sdk?', 'sn?', 'active?')
+
+
+class EmulatedTello():
+    """
+    A fake Tello that speaks the SDK over UDP on a loopback address. It binds
+    the control port on its own address (127.0.0.2, 127.0.0.3, ...) so that
+    several emulators can run next to one djitellopy client, which is bound
+    to the same port on all addresses. It answers commands, keeps a simple
+    pose and battery, and streams state packets to the client.
+    """
+
+    def __init__(self, host='127.0.0.2', client_host='127.0.0.1', state_rate=10,
+                 speed=100, time_scale=0.0, battery=90, pads=None, pad_range=100, obstacles=()):
+        """
+        Arguments
+            host:        loopback address this drone lives on
+            client_host: address the djitellopy client receives state on
+            state_rate:  state packets per second (a real Tello sends ~10)
+            speed:       cm/s used to compute how long a move takes
+            time_scale:  1.0 flies in real time, 0.0 acks moves immediately
+            battery:     starting battery percentage
+            pads:        {mid: (x, y, yaw)} mission pads on the floor, in the
+                         same frame as the pose (yaw counter clockwise)
+            pad_range:   cm from a pad within which the drone sees it
+            obstacles:   (x1, y1, x2, y2, height) boxes on the floor the ToF
+                         sees when the drone is over them
+        """
+        self.host = host
+        self.client_host = client_host
+        self.state_rate = state_rate
+        self.speed = speed
+        self.time_scale = time_scale
+        self.battery = battery
+        self.pads = pads or {}
+        self.pad_range = pad_range
+        self.mission_pads = False
+        self.obstacles = list(obstacles)
+
+        self.lock = Lock()
+        self.x = 0
+        self.y = 0
+        self.h = 0
+        self.yaw = 0
+        self.start_time = time.time()
+        self.flying = False
+        self.received = []
+        self.delays = {}
+        self.replies = {}
+
+        self.control_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.control_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.control_socket.bind((host, CONTROL_UDP_PORT))
+        self.control_socket.settimeout(0.2)
+        self.state_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.state_socket.bind((host, 0))
+
+        self.stopped = Event()
+        self.workers = [Thread(target=self.command_loop, daemon=True),
+                        Thread(target=self.state_loop, daemon=True)]
+
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        return self
+
+
+    def stop(self):
+        self.stopped.set()
+        for worker in self.workers:
+            worker.join()
+        self.control_socket.close()
+        self.state_socket.close()
+        return
+
+
+    def set_delay(self, verb, seconds):
+        """ Make every command starting with verb take extra seconds to ack. """
+        self.delays[verb] = seconds
+
+
+    def set_reply(self, verb, reply):
+        """ Answer every command starting with verb with reply, e.g. 'error'.
+        A reply of None drops the command so the client times out. """
+        self.replies[verb] = reply
+
+
+    def pad_in_view(self):
+        """ (mid, x, y, yaw) of the nearest pad in range, relative to the pad
+        in its axes with the yaw clockwise like a Tello, or None. """
+        if not (self.mission_pads and self.flying):
+            return None
+        visible = [(math.hypot(self.x - x, self.y - y), mid) for mid, (x, y, yaw) in self.pads.items()
+                   if math.hypot(self.x - x, self.y - y) <= self.pad_range]
+        if not visible:
+            return None
+        mid = min(visible)[1]
+        x, y, yaw = self.pads[mid]
+        heading = math.radians(yaw)
+        dx, dy = self.x - x, self.y - y
+        return (mid, round(math.cos(heading) * dx + math.sin(heading) * dy),
+                round(-math.sin(heading) * dx + math.cos(heading) * dy), (yaw - self.yaw) % 360)
+
+
+    def tof(self):
+        """ ToF reading in cm: the distance to the floor or to the top of
+        the obstacle below. """
+        below = max((height for x1, y1, x2, y2, height in self.obstacles
+                     if x1 <= self.x <= x2 and y1 <= self.y <= y2), default=0)
+        return max(self.h - below, 0) + 10
+
+
+    def state_string(self):
+        with self.lock:
+            flight_time = int(time.time() - self.start_time) if self.flying else 0
+            pad = self.pad_in_view() or (-1, 0, 0, 0)
+            return (f"mid:{pad[0]};x:{pad[1]};y:{pad[2]};z:{self.h if pad[0] > 0 else 0};"
+                    f"mpry:0,0,{pad[3]};pitch:0;roll:0;yaw:{self.yaw};"
+                    f"vgx:0;vgy:0;vgz:0;templ:60;temph:63;tof:{self.tof()};h:{self.h};"
+                    f"bat:{self.battery};baro:{100 + self.h / 100:.2f};time:{flight_time};"
+                    f"agx:0.00;agy:0.00;agz:-1000.00;\r\n")
+
+
+    def state_loop(self):
+        period = 1 / self.state_rate
+        next_tick = time.perf_counter()
+        while not self.stopped.is_set():
+            self.state_socket.sendto(self.state_string().encode('ASCII'),
+                                     (self.client_host, STATE_UDP_PORT))
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                self.stopped.wait(delay)
+            else:
+                next_tick = time.perf_counter()
+
+
+    def command_loop(self):
+        while not self.stopped.is_set():
+            try:
+                data, address = self.control_socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            command = data.decode('utf-8').strip()
+            self.received.append(command)
+            reply = self.handle(command)
+            if reply is not None:
+                self.control_socket.sendto(reply.encode('utf-8'), address)
+
+
+    def handle(self, command):
+        """ Returns the reply for one SDK command and updates the pose. """
+        words = command.split()
+        verb = words[0] if words else ''
+        if verb in self.replies:
+            return self.replies[verb]
+        if verb == 'rc':
+            return None
+        if verb in self.delays:
+            time.sleep(self.delays[verb])
+        if command in READ_COMMANDS:
+            return self.read(command)
+
+        duration = 0
+        with self.lock:
+            if verb == 'takeoff':
+                self.flying = True
+                self.h = 80
+                duration = 3
+            elif verb == 'land':
+                self.flying = False
+                self.h = 0
+                duration = 3
+            elif verb in ('forward', 'back', 'left', 'right') and len(words) > 1:
+                cm = int(words[1])
+                angle = {'forward': 0, 'left': 90, 'back': 180, 'right': 270}[verb]
+                heading = math.radians(self.yaw + angle)
+                self.x += round(math.cos(heading) * cm)
+                self.y += round(math.sin(heading) * cm)
+                duration = cm / self.speed
+            elif verb in ('up', 'down') and len(words) > 1:
+                cm = int(words[1])
+                self.h += cm if verb == 'up' else -cm
+                duration = cm / self.speed
+            elif verb in ('cw', 'ccw') and len(words) > 1:
+                degrees = int(words[1])
+                self.yaw = (self.yaw + (degrees if verb == 'ccw' else -degrees)) % 360
+                duration = degrees / 90
+            elif verb == 'go' and len(words) > 5 and words[5][1:].isdigit():
+                # Relative to a mission pad, which must be in view
+                pad = self.pad_in_view()
+                if pad is None or pad[0] != int(words[5][1:]):
+                    return 'error No valid marker'
+                x, y, z = (int(value) for value in words[1:4])
+                pad_x, pad_y, yaw = self.pads[pad[0]]
+                heading = math.radians(yaw)
+                duration = math.hypot(x - pad[1], y - pad[2]) / int(words[4])
+                self.x = pad_x + round(x * math.cos(heading) - y * math.sin(heading))
+                self.y = pad_y + round(x * math.sin(heading) + y * math.cos(heading))
+                self.h = z
+            elif verb == 'go' and len(words) > 4:
+                x, y, z = (int(value) for value in words[1:4])
+                heading = math.radians(self.yaw)
+                self.x += round(x * math.cos(heading) - y * math.sin(heading))
+                self.y += round(x * math.sin(heading) + y * math.cos(heading))
+                self.h += z
+                duration = math.sqrt(x * x + y * y + z * z) / int(words[4])
+            elif verb in ('mon', 'moff'):
+                self.mission_pads = verb == 'mon'
+            elif verb == 'speed' and len(words) > 1:
+                self.speed = int(words[1])
+            elif verb == 'EXT':
+                return f"{words[1]} ok" if len(words) > 1 else 'error'
+
+        if self.time_scale:
+            time.sleep(duration * self.time_scale)
+        return 'ok'
+
+
+    def read(self, command):
+        with self.lock:
+            values = {
+                'speed?': str(self.speed),
+                'battery?': str(self.battery),
+                'time?': str(int(time.time() - self.start_time)),
+                'height?': str(self.h),
+                'temp?': '61',
+                'attitude?': f"pitch:0;roll:0;yaw:{self.yaw};",
+                'baro?': '100',
+                'tof?': f"{self.tof() * 10}mm",
+                'wifi?': '90',
+                'sdk?': '30',
+                'sn?': f"EMU{self.host.replace('.', '')}",
+                'active?': 'ok',
+            }
+        return values[command]
+
+
+def start_emulators(count, first_host=2, **kwargs):
+    """ Start count emulated drones on 127.0.0.<first_host> and up. """
+    return [EmulatedTello(f"127.0.0.{first_host + i}", **kwargs).start() for i in range(count)]
+
+
+def stress_test(drone_count=8, commands_per_drone=200, state_rate=100, seconds=3):
+    """
+    Run many emulated drones at a high state rate while one thread per drone
+    fires read commands as fast as the acks come back. Every emulator has its
+    own battery level and serial number, so a response or state packet that
+    lands on the wrong Tello object is caught. Each drone sends at least
+    commands_per_drone commands and keeps going for at least seconds.
+    Returns a report dictionary.
+    """
+    from djitellopy import Tello
+
+    emulators = [EmulatedTello(f"127.0.0.{2 + i}", state_rate=state_rate, battery=10 + i).start()
+                 for i in range(drone_count)]
+    drones = [Tello(emulator.host) for emulator in emulators]
+    errors = []
+    counts = []
+
+    def hammer(drone, emulator):
+        expected_sn = f"EMU{emulator.host.replace('.', '')}"
+        deadline = time.perf_counter() + seconds
+        i = 0
+        while i < commands_per_drone or time.perf_counter() < deadline:
+            i += 1
+            command = 'sn?' if i % 2 else 'battery?'
+            expected = expected_sn if i % 2 else str(emulator.battery)
+            response = drone.send_command_with_return(command, timeout=2)
+            if response != expected:
+                errors.append(f"{emulator.host} '{command}': expected '{expected}', got '{response}'")
+            state = drone.get_current_state()
+            if state and state.get('bat') != emulator.battery:
+                errors.append(f"{emulator.host} state battery {state.get('bat')} != {emulator.battery}")
+        counts.append(i)
+
+    for drone in drones:
+        drone.TIME_BTW_COMMANDS = 0
+        drone.connect()
+    start = time.perf_counter()
+    threads = [Thread(target=hammer, args=(drone, emulator)) for drone, emulator in zip(drones, emulators)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    state_counts = [drone.get_own_udp_object().state_count for drone in drones]
+    report = {
+        'drones': drone_count,
+        'commands': sum(counts),
+        'seconds': elapsed,
+        'commands_per_second': sum(counts) / elapsed,
+        'errors': len(errors),
+        'first_errors': errors[:5],
+        'state_packets_expected': int(state_rate * elapsed),
+        'state_packets_min': min(state_counts),
+        'state_packets_max': max(state_counts),
+    }
+    for drone in drones:
+        drone.end()
+    for emulator in emulators:
+        emulator.stop()
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import logging
+    import pprint
+
+    parser = argparse.ArgumentParser(description="Stress test djitellopy against emulated drones")
+    parser.add_argument('--drones', type=int, default=8)
+    parser.add_argument('--commands', type=int, default=200)
+    parser.add_argument('--state-rate', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    from djitellopy import Tello
+    Tello.LOGGER.setLevel(logging.WARNING)
+    report = stress_test(args.drones, args.commands, args.state_rate, args.seconds)
+    pprint.pprint(report)
+    if report['errors']:
+        raise SystemExit(1)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+#High Flyers dead reckoning tests, run with pytest
+
+import pytest
+
+from maneuver_queue import pose_after
+
+# (heading, maneuver) -> where 100 cm of it ends from (0, 0)
+EXPECTED = {
+    (0, 'forward'): (100, 0), (0, 'back'): (-100, 0), (0, 'left'): (0, 100), (0, 'right'): (0, -100),
+    (90, 'forward'): (0, 100), (90, 'back'): (0, -100), (90, 'left'): (-100, 0), (90, 'right'): (100, 0),
+    (180, 'forward'): (-100, 0), (180, 'back'): (100, 0), (180, 'left'): (0, -100), (180, 'right'): (0, 100),
+    (270, 'forward'): (0, -100), (270, 'back'): (0, 100), (270, 'left'): (100, 0), (270, 'right'): (-100, 0),
+}
+
+
+@pytest.mark.parametrize('heading, maneuver', sorted(EXPECTED))
+def test_moves_land_where_expected(heading, maneuver):
+    x, y, degrees = pose_after(maneuver, 100, 0, 0, heading)
+    assert (x, y) == EXPECTED[(heading, maneuver)]
+    assert degrees == heading
+
+
+@pytest.mark.parametrize('heading', [0, 90, 180, 270])
+@pytest.mark.parametrize('forward, left', [(100, 0), (-100, 0), (0, 100), (0, -100), (60, -80)])
+def test_go_matches_the_moves_it_replaces(heading, forward, left):
+    pose = (10, -20, heading)
+    expected = pose
+    if forward:
+        expected = pose_after('forward' if forward > 0 else 'back', abs(forward), *expected)
+    if left:
+        expected = pose_after('left' if left > 0 else 'right', abs(left), *expected)
+    assert pose_after('go', (forward, left, 0, 50), *pose) == pytest.approx(expected)
+
+
+def test_back_undoes_forward_at_any_heading():
+    for heading in range(0, 360, 15):
+        pose = pose_after('forward', 137, 5, 7, heading)
+        assert pose_after('back', 137, *pose) == pytest.approx((5, 7, heading))
+
+
+def test_rotations_and_vertical_moves_keep_position():
+    assert pose_after('cw', 90, 1, 2, 0) == (1, 2, 270)
+    assert pose_after('ccw', 270, 1, 2, 180) == (1, 2, 90)
+    assert pose_after('up', 50, 1, 2, 30) == (1, 2, 30)
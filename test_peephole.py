@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+#High Flyers peephole optimiser tests, run with pytest
+
+import random
+
+import pytest
+
+import peephole
+from maneuver_queue import MANEUVER_LIMITS, pose_after
+
+MIXED = [
+    [('forward', 100), ('forward', 50), ('back', 30)],
+    [('forward', 100), ('back', 100), ('left', 40)],
+    [('cw', 270), ('forward', 30), ('cw', 90), ('ccw', 90), ('forward', 20)],
+    [('left', 60), ('right', 20), ('up', 30), ('forward', 80), ('back', 20)],
+    [('forward', 400), ('forward', 300), ('cw', 45), ('right', 50), ('left', 120)],
+    [('ccw', 90), ('back', 70), ('cw', 180), ('right', 30), ('down', 40), ('up', 20), ('forward', 25)],
+]
+
+
+def final_pose(maneuvers, pose=(0, 0, 0)):
+    for maneuver, amount in maneuvers:
+        pose = pose_after(maneuver, amount, *pose)
+    return pose
+
+
+def random_sequence(rng, length):
+    moves = [name for name in MANEUVER_LIMITS if name not in ('cw', 'ccw')]
+    sequence = []
+    for _ in range(length):
+        if rng.random() < 0.3:
+            sequence.append((rng.choice(('cw', 'ccw')), rng.choice((45, 90, 135, 180, 270))))
+        else:
+            sequence.append((rng.choice(moves), rng.randint(20, 200)))
+    return sequence
+
+
+@pytest.mark.parametrize('use_go', [False, True])
+@pytest.mark.parametrize('sequence', MIXED + [random_sequence(random.Random(seed), 12) for seed in range(20)])
+def test_optimised_sequence_ends_on_the_same_pose(sequence, use_go):
+    optimised, _ = peephole.optimise(sequence, use_go=use_go)
+    for start in ((0, 0, 0), (50, -20, 90), (0, 0, 225)):
+        assert final_pose(optimised, start) == pytest.approx(final_pose(sequence, start), abs=1e-4)
+
+
+def test_opposite_moves_merge_to_the_tracked_pose():
+    optimised, saved = peephole.optimise([('forward', 100), ('forward', 50), ('back', 30)], use_go=False)
+    assert optimised == [('forward', 120)]
+    assert peephole.commands_saved(saved) == 2
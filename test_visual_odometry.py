@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+#High Flyers visual odometry fusion tests, run with pytest
+
+import pytest
+
+from maneuver_queue import body_to_world, pose_after
+from visual_odometry import VisualOdometry
+
+
+def odometry(tracked, weight=0.5):
+    """ A VisualOdometry without a camera whose take() returns tracked, a
+    world (x, y) move seen in every one of 10 frames. """
+    vo = VisualOdometry.__new__(VisualOdometry)
+    vo.weight = weight
+    vo.take = lambda settle=0.3: (tracked[0], tracked[1], 10, 10)
+    return vo
+
+
+@pytest.mark.parametrize('heading', [0, 90, 180, 270])
+@pytest.mark.parametrize('maneuver, forward, left', [('forward', 100, 0), ('back', -100, 0),
+                                                     ('left', 0, 100), ('right', 0, -100)])
+def test_camera_agreeing_with_the_move_keeps_it(heading, maneuver, forward, left):
+    before = (30, -40, heading)
+    after = pose_after(maneuver, 100, *before)
+    fused = odometry(body_to_world(forward, left, heading)).fuse(maneuver, before, after)
+    assert fused == pytest.approx(after)
+
+
+@pytest.mark.parametrize('heading', [0, 90, 180, 270])
+def test_short_back_move_is_corrected(heading):
+    # Commanded back 100, the camera saw 80: the pose ends 90 cm back
+    before = (0, 0, heading)
+    after = pose_after('back', 100, *before)
+    fused = odometry(body_to_world(-80, 0, heading)).fuse('back', before, after)
+    assert fused == pytest.approx(pose_after('back', 90, *before))
+
+
+def test_rotations_keep_dead_reckoning():
+    before = (10, 10, 0)
+    after = pose_after('cw', 90, *before)
+    assert odometry((50, 50)).fuse('cw', before, after) == after
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+#High Flyers adaptive video stream settings
+
+import logging
+import math
+import time
+
+from djitellopy import Tello
+
+log = logging.getLogger('colt')
+
+################################################################################
+# The drone streams 960x720 at 30 fps by default. record_video shrinks every   #
+# frame to 360x240 and the detector to 416x416, so most of the decoding is     #
+# thrown away. VideoSettings asks for the leanest stream that covers what its  #
+# consumers need (the smallest resolution at least as wide and tall as the     #
+# largest need, the lowest fps at least as fast as the fastest need, and a     #
+# bitrate for that many pixels a second). While streaming it measures the CPU  #
+# time the frame reader spends decoding and how many frames get through. When  #
+# decoding takes too much of a core, or frames arrive late, it steps down a    #
+# ladder of cheaper settings (fewer frames, then fewer pixels). When the load  #
+# has been low for a while it steps back up, never beyond what the consumers   #
+# need. Settings are only sent when they change.                               #
+################################################################################
+
+# Stream size of each resolution setting
+RESOLUTIONS = {Tello.RESOLUTION_480P: (640, 480), Tello.RESOLUTION_720P: (960, 720)}
+FRAME_RATES = {Tello.FPS_5: 5, Tello.FPS_15: 15, Tello.FPS_30: 30}
+BITS_PER_PIXEL = 0.1        # H.264 bits per pixel for a clean picture of a slow scene
+MAX_BITRATE = Tello.BITRATE_5MBPS
+
+WINDOW = 3.0                # s of decoding measured per decision
+HIGH_LOAD = 0.6             # share of one core spent decoding that is too much
+LOW_LOAD = 0.3              # share of one core low enough to step back up
+LATE_SHARE = 0.7            # fewer frames than this share of the stream fps is overload
+STEP_UP_HOLD = 15.0         # s since the last switch before stepping back up
+
+
+def pixel_rate(setting):
+    (width, height), fps = RESOLUTIONS[setting[0]], FRAME_RATES[setting[1]]
+    return width * height * fps
+
+
+def bitrate_for(resolution, fps):
+    """ Mbps setting for a stream, at least 1. """
+    width, height = RESOLUTIONS[resolution]
+    return min(max(int(math.ceil(width * height * FRAME_RATES[fps] * BITS_PER_PIXEL / 1e6)), 1), MAX_BITRATE)
+
+
+def ladder(top):
+    """
+    Settings from top down to the cheapest. Each rung has no more pixels and
+    no more frames than the one above it.
+    Arguments
+        top: (resolution, fps)
+    Returns
+        list of (resolution, fps, bitrate), top first
+    """
+    candidates = sorted(((resolution, fps) for resolution in RESOLUTIONS for fps in FRAME_RATES),
+                        key=pixel_rate, reverse=True)
+    rungs = [top]
+    for candidate in candidates:
+        last = rungs[-1]
+        if pixel_rate(candidate) < pixel_rate(last) \
+                and RESOLUTIONS[candidate[0]][1] <= RESOLUTIONS[last[0]][1] \
+                and FRAME_RATES[candidate[1]] <= FRAME_RATES[last[1]]:
+            rungs.append(candidate)
+    return [(resolution, fps, bitrate_for(resolution, fps)) for resolution, fps in rungs]
+
+
+class VideoSettings():
+    """
+    Picks the video stream settings of one drone from the needs of its
+    consumers and the decode load. Call update() from the loop reading the
+    frames; it does nothing until a measuring window is over.
+    """
+
+    def __init__(self, drone):
+        """
+        Arguments
+            drone: Tello object whose stream to set
+        """
+        self.drone = drone
+        self.needs = {}
+        self.rungs = ladder((Tello.RESOLUTION_480P, Tello.FPS_5))
+        self.rung = 0
+        self.current = None
+        self.frame_read = None
+        self.last_switch = 0.0
+        self.window_start = None
+        self.window_frames = 0
+        self.window_decode = 0.0
+
+
+    def need(self, name, width, height, fps):
+        """ Consumer name wants frames of at least width x height at fps.
+        Takes effect at the next apply() or update(). """
+        self.needs[name] = (width, height, fps)
+        self.plan()
+
+
+    def release(self, name):
+        """ Consumer name no longer reads the stream. """
+        self.needs.pop(name, None)
+        self.plan()
+
+
+    def plan(self):
+        """ Rebuild the ladder from the needs and start again at its top. """
+        width = max((need[0] for need in self.needs.values()), default=0)
+        height = max((need[1] for need in self.needs.values()), default=0)
+        fps = max((need[2] for need in self.needs.values()), default=0)
+        resolutions = sorted(RESOLUTIONS, key=lambda resolution: RESOLUTIONS[resolution][1])
+        resolution = next((resolution for resolution in resolutions
+                           if RESOLUTIONS[resolution][0] >= width and RESOLUTIONS[resolution][1] >= height),
+                          resolutions[-1])
+        rates = sorted(FRAME_RATES, key=FRAME_RATES.get)
+        rate = next((rate for rate in rates if FRAME_RATES[rate] >= fps), rates[-1])
+        self.rungs = ladder((resolution, rate))
+        self.rung = 0
+
+
+    def watch(self, frame_read):
+        """ Measure the decode load of a BackgroundFrameRead from now on. """
+        self.frame_read = frame_read
+        self.start_window(time.time())
+
+
+    def start_window(self, now):
+        self.window_start = now
+        if self.frame_read is not None:
+            self.window_frames = self.frame_read.frame_count
+            self.window_decode = self.frame_read.decode_seconds
+
+
+    def apply(self):
+        """ Send the settings of the current rung that differ from those
+        last sent. A setting the drone refuses is logged and skipped. """
+        wanted = self.rungs[self.rung]
+        if wanted == self.current:
+            return
+        setters = (self.drone.set_video_resolution, self.drone.set_video_fps, self.drone.set_video_bitrate)
+        sent = list(self.current) if self.current else [None, None, None]
+        for i, setter in enumerate(setters):
+            if sent[i] == wanted[i]:
+                continue
+            try:
+                setter(wanted[i])
+                sent[i] = wanted[i]
+            except Exception as error:
+                log.warning("Video setting %s not taken: %s", wanted[i], error)
+        self.current = tuple(sent)
+        self.last_switch = time.time()
+        width, height = RESOLUTIONS[wanted[0]]
+        log.info("Video stream %sx%s at %s fps, %s Mbps", width, height, FRAME_RATES[wanted[1]], wanted[2])
+
+
+    def update(self):
+        """
+        Step down the ladder if the last window was overloaded, up if it has
+        been quiet for long enough.
+        Returns
+            the load of the window as a share of one core, None mid-window
+        """
+        now = time.time()
+        if self.frame_read is None or now - self.window_start < WINDOW:
+            return None
+        elapsed = now - self.window_start
+        load = (self.frame_read.decode_seconds - self.window_decode) / elapsed
+        delivered = (self.frame_read.frame_count - self.window_frames) / elapsed
+        self.start_window(now)
+
+        expected = FRAME_RATES[self.rungs[self.rung][1]]
+        if (load > HIGH_LOAD or delivered < LATE_SHARE * expected) and self.rung < len(self.rungs) - 1:
+            log.info("Decoding %.0f%% of a core at %.1f fps, stepping the video down", load * 100, delivered)
+            self.rung += 1
+        elif load < LOW_LOAD and delivered >= LATE_SHARE * expected and self.rung > 0 \
+                and now - self.last_switch >= STEP_UP_HOLD:
+            log.info("Decoding %.0f%% of a core, stepping the video up", load * 100)
+            self.rung -= 1
+        else:
+            return load
+        self.apply()
+        # The first frames after a switch come from a decoder starting over
+        self.start_window(time.time())
+        return load
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+#High Flyers visual odometry from the downward camera
+
+import logging
+import math
+import time
+from threading import Event, Lock, Thread
+
+from maneuver_queue import body_to_world
+
+log = logging.getLogger('colt')
+
+################################################################################
+# Dead reckoning assumes every move flies exactly the commanded distance, so   #
+# the pose drifts and fly_home misses the pad. With the video switched to the  #
+# downward camera, every pair of frames is phase correlated: the shift of the  #
+# floor texture between them, scaled by the altitude, is how far the drone     #
+# moved. The shifts are added up while a move flies and, when it is acked,     #
+# blended with the commanded distance. Frames are shrunk to WORK_WIDTH pixels  #
+# first, so one frame costs well under a millisecond on a laptop CPU. A bare   #
+# floor gives weak correlation peaks; moves with too many of those keep the    #
+# dead-reckoned pose.                                                          #
+#                                                                              #
+# Image axes: the top of the downward image is the front of the drone, so      #
+# flying forward moves the floor down the image and flying left moves it to    #
+# the right.                                                                   #
+################################################################################
+
+DOWNWARD_FOV = 62.0     # degrees the downward camera sees across the image width
+WORK_WIDTH = 160        # pixels, frames are shrunk to this before correlating
+MIN_RESPONSE = 0.1      # weaker phase correlation peaks are not trusted
+MIN_GOOD_SHARE = 0.8    # share of trusted frames a move needs to be corrected
+TRANSLATIONS = ('forward', 'back', 'left', 'right', 'go')
+
+
+def cm_per_pixel(altitude, frame_width, fov=DOWNWARD_FOV):
+    """ Floor distance covered by one pixel at altitude cm. """
+    return 2 * altitude * math.tan(math.radians(fov) / 2) / frame_width
+
+
+class FrameTracker():
+    """ Shift between consecutive frames by phase correlation. """
+
+    def __init__(self, work_width=WORK_WIDTH):
+        import cv2
+        self.cv2 = cv2
+        self.work_width = work_width
+        self.previous = None
+        self.window = None
+        self.scale = 1.0
+
+    def prepare(self, frame):
+        cv2 = self.cv2
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        height, width = frame.shape
+        self.scale = width / self.work_width
+        size = (self.work_width, max(1, int(round(height / self.scale))))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if self.window is None or self.window.shape != small.shape:
+            self.window = cv2.createHanningWindow(size, cv2.CV_32F)
+        return small.astype('float32')
+
+    def track(self, frame):
+        """
+        Arguments
+            frame: BGR or grey image
+        Returns
+            (dx, dy, response): shift of the image content since the previous
+            frame in full frame pixels and the correlation peak (0-1), or
+            None for the first frame
+        """
+        current = self.prepare(frame)
+        previous, self.previous = self.previous, current
+        if previous is None or previous.shape != current.shape:
+            return None
+        (dx, dy), response = self.cv2.phaseCorrelate(previous, current, self.window)
+        return dx * self.scale, dy * self.scale, response
+
+    def reset(self):
+        self.previous = None
+
+
+class VisualOdometry():
+    """
+    Tracks the floor under the drone on a background thread and corrects
+    HighFlyers' pose after each move, see HighFlyers.start_visual_odometry.
+    """
+
+    def __init__(self, controller, frame_read, weight=0.5, fov=DOWNWARD_FOV, min_response=MIN_RESPONSE):
+        """
+        Arguments
+            controller:   HighFlyers object, for the heading and altitude
+            frame_read:   djitellopy BackgroundFrameRead of the downward camera
+            weight:       0-1, how much the camera counts against the
+                          commanded distance when both are available
+            fov:          degrees the camera sees across the image width
+            min_response: phase correlation peaks below this are not trusted
+        """
+        self.controller = controller
+        self.frame_read = frame_read
+        self.weight = weight
+        self.fov = fov
+        self.min_response = min_response
+        self.tracker = FrameTracker()
+        self.lock = Lock()
+        self.moved = [0.0, 0.0]
+        self.frames = 0
+        self.good_frames = 0
+        self.processed_at = 0.0
+        self.frame_seconds = 0.0
+        self.stopped = Event()
+        self.worker = Thread(target=self.run, daemon=True, name='visual-odometry')
+
+
+    def start(self):
+        self.worker.start()
+        return self
+
+
+    def stop(self):
+        self.stopped.set()
+        if self.worker.is_alive():
+            self.worker.join()
+
+
+    def altitude(self):
+        altitude = self.controller.altitude()
+        return altitude if altitude is not None else self.controller.drone.get_height()
+
+
+    def run(self):
+        last_count = None
+        while not self.stopped.is_set():
+            count = self.frame_read.frame_count
+            if count == last_count or self.frame_read.frame is None:
+                time.sleep(0.005)
+                continue
+            last_count = count
+            try:
+                self.process(self.frame_read.frame)
+            except Exception as excp:
+                log.error("Visual odometry frame failed: %s", excp)
+                self.tracker.reset()
+
+
+    def process(self, frame):
+        """ Track one frame and add its shift to the move so far. """
+        start = time.perf_counter()
+        shift = self.tracker.track(frame)
+        if shift is None:
+            return
+        dx, dy, response = shift
+        forward = left = 0.0
+        good = response >= self.min_response
+        if good:
+            scale = cm_per_pixel(self.altitude(), frame.shape[1], self.fov)
+            forward, left = dy * scale, dx * scale
+        x, y = body_to_world(forward, left, self.controller.curr_degrees)
+        with self.lock:
+            self.moved[0] += x
+            self.moved[1] += y
+            self.frames += 1
+            self.good_frames += good
+            self.processed_at = time.time()
+            self.frame_seconds += time.perf_counter() - start
+
+
+    def take(self, settle=0.3):
+        """
+        The movement tracked since the last take(), after waiting up to
+        settle seconds for the frames up to now to be processed.
+        Returns
+            (x, y, frames, good frames)
+        """
+        now = time.time()
+        deadline = now + settle
+        while self.processed_at < now and time.time() < deadline and self.worker.is_alive():
+            time.sleep(0.01)
+        with self.lock:
+            taken = (self.moved[0], self.moved[1], self.frames, self.good_frames)
+            self.moved = [0.0, 0.0]
+            self.frames = 0
+            self.good_frames = 0
+        return taken
+
+
+    def fuse(self, maneuver, before, after):
+        """
+        Blend the tracked movement into the dead-reckoned pose after a
+        maneuver. Rotations and climbs only clear what was tracked.
+        Arguments
+            maneuver: the maneuver just flown
+            before:   (x, y, degrees) before it
+            after:    (x, y, degrees) dead reckoning expects after it
+        Returns
+            (x, y, degrees)
+        """
+        x, y, frames, good = self.take(settle=0.3 if maneuver in TRANSLATIONS else 0)
+        if maneuver not in TRANSLATIONS:
+            return after
+        if not frames or good < MIN_GOOD_SHARE * frames:
+            log.debug("Visual odometry kept dead reckoning for %s: %s of %s frames usable",
+                      maneuver, good, frames)
+            return after
+        w = self.weight
+        fused = (before[0] + (1 - w) * (after[0] - before[0]) + w * x,
+                 before[1] + (1 - w) * (after[1] - before[1]) + w * y,
+                 after[2])
+        log.debug("Visual odometry moved %s from (%.0f, %.0f) to (%.0f, %.0f), commanded (%.0f, %.0f)",
+                  maneuver, before[0], before[1], fused[0], fused[1], after[0], after[1])
+        return fused
+
+
+def evaluate_clip(filename, altitude, fov=DOWNWARD_FOV, min_response=MIN_RESPONSE):
+    """
+    Run the tracker over a recorded downward clip flown at a constant
+    altitude with a constant heading.
+    Returns
+        dictionary with the frames, usable frames, mean response, tracked
+        forward and left cm and the processing rate in frames per second
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(filename)
+    if not capture.isOpened():
+        raise OSError(f"Cannot open {filename}")
+    tracker = FrameTracker()
+    forward = left = 0.0
+    frames = good = 0
+    responses = 0.0
+    seconds = 0.0
+    while True:
+        grabbed, frame = capture.read()
+        if not grabbed:
+            break
+        start = time.perf_counter()
+        shift = tracker.track(frame)
+        seconds += time.perf_counter() - start
+        if shift is None:
+            continue
+        dx, dy, response = shift
+        frames += 1
+        responses += response
+        if response >= min_response:
+            good += 1
+            scale = cm_per_pixel(altitude, frame.shape[1], fov)
+            forward += dy * scale
+            left += dx * scale
+    capture.release()
+    return {'frames': frames, 'good_frames': good, 'mean_response': responses / frames if frames else 0.0,
+            'forward': forward, 'left': left, 'fps': (frames + 1) / seconds if seconds else 0.0}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Evaluate visual odometry on recorded downward camera clips")
+    parser.add_argument('clips', nargs='+')
+    parser.add_argument('--altitude', type=float, required=True, help="cm above the floor the clips were flown at")
+    parser.add_argument('--fov', type=float, default=DOWNWARD_FOV)
+    parser.add_argument('--expect', type=float, nargs=2, metavar=('FORWARD', 'LEFT'),
+                        help="cm the drone really flew, to report the error")
+    args = parser.parse_args()
+
+    for clip in args.clips:
+        result = evaluate_clip(clip, args.altitude, args.fov)
+        line = (f"{clip}: {result['frames']} frames ({result['good_frames']} usable, mean response "
+                f"{result['mean_response']:.2f}), forward {result['forward']:.1f} cm, left "
+                f"{result['left']:.1f} cm, {result['fps']:.0f} frames/s")
+        if args.expect:
+            error = math.hypot(result['forward'] - args.expect[0], result['left'] - args.expect[1])
+            line += f", error {error:.1f} cm"
+        print(line)